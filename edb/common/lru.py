@@ -20,6 +20,8 @@
 from __future__ import annotations
 
 import collections.abc
+import heapq
+import itertools
 
 
 class LRUMapping(collections.abc.MutableMapping):
@@ -75,3 +77,152 @@ class LRUMapping(collections.abc.MutableMapping):
 
     def __iter__(self):
         return iter(self._dict)
+
+    def items(self):
+        # Unlike MutableMapping.items() this doesn't go through
+        # `__getitem__`, so iterating over the cache doesn't reorder it.
+        return self._dict.items()
+
+
+class _CostEntry:
+
+    __slots__ = ('priority', 'seq', 'hits', 'cost', 'size')
+
+    def __init__(self, *, cost, size):
+        self.priority = 0.0
+        self.seq = 0
+        self.hits = 1
+        self.cost = cost
+        self.size = size
+
+
+class CostAwareMapping(collections.abc.MutableMapping):
+
+    # A mapping bounded by the total size of its values rather than by
+    # the number of entries.  Entries are evicted according to the
+    # Greedy-Dual-Size-Frequency policy: every entry has a priority of
+    #
+    #     clock + hits * cost / size
+    #
+    # where *cost* is how expensive the value is to recreate, and the
+    # entry with the lowest priority is evicted first.  The clock is
+    # advanced to the priority of every evicted entry, so entries that
+    # were popular once, but aren't used anymore, eventually age out.
+    #
+    # Priorities are kept in a heap.  Instead of updating entries in
+    # place we push a new heap item on every hit and skip the outdated
+    # ones on eviction (their `seq` doesn't match the entry's); the heap
+    # is rebuilt when there are too many outdated items in it.
+
+    def __init__(self, *, maxsize, sizeof, on_evict=None):
+        if maxsize <= 0:
+            raise ValueError(
+                f'maxsize is expected to be greater than 0, got {maxsize}')
+
+        self._dict = {}
+        self._entries = {}
+        self._heap = []
+        self._seq = itertools.count()
+        self._clock = 0.0
+        self._size = 0
+        self._maxsize = maxsize
+        self._sizeof = sizeof
+        self._on_evict = on_evict
+
+    def get_size(self):
+        """Return the total size of the values in the mapping."""
+        return self._size
+
+    def set(self, key, o, *, cost=1.0):
+        """Add or replace an entry which takes *cost* to recreate."""
+        size = max(self._sizeof(o), 1)
+        if key in self._dict:
+            self._remove(key)
+
+        if size > self._maxsize:
+            # Would evict everything else and still not fit.
+            if self._on_evict is not None:
+                self._on_evict(key, o)
+            return
+
+        self._dict[key] = o
+        entry = self._entries[key] = _CostEntry(cost=cost, size=size)
+        self._size += size
+        self._push(key, entry)
+
+        while self._size > self._maxsize:
+            self._evict_one()
+
+    def __getitem__(self, key):
+        o = self._dict[key]
+        entry = self._entries[key]
+        entry.hits += 1
+        self._push(key, entry)
+        return o
+
+    def peek(self, key, default=None):
+        """Like get(), but doesn't count as a hit."""
+        return self._dict.get(key, default)
+
+    def __setitem__(self, key, o):
+        self.set(key, o)
+
+    def __delitem__(self, key):
+        if key not in self._dict:
+            raise KeyError(key)
+        self._remove(key)
+
+    def __contains__(self, key):
+        return key in self._dict
+
+    def __len__(self):
+        return len(self._dict)
+
+    def __iter__(self):
+        return iter(self._dict)
+
+    def items(self):
+        # Same as LRUMapping.items(): iterating doesn't count as hits.
+        return self._dict.items()
+
+    def items_by_priority(self):
+        """Return the items in the order they would be evicted in."""
+        order = sorted(
+            self._entries.items(), key=lambda i: (i[1].priority, i[1].seq))
+        return [(key, self._dict[key]) for key, _ in order]
+
+    def clear(self):
+        self._dict.clear()
+        self._entries.clear()
+        self._heap.clear()
+        self._size = 0
+
+    def _push(self, key, entry):
+        entry.priority = self._clock + entry.hits * entry.cost / entry.size
+        entry.seq = next(self._seq)
+        heapq.heappush(self._heap, (entry.priority, entry.seq, key))
+
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._heap = [
+                (e.priority, e.seq, k) for k, e in self._entries.items()
+            ]
+            heapq.heapify(self._heap)
+
+    def _remove(self, key):
+        del self._dict[key]
+        entry = self._entries.pop(key)
+        self._size -= entry.size
+        # The heap item of the entry is skipped in `_evict_one()`.
+
+    def _evict_one(self):
+        while True:
+            priority, seq, key = heapq.heappop(self._heap)
+            entry = self._entries.get(key)
+            if entry is not None and entry.seq == seq:
+                break
+
+        self._clock = priority
+        o = self._dict[key]
+        self._remove(key)
+        if self._on_evict is not None:
+            self._on_evict(key, o)
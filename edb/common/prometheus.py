@@ -190,6 +190,21 @@ class Registry:
         self._add_metric(hist)
         return hist
 
+    def new_labeled_histogram(
+        self,
+        name: str,
+        desc: str,
+        /,
+        *,
+        unit: Unit | None = None,
+        buckets: list[float] | None = None,
+        labels: tuple[str],
+    ) -> LabeledHistogram:
+        hist = LabeledHistogram(
+            self, name, desc, unit, buckets=buckets, labels=labels)
+        self._add_metric(hist)
+        return hist
+
     def generate(self):
         buffer: list[str] = []
         for metric in self._metrics:
@@ -508,15 +523,7 @@ class Histogram(BaseMetric):
         accum = 0.0
         for buck, val in zip(self._buckets, self._values):
             accum += val
-
-            if math.isinf(buck):
-                if buck > 0:
-                    buckf = '+Inf'
-                else:
-                    buckf = '-Inf'
-            else:
-                buckf = str(buck)
-
+            buckf = _format_bucket(buck)
             buffer.append(f'{self._name}_bucket{{le="{buckf}"}} {accum}')
 
         buffer.append(f'{self._name}_count {accum}')
@@ -527,6 +534,93 @@ class Histogram(BaseMetric):
         buffer.append(f'{self._name}_created {float(self._created)}')
 
 
+class LabeledHistogram(Histogram):
+
+    _labels: tuple[str, ...]
+    _metric_values: dict[tuple[str, ...], list[float]]
+    _metric_sum: dict[tuple[str, ...], float]
+    _metric_created: dict[tuple[str, ...], float]
+
+    def __init__(
+        self,
+        *args: typing.Any,
+        buckets: list[float] | None = None,
+        labels: tuple[str, ...],
+    ) -> None:
+        super().__init__(*args, buckets=buckets)
+        self._validate_label_names(labels)
+        self._labels = labels
+        self._metric_values = {}
+        self._metric_sum = {}
+        self._metric_created = {}
+
+    def observe(  # type: ignore[override]
+        self,
+        value: float,
+        *labels: str,
+    ) -> None:
+        self._validate_label_values(self._labels, labels)
+        try:
+            values = self._metric_values[labels]
+        except KeyError:
+            values = [0.0] * len(self._buckets)
+            self._metric_values[labels] = values
+            self._metric_sum[labels] = 0.0
+            self._metric_created[labels] = self._registry.now()
+
+        idx = bisect.bisect_left(self._buckets, value)
+        values[idx] += 1.0
+        self._metric_sum[labels] += value
+
+    def _generate(self, buffer: list[str]) -> None:
+        desc = _format_desc(self._desc)
+
+        buffer.append(f'# HELP {self._name} {desc}')
+        buffer.append(f'# TYPE {self._name} histogram')
+
+        for labels, values in self._metric_values.items():
+            fmt_label = ','.join(
+                f'{label}="{_format_label_val(label_val)}"'
+                for label, label_val in zip(self._labels, labels)
+            )
+
+            accum = 0.0
+            for buck, val in zip(self._buckets, values):
+                accum += val
+                buckf = _format_bucket(buck)
+                buffer.append(
+                    f'{self._name}_bucket{{{fmt_label},le="{buckf}"}} {accum}'
+                )
+
+            buffer.append(f'{self._name}_count{{{fmt_label}}} {accum}')
+            buffer.append(
+                f'{self._name}_sum{{{fmt_label}}} {self._metric_sum[labels]}'
+            )
+
+        if self._metric_values:
+            buffer.append(f'# HELP {self._name}_created {desc}')
+            buffer.append(f'# TYPE {self._name}_created gauge')
+
+            for labels, value in self._metric_created.items():
+                fmt_label = ','.join(
+                    f'{label}="{_format_label_val(label_val)}"'
+                    for label, label_val in zip(self._labels, labels)
+                )
+                buffer.append(
+                    f'{self._name}_created{{{fmt_label}}} {float(value)}'
+                )
+
+
+def _format_bucket(buck: float) -> str:
+    if math.isinf(buck):
+        if buck > 0:
+            return '+Inf'
+        else:
+            return '-Inf'
+    else:
+        return str(buck)
+
+
 @functools.lru_cache(maxsize=1024)
 def _format_desc(desc: str) -> str:
     return desc.replace('\\', r'\\').replace('\n', r'\n')
@@ -45,6 +45,8 @@ class CompiledOperation:
     cacheable: bool
     cache_deps_vars: Optional[FrozenSet[str]]
     variables: Dict
+    has_dml: bool
+    is_volatile: bool
 
 
 @functools.lru_cache()
@@ -128,4 +130,6 @@ def compile_graphql(
         cacheable=op.cacheable,
         cache_deps_vars=op.cache_deps_vars,
         variables=op.variables_desc,
+        has_dml=bool(ir.dml_exprs),
+        is_volatile=ir.volatility.is_volatile(),
     )
@@ -18,6 +18,7 @@
 
 
 import cython
+import hashlib
 import http
 import json
 import logging
@@ -29,6 +30,7 @@ from graphql.language import lexer as gql_lexer
 from edb import _graphql_rewrite
 from edb import errors
 from edb.graphql import errors as gql_errors
+from edb.server import metrics
 from edb.server.pgcon import errors as pgerrors
 
 from edb.common import debug
@@ -56,6 +58,26 @@ cdef class CacheRedirect:
 CacheEntry = Union[CacheRedirect, compiler.CompiledOperation]
 
 
+@cython.final
+cdef class PersistedQuery:
+    cdef readonly str query
+    # operation name -> the result of _rewrite(), so that the query
+    # is not tokenized again when it is run by its hash.
+    cdef dict rewrites
+
+    def __init__(self, query: str):
+        self.query = query
+        self.rewrites = {}
+
+
+_PERSISTED_QUERY_NOT_FOUND = json.dumps({
+    'errors': [{
+        'message': 'PersistedQueryNotFound',
+        'extensions': {'code': 'PERSISTED_QUERY_NOT_FOUND'},
+    }],
+}).encode()
+
+
 async def handle_request(
     object request,
     object response,
@@ -77,6 +99,8 @@ async def handle_request(
     operation_name = None
     variables = None
     query = None
+    extensions = None
+    persisted = None
 
     try:
         if request.method == b'POST':
@@ -88,6 +112,7 @@ async def handle_request(
                 query = body.get('query')
                 operation_name = body.get('operationName')
                 variables = body.get('variables')
+                extensions = body.get('extensions')
             elif request.content_type == 'application/graphql':
                 query = request.body.decode('utf-8')
             else:
@@ -115,9 +140,32 @@ async def handle_request(
                         raise TypeError(
                             '"variables" must be a JSON object')
 
+                extensions = qs.get('extensions')
+                if extensions is not None:
+                    try:
+                        extensions = json.loads(extensions[0])
+                    except Exception:
+                        raise TypeError(
+                            '"extensions" must be a JSON object')
+
         else:
             raise TypeError('expected a GET or a POST request')
 
+        if extensions is not None:
+            if not isinstance(extensions, dict):
+                raise TypeError('"extensions" must be a JSON object')
+            query_hash = _get_persisted_query_hash(extensions)
+            if query_hash is not None:
+                persisted = _get_persisted_query(server, query_hash, query)
+                if persisted is None:
+                    # The client is expected to retry with the full text
+                    # of the query to register it.
+                    response.status = http.HTTPStatus.OK
+                    response.content_type = b'application/json'
+                    response.body = _PERSISTED_QUERY_NOT_FOUND
+                    return
+                query = persisted.query
+
         if not query:
             raise TypeError('invalid GraphQL request: query is missing')
 
@@ -140,7 +188,9 @@ async def handle_request(
     response.status = http.HTTPStatus.OK
     response.content_type = b'application/json'
     try:
-        result = await execute(db, server, query, operation_name, variables)
+        result = await execute(
+            db, server, query, operation_name, variables,
+            persisted=persisted)
     except Exception as ex:
         if debug.flags.server:
             markup.dump(ex)
@@ -165,6 +215,43 @@ async def handle_request(
         response.body = b'{"data":' + result + b'}'
 
 
+def _get_persisted_query_hash(extensions: Dict[str, Any]) -> Optional[str]:
+    # Apollo "automatic persisted queries":
+    #   {"persistedQuery": {"version": 1, "sha256Hash": "<hex digest>"}}
+    pq = extensions.get('persistedQuery')
+    if pq is None:
+        return None
+    if not isinstance(pq, dict):
+        raise TypeError('"persistedQuery" must be a JSON object')
+    if pq.get('version') != 1:
+        raise TypeError('unsupported persisted query version')
+    query_hash = pq.get('sha256Hash')
+    if not isinstance(query_hash, str):
+        raise TypeError('"sha256Hash" must be a string')
+    return query_hash.lower()
+
+
+def _get_persisted_query(
+    server,
+    query_hash: str,
+    query: Optional[str],
+) -> Optional[PersistedQuery]:
+    persisted_queries = server._graphql_persisted_queries
+
+    persisted = persisted_queries.get(query_hash)
+    if persisted is not None or not query:
+        return persisted
+
+    if not isinstance(query, str):
+        raise TypeError('"query" must be a string')
+    if hashlib.sha256(query.encode('utf-8')).hexdigest() != query_hash:
+        raise TypeError('provided sha256Hash does not match query')
+
+    persisted = PersistedQuery(query)
+    persisted_queries[query_hash] = persisted
+    return persisted
+
+
 async def compile(
     db,
     server,
@@ -190,7 +277,35 @@ async def compile(
     )
 
 
-async def execute(db, server, query, operation_name, variables):
+def _rewrite(operation_name, query):
+    try:
+        rewritten = _graphql_rewrite.rewrite(operation_name, query)
+    except _graphql_rewrite.QueryError as e:
+        raise errors.QueryError(e.args[0])
+    except Exception as e:
+        if isinstance(e, _USER_ERRORS):
+            logger.info("Error rewriting graphql query: %r", e)
+        else:
+            logger.warning("Error rewriting graphql query: %r", e)
+        return None, query, {}, []
+    else:
+        return (
+            rewritten,
+            rewritten.key(),
+            rewritten.variables(),
+            rewritten.key_vars(),
+        )
+
+
+async def execute(
+    db,
+    server,
+    query,
+    operation_name,
+    variables,
+    *,
+    persisted: Optional[PersistedQuery] = None,
+):
     dbver = db.dbver
     query_cache = server._http_query_cache
 
@@ -205,36 +320,36 @@ async def execute(db, server, query, operation_name, variables):
         print(query)
         print(f'variables: {variables}')
 
-    try:
-        rewritten = _graphql_rewrite.rewrite(operation_name, query)
+    if persisted is not None:
+        rewrite = persisted.rewrites.get(operation_name)
+        if rewrite is None:
+            rewrite = _rewrite(operation_name, query)
+            if rewrite[0] is not None:
+                persisted.rewrites[operation_name] = rewrite
+    else:
+        rewrite = _rewrite(operation_name, query)
+
+    rewritten, prepared_query, vars, key_var_names = rewrite
+    vars = vars.copy()
+    if variables:
+        vars.update(variables)
 
-        vars = rewritten.variables().copy()
-        if variables:
-            vars.update(variables)
-        key_var_names = rewritten.key_vars()
+    try:
         # on bad queries the following line can trigger KeyError
         key_vars = tuple(vars[k] for k in key_var_names)
-    except _graphql_rewrite.QueryError as e:
-        raise errors.QueryError(e.args[0])
-    except Exception as e:
-        if isinstance(e, _USER_ERRORS):
-            logger.info("Error rewriting graphql query: %r", e)
-        else:
-            logger.warning("Error rewriting graphql query: %r", e)
+    except KeyError as e:
+        logger.warning("Error rewriting graphql query: %r", e)
         rewritten = None
-        rewrite_error = e
         prepared_query = query
         vars = variables.copy() if variables else {}
         key_var_names = []
         key_vars = ()
-    else:
-        prepared_query = rewritten.key()
 
-        if debug.flags.graphql_compile:
-            debug.header('GraphQL optimized query')
-            print(rewritten.key())
-            print(f'key_vars: {key_var_names}')
-            print(f'variables: {vars}')
+    if rewritten is not None and debug.flags.graphql_compile:
+        debug.header('GraphQL optimized query')
+        print(prepared_query)
+        print(f'key_vars: {key_var_names}')
+        print(f'variables: {vars}')
 
     cache_key = ('graphql', prepared_query, key_vars, operation_name, dbver)
     use_prep_stmt = False
@@ -299,6 +414,22 @@ async def execute(db, server, query, operation_name, variables):
             else:
                 args.append(vars[name])
 
+    result_cache = server.get_http_result_cache()
+    if (
+        result_cache is not None
+        and not op.has_dml
+        and not op.is_volatile
+    ):
+        result_key = ('graphql', op.sql_hash, dbver, json.dumps(args))
+        data = result_cache.get(db.name, result_key)
+        if data is not None:
+            metrics.http_result_cache_hits.inc()
+            return data
+        metrics.http_result_cache_misses.inc()
+        generation = result_cache.get_generation(db.name)
+    else:
+        result_cache = None
+
     pgcon = await server.acquire_pgcon(db.name)
     try:
         data = await pgcon.parse_execute_json(
@@ -306,9 +437,14 @@ async def execute(db, server, query, operation_name, variables):
             use_prep_stmt, args)
     finally:
         server.release_pgcon(db.name, pgcon)
+        if op.has_dml:
+            server._on_local_data_change(db.name)
 
     if data is None:
         raise errors.InternalServerError(
             f'no data received for a JSON query {op.sql!r}')
 
+    if result_cache is not None:
+        result_cache.set(db.name, result_key, data, generation=generation)
+
     return data
@@ -686,6 +686,13 @@ class PathId:
         """The namespace of this ``PathId``"""
         return self._namespace
 
+    def get_namespaceless_key(self) -> Hashable:
+        """Return a key that is equal for path ids only differing in
+           namespaces, i.e. one that is preserved by
+           :meth:`strip_namespace`.
+        """
+        return (self._norm_path, self._is_ptr)
+
     def _get_prefix(self, size: int) -> PathId:
         if size < 0:
             size = len(self._path) + size
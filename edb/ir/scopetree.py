@@ -105,6 +105,12 @@ class ScopeTreeNode:
         self.namespaces = set()
         self.is_group = False
         self._parent: Optional[weakref.ReferenceType[ScopeTreeNode]] = None
+        # Path children of this node indexed by
+        # PathId.get_namespaceless_key(), so that children
+        # matching a path can be found without scanning all of them.
+        # Maintained by _set_parent().
+        self._path_children_index: Dict[
+            Hashable, List[ScopeTreeNodeWithPathId]] = {}
 
     def __repr__(self) -> str:
         name = 'ScopeFenceNode' if self.fenced else 'ScopeTreeNode'
@@ -357,7 +363,7 @@ class ScopeTreeNode:
         performed.  For safe tree modification, use attach_subtree()""
         """
         if node.path_id is not None:
-            for child in self.children:
+            for child in self._find_path_children(node.path_id):
                 if child.path_id == node.path_id:
                     raise errors.InvalidReferenceError(
                         f'{node.path_id} is already present in {self!r}',
@@ -727,19 +733,10 @@ class ScopeTreeNode:
         namespaces: Set[pathid.Namespace] = set()
         finfo = None
         found = None
+        key = path_id.get_namespaceless_key()
 
         for node, ans in self.ancestors_and_namespaces:
-            if (node.path_id is not None
-                    and _paths_equal(node.path_id, path_id, namespaces)):
-                found = node
-                break
-
-            for child in node.children:
-                if (child.path_id is not None
-                        and _paths_equal(child.path_id, path_id, namespaces)):
-                    found = child
-                    break
-
+            found = node._find_visible_here(path_id, key, namespaces)
             if found is not None:
                 break
 
@@ -747,14 +744,16 @@ class ScopeTreeNode:
 
             if node is not self:
                 ans_finfo = node.fence_info
-                parent_fence = node.parent_fence
-                if (parent_fence is not None
-                        and any(_paths_equal(path_id, wl, namespaces)
-                                for wl in parent_fence.factoring_allowlist)):
-                    ans_finfo = FenceInfo(
-                        unnest_fence=ans_finfo.unnest_fence,
-                        factoring_fence=False,
-                    )
+                if ans_finfo.factoring_fence:
+                    parent_fence = node.parent_fence
+                    if (parent_fence is not None
+                            and any(_paths_equal(path_id, wl, namespaces)
+                                    for wl in
+                                    parent_fence.factoring_allowlist)):
+                        ans_finfo = FenceInfo(
+                            unnest_fence=ans_finfo.unnest_fence,
+                            factoring_fence=False,
+                        )
 
                 if finfo is None:
                     finfo = ans_finfo
@@ -776,12 +775,57 @@ class ScopeTreeNode:
         return self.find_visible(path_id, allow_group=allow_group) is not None
 
     def is_any_prefix_visible(self, path_id: pathid.PathId) -> bool:
-        for prefix in reversed(list(path_id.iter_prefixes())):
-            if self.find_visible(prefix) is not None:
-                return True
+        # Same as calling is_visible() for every prefix, but in a single
+        # walk up the tree.  A prefix is resolved by the closest node
+        # matching it, and it is not visible if that node is a group.
+        pending = [
+            (prefix, prefix.get_namespaceless_key())
+            for prefix in reversed(list(path_id.iter_prefixes()))
+        ]
+        namespaces: Set[pathid.Namespace] = set()
+
+        for node, ans in self.ancestors_and_namespaces:
+            unresolved = []
+            for prefix, key in pending:
+                found = node._find_visible_here(prefix, key, namespaces)
+                if found is None:
+                    unresolved.append((prefix, key))
+                elif not found.is_group:
+                    return True
+
+            if not unresolved:
+                break
+
+            pending = unresolved
+            namespaces |= ans
 
         return False
 
+    def _find_visible_here(
+        self,
+        path_id: pathid.PathId,
+        key: Hashable,
+        namespaces: AbstractSet[pathid.Namespace],
+    ) -> Optional[ScopeTreeNode]:
+        """Find *path_id* in this node or in its children."""
+        if (self.path_id is not None
+                and _paths_equal(self.path_id, path_id, namespaces)):
+            return self
+
+        for child in self._path_children_index.get(key, ()):
+            if _paths_equal(child.path_id, path_id, namespaces):
+                return child
+
+        return None
+
+    def _find_path_children(
+        self,
+        path_id: pathid.PathId,
+    ) -> Sequence[ScopeTreeNodeWithPathId]:
+        """Children whose path ids may match *path_id* in any namespace."""
+        return self._path_children_index.get(
+            path_id.get_namespaceless_key(), ())
+
     def find_child(
         self,
         path_id: pathid.PathId,
@@ -983,13 +1027,26 @@ class ScopeTreeNode:
         if parent is current_parent:
             return
 
+        key = None
+        if has_path_id(self):
+            key = self.path_id.get_namespaceless_key()
+
         if current_parent is not None:
             # Make sure no other node refers to us.
             current_parent.children.remove(self)
+            if key is not None:
+                index = current_parent._path_children_index
+                siblings = index[key]
+                siblings.remove(cast(ScopeTreeNodeWithPathId, self))
+                if not siblings:
+                    del index[key]
 
         if parent is not None:
             self._parent = weakref.ref(parent)
             parent.children.append(self)
+            if key is not None:
+                siblings = parent._path_children_index.setdefault(key, [])
+                siblings.append(cast(ScopeTreeNodeWithPathId, self))
         else:
             self._parent = None
 
@@ -29,3 +29,19 @@ MAX_NAME_LENGTH = 63 - MAX_TENANT_ID_LENGTH - 1 - 1
 
 # Maximum number of arguments supported by SQL functions.
 MAX_FUNC_ARG_COUNT = 100
+
+# The maximum number of parsed expression texts kept in every process,
+# see edb.schema.expr.
+EXPR_QLAST_CACHE_SIZE = 10000
+
+# The minimum number of candidate pairs of changed objects of one class
+# for which the schema delta first bounds the similarity of every pair
+# and only compares the pairs that can affect the result, see
+# edb.schema.delta.delta_objects.
+DELTA_PRUNE_MIN_PAIRS = 64
+
+# The number of most recent mutations for which a FlatSchema records
+# the id of the changed object, so that the difference from a recent
+# ancestor schema is found without comparing every object, see
+# edb.schema.schema.FlatSchema.get_diff.
+SCHEMA_MUTATION_LOG_SIZE = 1024
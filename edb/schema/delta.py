@@ -22,7 +22,9 @@ from typing import *
 import collections
 import collections.abc
 import contextlib
+import enum
 import functools
+import heapq
 import itertools
 import uuid
 
@@ -42,6 +44,7 @@ from edb.edgeql import ast as qlast
 from edb.edgeql import compiler as qlcompiler
 from edb.edgeql import qltypes
 
+from . import defines as s_def
 from . import expr as s_expr
 from . import name as sn
 from . import objects as so
@@ -49,6 +52,11 @@ from . import schema as s_schema
 from . import utils
 
 
+# Pairs of objects that are less similar than this are never
+# considered to be an alter of one another.
+_ALTER_THRESHOLD = 0.6
+
+
 def delta_objects(
     old: Iterable[so.Object_T],
     new: Iterable[so.Object_T],
@@ -58,6 +66,7 @@ def delta_objects(
     context: so.ComparisonContext,
     old_schema: s_schema.Schema,
     new_schema: s_schema.Schema,
+    prune: bool = True,
 ) -> DeltaRoot:
 
     delta = DeltaRoot()
@@ -80,11 +89,6 @@ def delta_objects(
     newnames = {o.get_name(new_schema) for o in new}
     common_names = oldnames & newnames
 
-    pairs = sorted(
-        itertools.product(new, old),
-        key=lambda pair: pair[0].get_name(new_schema) not in common_names,
-    )
-
     full_matrix: List[Tuple[so.Object_T, so.Object_T, float]] = []
 
     # If there are any renames that are already decided on, honor those first
@@ -126,23 +130,54 @@ def delta_objects(
         def can_delete(obj: so.Object_T, name: sn.Name) -> bool:
             return True
 
-    for x, y in pairs:
-        x_name = x.get_name(new_schema)
-        y_name = y.get_name(old_schema)
+    # With no renames or guidance to honor, only the pairs that can
+    # become an alter or that carry the best similarity of one of their
+    # objects affect the result, so skip comparing the rest.
+    pruned = (
+        prune
+        and not renames_x
+        and (
+            context.guidance is None
+            or not (
+                context.guidance.banned_creations
+                or context.guidance.banned_deletions
+                or context.guidance.banned_alters
+            )
+        )
+        and len(new) * len(old) >= s_def.DELTA_PRUNE_MIN_PAIRS
+    )
 
-        similarity = y.compare(
-            x,
-            our_schema=old_schema,
-            their_schema=new_schema,
+    if pruned:
+        full_matrix.extend(_compare_candidates(
+            new,
+            old,
             context=context,
+            old_schema=old_schema,
+            new_schema=new_schema,
+        ))
+    else:
+        pairs = sorted(
+            itertools.product(new, old),
+            key=lambda pair: pair[0].get_name(new_schema) not in common_names,
         )
-        # If similarity for an alter is 1.0, that means there is no
-        # actual change. We keep that, since otherwise we will generate
-        # extra drop/create pairs when we are already done.
-        if similarity < 1.0 and not can_alter(y, y_name, x_name):
-            similarity = 0.0
 
-        full_matrix.append((x, y, similarity))
+        for x, y in pairs:
+            x_name = x.get_name(new_schema)
+            y_name = y.get_name(old_schema)
+
+            similarity = y.compare(
+                x,
+                our_schema=old_schema,
+                their_schema=new_schema,
+                context=context,
+            )
+            # If similarity for an alter is 1.0, that means there is no
+            # actual change. We keep that, since otherwise we will
+            # generate extra drop/create pairs when we are already done.
+            if similarity < 1.0 and not can_alter(y, y_name, x_name):
+                similarity = 0.0
+
+            full_matrix.append((x, y, similarity))
 
     full_matrix.sort(
         key=lambda v: (
@@ -177,13 +212,45 @@ def delta_objects(
             full_matrix_y[y] = (similarity, x)
 
         if (
-            can_alter(y, y.get_name(old_schema), x.get_name(new_schema))
+            not pruned
+            and can_alter(y, y.get_name(old_schema), x.get_name(new_schema))
             and full_matrix_x[x][0] != 1.0
             and full_matrix_y[y][0] != 1.0
         ):
             x_alter_variants[x] += 1
             y_alter_variants[y] += 1
 
+    if pruned:
+        # Every pair can be altered here, so count the alter variants
+        # of all pairs, including the ones that were not compared.
+        uncertain_x = [
+            x for x, (sim, _) in full_matrix_x.items() if sim != 1.0]
+        uncertain_y = [
+            y for y, (sim, _) in full_matrix_y.items() if sim != 1.0]
+        for x in uncertain_x:
+            x_alter_variants[x] = len(uncertain_y)
+        for y in uncertain_y:
+            y_alter_variants[y] = len(uncertain_x)
+
+        if (
+            issubclass(sclass, so.InheritingObject)
+            and not _is_inheritance_order_stable(
+                new_schema, new, comparison_map)
+        ):
+            # The pairs matched below the alter threshold are only used
+            # to order the alters, and here they might order them
+            # differently than the pairs matched among all pairs would.
+            return delta_objects(
+                oldkeys,
+                newkeys,
+                sclass,
+                parent_confidence=parent_confidence,
+                context=context,
+                old_schema=old_schema,
+                new_schema=new_schema,
+                prune=False,
+            )
+
     alters = []
     alter_pairs = []
 
@@ -209,7 +276,10 @@ def delta_objects(
 
             already_has = x_name == y_name and x_name not in renames_x
             if (
-                (0.6 < confidence < 1.0 and can_alter(y, y_name, x_name))
+                (
+                    _ALTER_THRESHOLD < confidence < 1.0
+                    and can_alter(y, y_name, x_name)
+                )
                 or (
                     (not can_create(x, x_name) or not can_delete(y, y_name))
                     and can_alter(y, y_name, x_name)
@@ -286,6 +356,418 @@ def delta_objects(
     return delta
 
 
+def _is_inheritance_order_stable(
+    schema: s_schema.Schema,
+    objs: Iterable[so.Object_T],
+    comparison_map: Mapping[so.Object_T, Tuple[float, so.Object_T]],
+) -> bool:
+    """Check that unmatched *objs* cannot reorder the matched ones.
+
+    The alters are generated in the inheritance order of all objects in
+    *comparison_map*, and an object that is not matched into an alter
+    only affects the relative order of the alters if it is a child of
+    one of them.
+    """
+    matched = {
+        x for x, (confidence, _) in comparison_map.items()
+        if confidence > _ALTER_THRESHOLD
+    }
+    for x in objs:
+        assert isinstance(x, so.InheritingObject)
+        if x not in matched and any(
+            base in matched for base in x.get_bases(schema).objects(schema)
+        ):
+            return False
+    return True
+
+
+def _compare_candidates(
+    new: Collection[so.Object_T],
+    old: Collection[so.Object_T],
+    *,
+    context: so.ComparisonContext,
+    old_schema: s_schema.Schema,
+    new_schema: s_schema.Schema,
+) -> List[Tuple[so.Object_T, so.Object_T, float]]:
+    """Compare the pairs of *new* and *old* objects that may matter.
+
+    The similarity of every pair is first bounded from above using only
+    the names of the objects, the names of the objects they refer to,
+    their plain field values and the keys of their ref dicts.  The
+    objects are grouped by all of these but their names, so the bound
+    is found once for every pair of groups, and once more for every
+    pair of objects with the same name.  The pairs are then compared in
+    the order of decreasing bound, and a pair is skipped if its bound is
+    at most the alter threshold and does not exceed the best similarity
+    found for either of its objects so far.  The returned pairs include
+    every pair that can be matched into an alter and the best similarity
+    of every object.
+    """
+    xs = list(new)
+    ys = list(old)
+    x_bounds = [
+        _get_similarity_bounds(x, new_schema, context, is_old=False)
+        for x in xs
+    ]
+    y_bounds = [
+        _get_similarity_bounds(y, old_schema, context, is_old=True)
+        for y in ys
+    ]
+
+    y_by_name: Dict[sn.Name, List[int]] = collections.defaultdict(list)
+    for j, y_b in enumerate(y_bounds):
+        if y_b is not None:
+            y_by_name[y_b[1]].append(j)
+    same_names = [
+        (i, j)
+        for i, x_b in enumerate(x_bounds) if x_b is not None
+        for j in y_by_name.get(x_b[1], ())
+    ]
+
+    # The candidates are (-bound, seq, x indexes, y indexes, is_group),
+    # the pairs of objects with the same name are only compared as
+    # their own candidates.
+    field_coefs: Dict[Tuple[Hashable, ...], float] = {}
+    candidates = []
+    seq = itertools.count()
+    for x_idxs in _group_by_bounds(x_bounds):
+        x_b = x_bounds[x_idxs[0]]
+        for y_idxs in _group_by_bounds(y_bounds):
+            y_b = y_bounds[y_idxs[0]]
+            _, bound = _bound_similarity(y_b, x_b, field_coefs)
+            candidates.append((
+                -bound * (1 + _BOUND_SLACK), next(seq), x_idxs, y_idxs, True))
+    for i, j in same_names:
+        bound, _ = _bound_similarity(y_bounds[j], x_bounds[i], field_coefs)
+        candidates.append((
+            -bound * (1 + _BOUND_SLACK), next(seq), [i], [j], False))
+    heapq.heapify(candidates)
+    same_name_pairs = set(same_names)
+
+    best_x = [-1.0] * len(xs)
+    best_y = [-1.0] * len(ys)
+    # At most the lowest best similarity of all objects.
+    min_best = -1.0
+    bests_changed = False
+    result = []
+    while candidates:
+        neg_bound, _, x_idxs, y_idxs, is_group = heapq.heappop(candidates)
+        bound = -neg_bound
+
+        pairs: Iterable[Tuple[int, int]]
+        if bound > _ALTER_THRESHOLD:
+            pairs = itertools.product(x_idxs, y_idxs)
+        else:
+            if bests_changed:
+                min_best = min(min(best_x), min(best_y))
+                bests_changed = False
+            if bound <= min_best:
+                # None of the remaining pairs can be matched into an
+                # alter or improve the best similarity of its objects.
+                break
+
+            # Only go through the pairs with an object whose best
+            # similarity is still below the bound.
+            open_y = [j for j in y_idxs if best_y[j] < bound]
+            pairs = (
+                (i, j)
+                for i in x_idxs
+                for j in (y_idxs if best_x[i] < bound else open_y)
+            )
+
+        for i, j in pairs:
+            if (
+                bound <= _ALTER_THRESHOLD
+                and bound <= best_x[i]
+                and bound <= best_y[j]
+            ):
+                continue
+            if is_group and (i, j) in same_name_pairs:
+                continue
+
+            x = xs[i]
+            y = ys[j]
+            similarity = y.compare(
+                x,
+                our_schema=old_schema,
+                their_schema=new_schema,
+                context=context,
+            )
+            result.append((x, y, similarity))
+            if similarity > best_x[i]:
+                best_x[i] = similarity
+                bests_changed = True
+            if similarity > best_y[j]:
+                best_y[j] = similarity
+                bests_changed = True
+
+    return result
+
+
+def _group_by_bounds(
+    bounds: Sequence[Optional[_SimilarityBounds]],
+) -> Iterable[List[int]]:
+    """Group the indexes of *bounds* that only differ in the name."""
+    groups: Dict[Hashable, List[int]] = {}
+    for i, b in enumerate(bounds):
+        key = None if b is None else (b[0], b[2], b[3])
+        groups.setdefault(key, []).append(i)
+    return groups.values()
+
+
+def _bound_similarity(
+    ours: Optional[_SimilarityBounds],
+    theirs: Optional[_SimilarityBounds],
+    field_coefs: Dict[Tuple[Hashable, ...], float],
+) -> Tuple[float, float]:
+    """Bound the similarity of a pair of objects from above.
+
+    Return the bound for objects with the same name and the one for
+    objects with different names.
+    """
+    if ours is None or theirs is None or ours[0] is not theirs[0]:
+        return 1.0, 1.0
+
+    cls, _, our_values, our_keys = ours
+    _, _, their_values, their_keys = theirs
+    fields = _get_bounded_fields(cls)
+    assert fields is not None
+    name_coef, value_fields, index_fields = fields
+
+    # The field values of many objects are the same, so cache their
+    # coefficients.
+    values_key = (cls, our_values, their_values)
+    coef = field_coefs.get(values_key)
+    if coef is None:
+        coef = _bound_field_values(value_fields, our_values, their_values)
+        field_coefs[values_key] = coef
+    bound = coef
+
+    for field, our_k, their_k in zip(index_fields, our_keys, their_keys):
+        bound *= _bound_index_keys(field, our_k, their_k)
+
+    if name_coef is None:
+        return bound, bound
+    return bound, name_coef * bound
+
+
+# The relative error allowed for the similarity bounds, which add up and
+# multiply the field coefficients in a different order than
+# Object.compare does.
+_BOUND_SLACK = 1e-9
+
+# Field value tokens that do not bound the field coefficient.
+_UNBOUNDED = object()
+
+
+class _FieldKind(enum.Enum):
+    #: Values compared for equality.
+    VALUE = enum.auto()
+    #: Objects compared by name by Object.compare_values().
+    OBJECT = enum.auto()
+    #: Collections compared by names by ObjectCollection.compare_values().
+    COLLECTION = enum.auto()
+    #: Ref dicts compared by ObjectIndexBase.compare_values().
+    INDEX = enum.auto()
+
+
+_SimilarityBounds = Tuple[
+    Type[so.Object],
+    sn.Name,
+    Tuple[Hashable, ...],
+    Tuple[Hashable, ...],
+]
+
+
+def _func(method: Any) -> Any:
+    return getattr(method, '__func__', method)
+
+
+@functools.lru_cache()
+def _get_bounded_fields(
+    cls: Type[so.Object],
+) -> Optional[Tuple[
+    Optional[float],
+    Tuple[Tuple[so.Field[Any], _FieldKind], ...],
+    Tuple[so.Field[Any], ...],
+]]:
+    """Return the fields of *cls* that bound the similarity of objects.
+
+    Object.compare() multiplies the coefficients of all fields, and the
+    overrides of it only ever lower the result further.  Return None if
+    *cls* compares field values in its own way.
+    """
+    if (
+        _func(cls.compare_field_value)
+        is not _func(so.Object.compare_field_value)
+    ):
+        return None
+
+    name_coef = None
+    value_fields = []
+    index_fields = []
+    for field in cls.get_fields(sorted=True).values():
+        if field.compcoef is None:
+            continue
+
+        comparator = _func(getattr(field.type, 'compare_values', None))
+        if comparator is None:
+            kind = _FieldKind.VALUE
+        elif comparator is _func(so.Object.compare_values):
+            kind = _FieldKind.OBJECT
+        elif comparator is _func(so.ObjectCollection.compare_values):
+            kind = _FieldKind.COLLECTION
+        elif comparator is _func(so.ObjectIndexBase.compare_values):
+            kind = _FieldKind.INDEX
+        else:
+            continue
+
+        if field.name == 'name':
+            if kind is _FieldKind.VALUE:
+                name_coef = field.compcoef
+        elif kind is _FieldKind.INDEX:
+            index_fields.append(field)
+        else:
+            value_fields.append((field, kind))
+
+    return name_coef, tuple(value_fields), tuple(index_fields)
+
+
+def _get_similarity_bounds(
+    obj: so.Object,
+    schema: s_schema.Schema,
+    context: so.ComparisonContext,
+    *,
+    is_old: bool,
+) -> Optional[_SimilarityBounds]:
+    """Return what bounds the similarity of *obj* to other objects.
+
+    That is the class of *obj*, its name, the tokens of its field values
+    that compare equal exactly when Object.compare() finds the values
+    equal, and the keys of its ref dicts.  Names of the objects in the
+    *is_old* schema are mapped through the renames in *context*.
+    """
+    cls = type(obj)
+    fields = _get_bounded_fields(cls)
+    if fields is None:
+        return None
+
+    _, value_fields, index_fields = fields
+
+    values = []
+    for field, kind in value_fields:
+        value = obj.get_field_value(schema, field.name)
+        values.append(
+            _get_field_token(kind, value, schema, context, is_old=is_old))
+
+    keys: List[Hashable] = []
+    for field in index_fields:
+        value = obj.get_field_value(schema, field.name)
+        if value is None:
+            keys.append(frozenset())
+        elif (
+            _func(getattr(type(value), 'compare_values', None))
+            is _func(so.ObjectIndexBase.compare_values)
+        ):
+            keys.append(frozenset(value.keys(schema)))
+        else:
+            keys.append(_UNBOUNDED)
+
+    return cls, obj.get_name(schema), tuple(values), tuple(keys)
+
+
+def _get_field_token(
+    kind: _FieldKind,
+    value: Any,
+    schema: s_schema.Schema,
+    context: so.ComparisonContext,
+    *,
+    is_old: bool,
+) -> Hashable:
+    comparator = _func(getattr(type(value), 'compare_values', None))
+
+    if kind is _FieldKind.VALUE:
+        if comparator is not None:
+            return _UNBOUNDED
+        try:
+            hash(value)
+        except TypeError:
+            return _UNBOUNDED
+        return value
+
+    elif kind is _FieldKind.OBJECT:
+        if value is None:
+            return None
+        elif comparator is not _func(so.Object.compare_values):
+            return _UNBOUNDED
+        elif is_old:
+            return type(value), context.get_obj_name(schema, value)
+        else:
+            return type(value), value.get_name(schema)
+
+    else:
+        if (
+            value is None
+            or comparator is not _func(so.ObjectCollection.compare_values)
+        ):
+            return _UNBOUNDED
+        elif is_old:
+            names = type(value)._container(
+                context.get_obj_name(schema, o)
+                for o in value.objects(schema)
+            )
+        else:
+            names = value.names(schema)
+        return type(value), names
+
+
+def _bound_field_values(
+    fields: Tuple[Tuple[so.Field[Any], _FieldKind], ...],
+    ours: Tuple[Hashable, ...],
+    theirs: Tuple[Hashable, ...],
+) -> float:
+    coef = 1.0
+    for (field, kind), our_token, their_token in zip(fields, ours, theirs):
+        if (
+            our_token is _UNBOUNDED
+            or their_token is _UNBOUNDED
+            or our_token == their_token
+        ):
+            continue
+        elif (
+            kind is _FieldKind.COLLECTION
+            and our_token[0] is not their_token[0]  # type: ignore
+        ):
+            # Collections of different types are compared by the
+            # comparator of the field type instead.
+            continue
+        coef *= field.compcoef
+    return coef
+
+
+def _bound_index_keys(
+    field: so.Field[Any],
+    ours: Hashable,
+    theirs: Hashable,
+) -> float:
+    # Mirrors ObjectIndexBase.compare_values() with the similarity of
+    # the objects under the common keys taken as 1.0.
+    if ours is _UNBOUNDED or theirs is _UNBOUNDED:
+        return 1.0
+
+    assert isinstance(ours, frozenset) and isinstance(theirs, frozenset)
+    if not ours and not theirs:
+        basecoef = 1.0
+    elif not ours or not theirs:
+        basecoef = 0.2
+    else:
+        common = len(ours & theirs)
+        total = len(ours) + len(theirs) - common
+        basecoef = (common + 0.2 * (total - common)) / total
+
+    return basecoef + (1 - basecoef) * field.compcoef
+
+
 def _sort_by_inheritance(
     schema: s_schema.Schema,
     objs: Iterable[so.InheritingObjectT],
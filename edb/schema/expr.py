@@ -24,6 +24,7 @@ import copy
 import uuid
 
 from edb.common import checked
+from edb.common import lru
 from edb.common import struct
 
 from edb.edgeql import ast as qlast_
@@ -33,6 +34,7 @@ from edb.edgeql import parser as qlparser
 from edb.edgeql import qltypes
 
 from . import abc as s_abc
+from . import defines as s_def
 from . import objects as so
 from . import name as sn
 
@@ -44,6 +46,23 @@ if TYPE_CHECKING:
     from edb.ir import ast as irast_
 
 
+# Parsed expression texts.  Expressions lose their ASTs when pickled,
+# and compiler workers unpickle all schema objects again on every
+# schema update, so without this every expression would be parsed
+# again after each DDL.  The ASTs are shared, and, same as
+# Expression.qlast, must not be mutated.
+_qlast_cache: lru.LRUMapping = lru.LRUMapping(
+    maxsize=s_def.EXPR_QLAST_CACHE_SIZE)
+
+
+def _parse_fragment(text: str) -> qlast_.Expr:
+    qltree = _qlast_cache.get(text)
+    if qltree is None:
+        qltree = qlparser.parse_fragment(text)
+        _qlast_cache[text] = qltree
+    return qltree
+
+
 class Expression(struct.MixedRTStruct, so.ObjectContainer, s_abc.Expression):
 
     text = struct.Field(str, frozen=True)
@@ -79,7 +98,7 @@ class Expression(struct.MixedRTStruct, so.ObjectContainer, s_abc.Expression):
     @property
     def qlast(self) -> qlast_.Expr:
         if self._qlast is None:
-            self._qlast = qlparser.parse_fragment(self.text)
+            self._qlast = _parse_fragment(self.text)
         return self._qlast
 
     @property
@@ -328,7 +347,7 @@ class ExpressionShell(so.Shell):
     @property
     def qlast(self) -> qlast_.Expr:
         if self._qlast is None:
-            self._qlast = qlparser.parse_fragment(self.text)
+            self._qlast = _parse_fragment(self.text)
         return self._qlast
 
     def __repr__(self) -> str:
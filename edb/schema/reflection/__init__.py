@@ -17,7 +17,7 @@
 #
 
 
-from .reader import parse_into, SchemaClassLayout
+from .reader import parse_into, parse_changes_into, SchemaClassLayout
 from .structure import generate_structure
 from .structure import SchemaTypeLayout
 from .writer import write_meta
@@ -26,6 +26,7 @@ __all__ = (
     'generate_structure',
     'write_meta',
     'parse_into',
+    'parse_changes_into',
     'SchemaTypeLayout',
     'SchemaClassLayout',
 )
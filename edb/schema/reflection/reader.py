@@ -209,7 +209,9 @@ def parse_into(
         id_to_data[objid] = tuple(objdata)
 
     for objid, updates in refdict_updates.items():
-        if updates:
+        if updates and objid in id_to_data:
+            # Objects that are not in *data* are already in *schema*
+            # and are up to date, see parse_changes_into().
             sclass = s_obj.ObjectMeta.get_schema_class(id_to_type[objid])
             updated_data = list(id_to_data[objid])
             for fn, v in updates.items():
@@ -245,7 +247,8 @@ def parse_into(
         id_to_data=schema._id_to_data.update(id_to_data),
         name_to_id=schema._name_to_id.update(name_to_id),
         shortname_to_id=schema._shortname_to_id.update(
-            (k, frozenset(v)) for k, v in shortname_to_id.items()
+            (k, schema._shortname_to_id.get(k, frozenset()) | v)
+            for k, v in shortname_to_id.items()
         ),
         globalname_to_id=schema._globalname_to_id.update(globalname_to_id),
         refs_to=mm.finish(),
@@ -254,6 +257,46 @@ def parse_into(
     return schema
 
 
+def parse_changes_into(
+    base_schema: s_schema.Schema,
+    schema: s_schema.FlatSchema,
+    data: Union[str, bytes],
+    stale_ids: Iterable[uuid.UUID],
+    schema_class_layout: SchemaClassLayout,
+) -> s_schema.FlatSchema:
+    """Update the schema with the JSON-encoded data of changed objects.
+
+    Args:
+        base_schema:
+            A schema to resolve references to objects that did not
+            change with, normally including *schema* itself.
+        schema:
+            A schema instance to update.
+        data:
+            A JSON-encoded schema object data of the created and
+            changed objects as returned by an introspection query.
+        stale_ids:
+            Ids of objects that were changed or deleted.  These are
+            removed from *schema* before *data* is parsed.
+        schema_class_layout:
+            A mapping describing schema class layout in the reflection.
+
+    Returns:
+        A schema instance with the changes applied.
+    """
+    for objid in stale_ids:
+        obj = schema.get_by_id(objid, default=None)
+        if obj is not None:
+            schema = schema.delete(obj)
+
+    return parse_into(
+        base_schema=base_schema,
+        schema=schema,
+        data=data,
+        schema_class_layout=schema_class_layout,
+    )
+
+
 def _parse_expression(val: Dict[str, Any]) -> s_expr.Expression:
     refids = frozenset(
         uuidgen.UUID(r) for r in val['refs']
@@ -91,6 +91,9 @@ class SchemaReflectionParts(NamedTuple):
     intro_schema_delta: sd.Command
     class_layout: Dict[Type[s_obj.Object], SchemaTypeLayout]
     local_intro_parts: List[str]
+    # The same as local_intro_parts, but only for the objects with
+    # the ids passed as a JSON array in $ids.
+    local_intro_changes_parts: List[str]
     global_intro_parts: List[str]
 
 
@@ -746,6 +749,7 @@ def generate_structure(schema: s_schema.Schema) -> SchemaReflectionParts:
                 read_shape.append(read_ptr)
 
     local_parts = []
+    local_changes_parts = []
     global_parts = []
     for py_cls, shape_els in read_sets.items():
         if (
@@ -764,19 +768,29 @@ def generate_structure(schema: s_schema.Schema) -> SchemaReflectionParts:
                 {shape}
             }}
         '''
+        filters = []
         if not issubclass(py_cls, (s_types.Collection, s_obj.GlobalObject)):
-            qry += ' FILTER NOT .builtin'
+            filters.append('NOT .builtin')
+
+        if filters:
+            qry_all = f'{qry} FILTER {" AND ".join(filters)}'
+        else:
+            qry_all = qry
 
         if issubclass(py_cls, s_obj.GlobalObject):
-            global_parts.append(qry)
+            global_parts.append(qry_all)
         else:
-            local_parts.append(qry)
+            local_parts.append(qry_all)
+            filters.append('.id IN <uuid>json_array_unpack(<json>$ids)')
+            local_changes_parts.append(
+                f'{qry} FILTER {" AND ".join(filters)}')
 
     delta.canonical = True
     return SchemaReflectionParts(
         intro_schema_delta=delta,
         class_layout=classlayout,
         local_intro_parts=local_parts,
+        local_intro_changes_parts=local_changes_parts,
         global_intro_parts=global_parts,
     )
 
@@ -25,6 +25,7 @@ import abc
 import collections
 import functools
 import itertools
+import random
 
 import immutables as immu
 
@@ -32,6 +33,8 @@ from edb import errors
 from edb.common import english
 
 from . import casts as s_casts
+from . import defines as s_def
+from . import expr as s_expr
 from . import functions as s_func
 from . import migrations as s_migrations
 from . import modules as s_mod
@@ -73,6 +76,132 @@ STD_SOURCES = (
     sn.UnqualName('ext'),
 )
 
+_FLAT_SCHEMA_MAPS = (
+    'id_to_data',
+    'id_to_type',
+    'name_to_id',
+    'shortname_to_id',
+    'globalname_to_id',
+    'refs_to',
+)
+
+_NOT_FOUND = object()
+
+# Tokens identifying the schema generations produced in this process
+# in the FlatSchema mutation logs.  The random start keeps them apart
+# from the tokens of the other processes.
+_mutation_tokens = itertools.count(random.getrandbits(62))
+
+
+def _field_values_equal(ours: Any, theirs: Any) -> bool:
+    # Expressions do not define equality, so compare what they are
+    # pickled with instead.
+    if isinstance(ours, s_expr.Expression):
+        return (
+            isinstance(theirs, s_expr.Expression)
+            and ours.text == theirs.text
+            and ours.refs == theirs.refs
+        )
+    elif isinstance(ours, s_expr.ExpressionList):
+        return (
+            isinstance(theirs, s_expr.ExpressionList)
+            and len(ours) == len(theirs)
+            and all(map(_field_values_equal, ours, theirs))
+        )
+    else:
+        return ours == theirs
+
+
+def _values_equal(ours: Any, theirs: Any) -> bool:
+    """Compare values of the schema maps of separately unpickled schemas.
+
+    Object data tuples holding expressions are compared field by field.
+    """
+    if ours is theirs or ours == theirs:
+        return True
+    elif (
+        type(ours) is tuple
+        and type(theirs) is tuple
+        and len(ours) == len(theirs)
+    ):
+        return all(
+            a is b or _field_values_equal(a, b)
+            for a, b in zip(ours, theirs)
+        )
+    else:
+        return False
+
+
+def _diff_maps(
+    old_map: immu.Map[Any, Any],
+    new_map: immu.Map[Any, Any],
+) -> Tuple[Dict[Any, Any], Tuple[Any, ...]]:
+    updates = {}
+    added = 0
+    for key, value in new_map.items():
+        old_value = old_map.get(key, _NOT_FOUND)
+        if old_value is _NOT_FOUND:
+            added += 1
+            updates[key] = value
+        elif not _values_equal(old_value, value):
+            updates[key] = value
+
+    # Only look for deleted keys if the sizes say there are any.
+    if len(old_map) + added != len(new_map):
+        deletions = tuple(k for k in old_map if k not in new_map)
+    else:
+        deletions = ()
+
+    return updates, deletions
+
+
+def _diff_map_keys(
+    old_map: immu.Map[Any, Any],
+    new_map: immu.Map[Any, Any],
+    keys: Iterable[Any],
+) -> Tuple[Dict[Any, Any], Tuple[Any, ...]]:
+    # Like _diff_maps(), with the other keys known to be unchanged.
+    updates = {}
+    deletions = []
+    for key in keys:
+        value = new_map.get(key, _NOT_FOUND)
+        old_value = old_map.get(key, _NOT_FOUND)
+        if value is _NOT_FOUND:
+            if old_value is not _NOT_FOUND:
+                deletions.append(key)
+        elif (
+            old_value is _NOT_FOUND
+            or not _values_equal(old_value, value)
+        ):
+            updates[key] = value
+
+    return updates, tuple(deletions)
+
+
+class FlatSchemaDiff(NamedTuple):
+    """The changes between two FlatSchema generations.
+
+    For every internal map of the schema that differs this holds
+    a ``(map name, {key: new value}, (deleted key, ...))`` triple.
+
+    *mutations* are the mutation log entries of the new schema.  If
+    *base_log* is true, the log of the base schema is a part of it,
+    and they are only the entries after the base generation.
+    """
+
+    base_generation: int
+    generation: int
+    changes: Tuple[Tuple[str, Dict[Any, Any], Tuple[Any, ...]], ...]
+    mutations: Tuple[Tuple[int, Tuple[int, uuid.UUID]], ...]
+    base_log: bool
+
+    def get_size(self) -> int:
+        return sum(
+            len(updates) + len(deletions)
+            for _, updates, deletions in self.changes
+        )
+
+
 Schema_T = TypeVar('Schema_T', bound='Schema')
 
 
@@ -483,6 +612,12 @@ class FlatSchema(Schema):
     ]
     _refs_to: Refs_T
     _generation: int
+    # generation -> (token, id of the object changed by the mutation
+    # producing it), for the last SCHEMA_MUTATION_LOG_SIZE mutations.
+    # The token tells whether two schemas share the generation.  The
+    # id is None for the generations produced by bulk updates, which
+    # the log starts anew from.
+    _mutation_log: immu.Map[int, Tuple[int, Optional[uuid.UUID]]]
 
     def __init__(self) -> None:
         self._id_to_data = immu.Map()
@@ -492,6 +627,7 @@ class FlatSchema(Schema):
         self._globalname_to_id = immu.Map()
         self._refs_to = immu.Map()
         self._generation = 0
+        self._mutation_log = immu.Map()
 
     def _replace(
         self,
@@ -509,6 +645,7 @@ class FlatSchema(Schema):
             immu.Map[Tuple[Type[so.Object], sn.Name], uuid.UUID]
         ],
         refs_to: Optional[Refs_T] = None,
+        changed_id: Optional[uuid.UUID] = None,
     ) -> FlatSchema:
         new = FlatSchema.__new__(FlatSchema)
 
@@ -544,8 +681,181 @@ class FlatSchema(Schema):
 
         new._generation = self._generation + 1
 
+        if changed_id is None:
+            # The changed objects are not known, so the diff from
+            # the earlier generations has to compare all of them,
+            # but the diffs from this one can use the log.
+            new._mutation_log = immu.Map(
+                {new._generation: (next(_mutation_tokens), None)})
+        else:
+            with self._mutation_log.mutate() as mm:
+                mm[new._generation] = (next(_mutation_tokens), changed_id)
+                mm.pop(
+                    new._generation - s_def.SCHEMA_MUTATION_LOG_SIZE, None)
+                new._mutation_log = mm.finish()
+
+        return new
+
+    def get_diff(self, base: FlatSchema) -> FlatSchemaDiff:
+        """Compute the changes that turn *base* into this schema.
+
+        Values are compared by equality rather than identity, as the
+        schemas may have been unpickled separately.  If this schema was
+        derived from *base* within the mutation log, only the entries
+        of the objects changed since are compared.
+        """
+        changed_ids = self._get_changed_ids_since(base)
+        if changed_ids is not None:
+            keys = self._get_changed_keys(base, changed_ids)
+            mutations = tuple(
+                (gen, self._mutation_log[gen])
+                for gen in range(base._generation + 1, self._generation + 1)
+            )
+        else:
+            keys = None
+            mutations = tuple(self._mutation_log.items())
+
+        changes = []
+        for attr in _FLAT_SCHEMA_MAPS:
+            old_map = getattr(base, f'_{attr}')
+            new_map = getattr(self, f'_{attr}')
+            if old_map is new_map:
+                continue
+
+            if keys is not None:
+                updates, deletions = _diff_map_keys(
+                    old_map, new_map, keys[attr])
+            else:
+                updates, deletions = _diff_maps(old_map, new_map)
+
+            if updates or deletions:
+                changes.append((attr, updates, deletions))
+
+        return FlatSchemaDiff(
+            base_generation=base._generation,
+            generation=self._generation,
+            changes=tuple(changes),
+            mutations=mutations,
+            base_log=changed_ids is not None,
+        )
+
+    def get_changed_object_ids(
+        self,
+        base: FlatSchema,
+    ) -> Tuple[FrozenSet[uuid.UUID], FrozenSet[uuid.UUID]]:
+        """Return the ids of objects that differ from those in *base*.
+
+        The first set holds the ids of objects that were created or
+        changed, the second one the ids of deleted objects.
+        """
+        old_map = base._id_to_data
+        new_map = self._id_to_data
+        if old_map is new_map:
+            return frozenset(), frozenset()
+
+        changed_ids = self._get_changed_ids_since(base)
+        if changed_ids is not None:
+            updates, deletions = _diff_map_keys(
+                old_map, new_map, changed_ids)
+        else:
+            updates, deletions = _diff_maps(old_map, new_map)
+
+        return frozenset(updates), frozenset(deletions)
+
+    def apply_diff(self, diff: FlatSchemaDiff) -> FlatSchema:
+        """Return a copy of this schema with *diff* applied to it."""
+        if diff.base_generation != self._generation:
+            raise ValueError(
+                f'cannot apply a diff from schema generation '
+                f'{diff.base_generation} to generation {self._generation}')
+
+        maps: Dict[str, Any] = dict.fromkeys(_FLAT_SCHEMA_MAPS)
+        for attr, updates, deletions in diff.changes:
+            with getattr(self, f'_{attr}').mutate() as mm:
+                for key in deletions:
+                    del mm[key]
+                for key, value in updates.items():
+                    mm[key] = value
+                maps[attr] = mm.finish()
+
+        new = self._replace(**maps)  # type: ignore
+        new._generation = diff.generation
+        if diff.base_log:
+            with self._mutation_log.mutate() as mm:
+                for gen, entry in diff.mutations:
+                    mm[gen] = entry
+                    mm.pop(gen - s_def.SCHEMA_MUTATION_LOG_SIZE, None)
+                new._mutation_log = mm.finish()
+        else:
+            new._mutation_log = immu.Map(diff.mutations)
         return new
 
+    def _get_changed_ids_since(
+        self,
+        base: FlatSchema,
+    ) -> Optional[Set[uuid.UUID]]:
+        """Return the ids of objects changed since *base* was produced.
+
+        None is returned if this schema was not derived from *base* by
+        the mutations in the log.
+        """
+        base_gen = base._generation
+        if base_gen > self._generation:
+            return None
+        base_entry = base._mutation_log.get(base_gen)
+        if (
+            base_entry is None
+            or self._mutation_log.get(base_gen) != base_entry
+        ):
+            return None
+
+        changed_ids = set()
+        for gen in range(base_gen + 1, self._generation + 1):
+            entry = self._mutation_log.get(gen)
+            if entry is None or entry[1] is None:
+                return None
+            changed_ids.add(entry[1])
+        return changed_ids
+
+    def _get_changed_keys(
+        self,
+        base: FlatSchema,
+        changed_ids: Set[uuid.UUID],
+    ) -> Dict[str, Set[Any]]:
+        """Return the keys of every map that the changed objects affect.
+
+        These are the keys that the mutations of the objects updated,
+        see add_raw(), _delete() and _update_obj_name().
+        """
+        keys: Dict[str, Set[Any]] = {
+            attr: set() for attr in _FLAT_SCHEMA_MAPS}
+        keys['id_to_data'] = keys['id_to_type'] = changed_ids
+        for schema in (base, self):
+            for obj_id in changed_ids:
+                data = schema._id_to_data.get(obj_id)
+                if data is None:
+                    continue
+                sclass = so.ObjectMeta.get_schema_class(
+                    schema._id_to_type[obj_id])
+
+                name = data[sclass.get_schema_field('name').index]
+                if name is not None:
+                    if not issubclass(sclass, so.QualifiedObject):
+                        keys['globalname_to_id'].add((sclass, name))
+                    else:
+                        keys['name_to_id'].add(name)
+                    if issubclass(sclass, (s_func.Function, s_oper.Operator)):
+                        keys['shortname_to_id'].add(
+                            (sclass, sn.shortname_from_fullname(name)))
+
+                for field in sclass.get_object_reference_fields():
+                    value = data[field.index]
+                    if value is not None:
+                        keys['refs_to'].update(
+                            field.type.schema_refs_from_data(value))
+
+        return keys
+
     def _update_obj_name(
         self,
         obj_id: uuid.UUID,
@@ -683,7 +993,8 @@ class FlatSchema(Schema):
                              shortname_to_id=shortname_to_id,
                              globalname_to_id=globalname_to_id,
                              id_to_data=id_to_data,
-                             refs_to=refs_to)
+                             refs_to=refs_to,
+                             changed_id=obj_id)
 
     def maybe_get_obj_data_raw(
         self,
@@ -761,6 +1072,7 @@ class FlatSchema(Schema):
             globalname_to_id=globalname_to_id,
             id_to_data=id_to_data,
             refs_to=refs_to,
+            changed_id=obj_id,
         )
 
     def unset_obj_field(
@@ -818,6 +1130,7 @@ class FlatSchema(Schema):
             globalname_to_id=globalname_to_id,
             id_to_data=id_to_data,
             refs_to=refs_to,
+            changed_id=obj_id,
         )
 
     def _update_refs_to(
@@ -882,10 +1195,14 @@ class FlatSchema(Schema):
                     for ref_id in old_ids:
                         refs = mm[ref_id]
                         field_refs = refs[key].delete(object_id)
-                        if not field_refs:
+                        if field_refs:
+                            mm[ref_id] = refs.set(key, field_refs)
+                        elif len(refs) > 1:
                             mm[ref_id] = refs.delete(key)
                         else:
-                            mm[ref_id] = refs.set(key, field_refs)
+                            # Don't leave empty entries behind, so that
+                            # get_diff() doesn't have to look for them.
+                            del mm[ref_id]
 
             result = mm.finish()
 
@@ -933,6 +1250,7 @@ class FlatSchema(Schema):
             shortname_to_id=shortname_to_id,
             globalname_to_id=globalname_to_id,
             refs_to=refs_to,
+            changed_id=id,
         )
 
         if (
@@ -998,6 +1316,7 @@ class FlatSchema(Schema):
             id_to_data=self._id_to_data.delete(obj.id),
             id_to_type=self._id_to_type.delete(obj.id),
             refs_to=refs_to,
+            changed_id=obj.id,
         ))
 
         return self._replace(**updates)  # type: ignore
@@ -153,6 +153,12 @@ class ServerConfig(NamedTuple):
     daemon_user: str
     daemon_group: str
     runstate_dir: pathlib.Path
+    query_cache_dir: Optional[pathlib.Path]
+    http_result_cache_size: int
+    http_result_cache_ttl: float
+    lazy_db_introspection: bool
+    db_idle_timeout: float
+    backend_prepare_hot_stmts: int
     max_backend_connections: Optional[int]
     compiler_pool_size: int
     compiler_pool_mode: CompilerPoolMode
@@ -458,6 +464,46 @@ _server_options = [
         help=f'directory where UNIX sockets and other temporary '
              f'runtime files will be placed ({_get_runstate_dir_default()} '
              f'by default)'),
+    click.option(
+        '--query-cache-dir', type=PathPath(), default=None,
+        envvar="EDGEDB_SERVER_QUERY_CACHE_DIR",
+        help='directory where compiled queries are persisted so that '
+             'they survive server restarts; the persistent query cache '
+             'is disabled if not set'),
+    click.option(
+        '--http-result-cache-size', type=int, default=0, metavar='BYTES',
+        envvar="EDGEDB_SERVER_HTTP_RESULT_CACHE_SIZE",
+        help='the maximum total size of cached results of read-only '
+             'queries run over the EdgeQL and GraphQL HTTP endpoints; '
+             'results are cached per database and dropped whenever data '
+             'or schema of the database changes through this server. '
+             'Disabled if 0 (default)'),
+    click.option(
+        '--http-result-cache-ttl', type=float, metavar='SECONDS',
+        default=defines.HTTP_RESULT_CACHE_TTL,
+        envvar="EDGEDB_SERVER_HTTP_RESULT_CACHE_TTL",
+        help='how long a cached HTTP query result stays valid; this '
+             'bounds the staleness of results after data is modified '
+             'through other servers or directly in Postgres'),
+    click.option(
+        '--lazy-db-introspection', is_flag=True,
+        envvar="EDGEDB_SERVER_LAZY_DB_INTROSPECTION",
+        help='do not load the schemas of all databases on startup, load '
+             'the schema of a database when it is first connected to '
+             'instead'),
+    click.option(
+        '--db-idle-timeout', type=float, default=0, metavar='SECONDS',
+        envvar="EDGEDB_SERVER_DB_IDLE_TIMEOUT",
+        help='unload the schema and caches of a database that had no '
+             'connections or HTTP requests for this long; it is loaded '
+             'again on the next use. Disabled if 0 (default)'),
+    click.option(
+        '--backend-prepare-hot-stmts', type=int, default=0, metavar='NUM',
+        envvar="EDGEDB_SERVER_BACKEND_PREPARE_HOT_STMTS",
+        help='prepare the NUM most recently run statements of a database '
+             'on every new backend connection to it before it is used, '
+             'so that the first queries on it are not slowed down by '
+             'preparing them. Disabled if 0 (default)'),
     click.option(
         '--max-backend-connections', type=int, metavar='NUM',
         help=f'The maximum NUM of connections this EdgeDB instance could make '
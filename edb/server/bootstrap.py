@@ -463,6 +463,9 @@ class StdlibBits(NamedTuple):
     classlayout: Dict[Type[s_obj.Object], s_refl.SchemaTypeLayout]
     #: Schema introspection SQL query.
     local_intro_query: str
+    #: Introspection SQL query of the schema objects with the ids
+    #: passed as a JSON array in $1.
+    local_intro_changes_query: str
     #: Global object introspection SQL query.
     global_intro_query: str
 
@@ -593,6 +596,26 @@ async def _make_stdlib(
             ),
         )
 
+    # The parts of the query of the changed objects take their ids
+    # as a parameter, so they are compiled as single statements.
+    changes_compilerctx = edbcompiler.new_compiler_context(
+        user_schema=reflschema.get_top_schema(),
+        global_schema=schema.get_global_schema(),
+        single_statement=True,
+        json_parameters=True,
+        schema_reflection_mode=True,
+        output_format=edbcompiler.IoFormat.JSON_ELEMENTS,
+    )
+    sql_intro_local_changes_parts = []
+    for intropart in reflection.local_intro_changes_parts:
+        sql_intro_local_changes_parts.append(
+            compile_single_query(
+                intropart,
+                compiler=compiler,
+                compilerctx=changes_compilerctx,
+            ),
+        )
+
     for intropart in reflection.global_intro_parts:
         sql_intro_global_parts.append(
             compile_single_query(
@@ -608,6 +631,13 @@ async def _make_stdlib(
         SELECT json_agg(intro.c) FROM intro
     '''
 
+    local_intro_changes_sql = ' UNION ALL '.join(
+        sql_intro_local_changes_parts)
+    local_intro_changes_sql = f'''
+        WITH intro(c) AS ({local_intro_changes_sql})
+        SELECT coalesce(json_agg(intro.c), '[]') FROM intro
+    '''
+
     global_intro_sql = ' UNION ALL '.join(sql_intro_global_parts)
     global_intro_sql = f'''
         WITH intro(c) AS ({global_intro_sql})
@@ -622,6 +652,7 @@ async def _make_stdlib(
         types=types,
         classlayout=reflection.class_layout,
         local_intro_query=local_intro_sql,
+        local_intro_changes_query=local_intro_changes_sql,
         global_intro_query=global_intro_sql,
     )
 
@@ -869,6 +900,12 @@ async def _init_stdlib(
         stdlib.local_intro_query,
     )
 
+    await _store_static_text_cache(
+        ctx,
+        'local_intro_changes_query',
+        stdlib.local_intro_changes_query,
+    )
+
     await _store_static_text_cache(
         ctx,
         'global_intro_query',
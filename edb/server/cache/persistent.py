@@ -0,0 +1,196 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2022-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""On-disk storage for compiled queries that survives server restarts.
+
+Every database gets its own file in the cache directory.  A file holds
+the *fingerprint* of the state the queries were compiled against (server
+build, schema versions and the configuration that affects compilation)
+and a list of ``(key, query_unit)`` pairs.  A file whose fingerprint
+does not match the current state of the database is simply ignored
+and overwritten on the next save.
+"""
+
+
+from __future__ import annotations
+from typing import *
+
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import pickle
+import tempfile
+
+from edb import buildmeta
+from edb.schema import schema as s_schema
+from edb.schema import version as s_ver
+from edb.server import config
+from edb.server import defines
+
+
+logger = logging.getLogger('edb.server')
+
+# Bump this whenever the layout of the stored data changes.
+_FORMAT_VERSION = 1
+
+_FILE_SUFFIX = '.qcache'
+
+
+def compute_fingerprint(
+    *,
+    std_schema: s_schema.Schema,
+    user_schema: s_schema.FlatSchema,
+    global_schema: s_schema.FlatSchema,
+    db_config: Mapping[str, config.SettingValue],
+    comp_sys_config: Mapping[str, config.SettingValue],
+) -> bytes:
+    """Compute a digest of everything a compiled query depends on.
+
+    Unlike ``Database.dbver``, which is local to the server process,
+    the fingerprint is stable across restarts and across servers
+    running the same build against the same database.
+    """
+    schema = s_schema.ChainedSchema(std_schema, user_schema, global_schema)
+    schema_ver = schema.get_global(
+        s_ver.SchemaVersion, '__schema_version__', None)
+    global_ver = schema.get_global(
+        s_ver.GlobalSchemaVersion, '__global_schema_version__', None)
+
+    state = (
+        _FORMAT_VERSION,
+        defines.EDGEDB_CATALOG_VERSION,
+        buildmeta.get_version_string(short=False),
+        str(schema_ver.get_version(schema)) if schema_ver else None,
+        str(global_ver.get_version(schema)) if global_ver else None,
+        _config_to_json(db_config),
+        _config_to_json(comp_sys_config),
+    )
+    return hashlib.blake2b(
+        json.dumps(state).encode('utf-8'), digest_size=16).digest()
+
+
+def _config_to_json(cfg: Mapping[str, config.SettingValue]) -> str:
+    # immutables.Map iteration order depends on the (randomized) string
+    # hashes, so sort the keys to get a value that is stable across
+    # processes.
+    settings = config.get_settings()
+    return json.dumps(
+        {
+            name: config.value_to_json_value(settings[name], sval.value)
+            for name, sval in cfg.items()
+        },
+        sort_keys=True,
+    )
+
+
+class PersistentQueryCache:
+
+    def __init__(
+        self,
+        path: pathlib.Path,
+        *,
+        maxsize: int = defines.PERSISTENT_QUERY_CACHE_SIZE,
+    ) -> None:
+        self._path = path
+        self._maxsize = maxsize
+
+    def get_path(self) -> pathlib.Path:
+        return self._path
+
+    def ensure_dir(self) -> None:
+        self._path.mkdir(parents=True, exist_ok=True)
+
+    def load(
+        self,
+        dbname: str,
+        fingerprint: bytes,
+    ) -> Dict[Any, Any]:
+        """Load the queries of *dbname* compiled against *fingerprint*.
+
+        Returns an empty dict if there is nothing usable on disk.
+        """
+        fn = self._get_db_file(dbname)
+        try:
+            with open(fn, 'rb') as f:
+                data = pickle.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warning(
+                'could not load persistent query cache for database %r '
+                'from %s: %s', dbname, fn, e)
+            return {}
+
+        if (
+            not isinstance(data, dict)
+            or data.get('format') != _FORMAT_VERSION
+            or data.get('dbname') != dbname
+            or data.get('fingerprint') != fingerprint
+        ):
+            return {}
+
+        return dict(data['entries'])
+
+    def save(
+        self,
+        dbname: str,
+        fingerprint: bytes,
+        entries: Sequence[Tuple[Any, Any]],
+    ) -> None:
+        """Atomically replace the stored queries of *dbname*.
+
+        This is a blocking call; the server runs it in an executor.
+        """
+        fn = self._get_db_file(dbname)
+        data = pickle.dumps(
+            {
+                'format': _FORMAT_VERSION,
+                'dbname': dbname,
+                'fingerprint': fingerprint,
+                'entries': list(entries[-self._maxsize:]),
+            },
+            protocol=pickle.HIGHEST_PROTOCOL,
+        )
+
+        fd, tmpfn = tempfile.mkstemp(
+            dir=self._path, prefix='.tmp', suffix=_FILE_SUFFIX)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmpfn, fn)
+        except BaseException:
+            try:
+                os.unlink(tmpfn)
+            except OSError:
+                pass
+            raise
+
+    def drop(self, dbname: str) -> None:
+        try:
+            os.unlink(self._get_db_file(dbname))
+        except FileNotFoundError:
+            pass
+
+    def _get_db_file(self, dbname: str) -> pathlib.Path:
+        # Database names can contain pretty much anything, so don't
+        # use them as file names directly.
+        digest = hashlib.sha1(dbname.encode('utf-8')).hexdigest()
+        return self._path / f'{digest}{_FILE_SUFFIX}'
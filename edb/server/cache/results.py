@@ -0,0 +1,134 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2022-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""Cache of the results of read-only queries run over HTTP.
+
+Entries are bounded by their total size and expire after a fixed time.
+Every database has a *generation* that is bumped whenever its data
+changes.  Callers take the generation before running a query and pass
+it to ``set()``, so a result computed concurrently with a change is
+never returned after the change.
+"""
+
+
+from __future__ import annotations
+from typing import *
+
+import collections
+import time
+
+
+# The approximate memory taken by an entry besides its key and data.
+_ENTRY_OVERHEAD = 256
+
+
+class _Entry(NamedTuple):
+
+    generation: int
+    expires_at: float
+    size: int
+    data: bytes
+
+
+class ResultCache:
+
+    def __init__(self, *, maxsize: int, ttl: float) -> None:
+        if maxsize <= 0:
+            raise ValueError(
+                f'maxsize is expected to be greater than 0, got {maxsize}')
+
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._size = 0
+        self._entries: collections.OrderedDict[
+            Tuple[str, Hashable], _Entry] = collections.OrderedDict()
+        self._generations: Dict[str, int] = {}
+
+    def get_generation(self, dbname: str) -> int:
+        return self._generations.get(dbname, 0)
+
+    def get(self, dbname: str, key: Hashable) -> Optional[bytes]:
+        entry = self._entries.get((dbname, key))
+        if entry is None:
+            return None
+
+        if (
+            entry.generation != self._generations.get(dbname, 0)
+            or entry.expires_at < time.monotonic()
+        ):
+            self._pop((dbname, key))
+            return None
+
+        self._entries.move_to_end((dbname, key), last=True)
+        return entry.data
+
+    def set(
+        self,
+        dbname: str,
+        key: Hashable,
+        data: bytes,
+        *,
+        generation: int,
+    ) -> None:
+        if generation != self._generations.get(dbname, 0):
+            # The data has changed while the query was running.
+            return
+
+        size = _ENTRY_OVERHEAD + len(data) + _sizeof_key(key)
+        if size > self._maxsize // 8:
+            # Don't let one result push out everything else.
+            return
+
+        self._pop((dbname, key))
+        self._entries[(dbname, key)] = _Entry(
+            generation=generation,
+            expires_at=time.monotonic() + self._ttl,
+            size=size,
+            data=data,
+        )
+        self._size += size
+
+        while self._size > self._maxsize:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= evicted.size
+
+    def invalidate(self, dbname: str) -> None:
+        # The entries of the database are dropped lazily, either when
+        # looked up or by the size limit.
+        self._generations[dbname] = self._generations.get(dbname, 0) + 1
+
+    def get_size(self) -> int:
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _pop(self, key: Tuple[str, Hashable]) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry.size
+
+
+def _sizeof_key(key: Hashable) -> int:
+    if isinstance(key, (str, bytes)):
+        return len(key)
+    elif isinstance(key, tuple):
+        return sum(_sizeof_key(part) for part in key)
+    else:
+        return 0
@@ -60,6 +60,10 @@ cdef class StatementsCache:
         self._dict_move_to_end(key)  # last=True
         return o
 
+    cpdef peek(self, key, default):
+        # Like get(), but doesn't count as a hit.
+        return self._dict_get(key, default)
+
     cpdef needs_cleanup(self):
         return len(self._dict) > self._maxsize
 
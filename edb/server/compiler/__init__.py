@@ -24,6 +24,7 @@ from .compiler import CompileContext, CompilerDatabaseState
 from .compiler import compile_edgeql_script
 from .compiler import load_std_schema
 from .compiler import new_compiler, new_compiler_context
+from .compiler import pop_stage_timings, record_stage_time
 from .dbstate import QueryUnit
 from .enums import Capability, CompileStatementMode, Cardinality
 from .enums import IoFormat
@@ -40,4 +41,6 @@ __all__ = (
     'load_std_schema',
     'new_compiler',
     'new_compiler_context',
+    'pop_stage_timings',
+    'record_stage_time',
 )
@@ -28,6 +28,7 @@ import json
 import hashlib
 import pickle
 import textwrap
+import time
 import uuid
 
 import asyncpg
@@ -130,6 +131,23 @@ _IO_FORMAT_MAP = {
 pg_ql = lambda o: pg_common.quote_literal(str(o))
 
 
+# Time spent in the stages of compilation, accumulated until collected
+# with `pop_stage_timings()`.  The compiler workers send it to the server
+# along with the compilation results.
+_stage_timings: Dict[str, float] = {}
+
+
+def record_stage_time(stage: str, started_at: float) -> None:
+    elapsed = time.monotonic() - started_at
+    _stage_timings[stage] = _stage_timings.get(stage, 0.0) + elapsed
+
+
+def pop_stage_timings() -> Dict[str, float]:
+    global _stage_timings
+    timings, _stage_timings = _stage_timings, {}
+    return timings
+
+
 def _convert_format(inp: enums.IoFormat) -> pg_compiler.OutputFormat:
     try:
         return _IO_FORMAT_MAP[inp]
@@ -565,6 +583,7 @@ class Compiler:
             '__internal_no_const_folding',
         )
 
+        started_at = time.monotonic()
         ir = qlcompiler.compile_ast_to_ir(
             ql,
             schema=current_tx.get_schema(self._std_schema),
@@ -592,6 +611,7 @@ class Compiler:
                 devmode=self._is_dev_instance(),
             ),
         )
+        record_stage_time('ql_to_ir', started_at)
 
         if ir.cardinality.is_single():
             result_cardinality = enums.Cardinality.AT_MOST_ONE
@@ -602,6 +622,7 @@ class Compiler:
                     f'the query has cardinality {result_cardinality.name} '
                     f'which does not match the expected cardinality ONE')
 
+        started_at = time.monotonic()
         sql_text, argmap = pg_compiler.compile_ir_to_sql(
             ir,
             pretty=(
@@ -613,6 +634,7 @@ class Compiler:
             output_format=_convert_format(ctx.output_format),
             backend_runtime_params=ctx.backend_runtime_params,
         )
+        record_stage_time('ir_to_sql', started_at)
 
         if (
             (mstate := current_tx.get_migration_state())
@@ -628,6 +650,7 @@ class Compiler:
         sql_bytes = sql_text.encode(defines.EDGEDB_ENCODING)
 
         if single_stmt_mode:
+            started_at = time.monotonic()
             if native_out_format:
                 out_type_data, out_type_id = sertypes.TypeSerializer.describe(
                     ir.schema, ir.stype,
@@ -716,6 +739,8 @@ class Compiler:
                     pschema, params_type, {}, {},
                     protocol_version=ctx.protocol_version)
 
+            record_stage_time('describe', started_at)
+
             sql_hash = self._hash_sql(
                 sql_bytes,
                 mode=str(ctx.output_format).encode(),
@@ -733,6 +758,7 @@ class Compiler:
                 out_type_data=out_type_data,
                 cacheable=cacheable,
                 has_dml=ir.dml_exprs,
+                is_volatile=ir.volatility.is_volatile(),
             )
 
         else:
@@ -743,6 +769,7 @@ class Compiler:
             return dbstate.SimpleQuery(
                 sql=(sql_bytes,),
                 has_dml=ir.dml_exprs,
+                is_volatile=ir.volatility.is_volatile(),
             )
 
     def _compile_and_apply_ddl_stmt(
@@ -1699,7 +1726,9 @@ class Compiler:
         single_stmt_mode = ctx.stmt_mode is enums.CompileStatementMode.SINGLE
         default_cardinality = enums.Cardinality.NO_RESULT
 
+        started_at = time.monotonic()
         statements = edgeql.parse_block(source)
+        record_stage_time('parse', started_at)
         statements_len = len(statements)
 
         if ctx.stmt_mode is enums.CompileStatementMode.SKIP_FIRST:
@@ -1780,9 +1809,12 @@ class Compiler:
                 else:
                     unit.sql += comp.sql
 
+                unit.is_volatile |= comp.is_volatile
+
             elif isinstance(comp, dbstate.SimpleQuery):
                 assert not single_stmt_mode
                 unit.sql += comp.sql
+                unit.is_volatile |= comp.is_volatile
 
             elif isinstance(comp, dbstate.DDLQuery):
                 unit.sql += comp.sql
@@ -93,6 +93,7 @@ class Query(BaseQuery):
 
     is_transactional: bool = True
     has_dml: bool = False
+    is_volatile: bool = False
     single_unit: bool = False
     cacheable: bool = True
 
@@ -103,6 +104,7 @@ class SimpleQuery(BaseQuery):
     sql: Tuple[bytes, ...]
     is_transactional: bool = True
     has_dml: bool = False
+    is_volatile: bool = False
     single_unit: bool = False
 
 
@@ -220,6 +222,12 @@ class QueryUnit:
     # True if it is safe to cache this unit.
     cacheable: bool = False
 
+    # True if any query in this unit is volatile, i.e. its result
+    # may differ between executions even if the data does not change
+    # (e.g. it calls random() or datetime_current()).  Results of such
+    # units must never be cached.
+    is_volatile: bool = False
+
     # If non-None, contains a name of the DB that is about to be
     # created/deleted. If it's the former, the IO process needs to
     # introspect the new db. If it's the later, the server should
@@ -269,10 +277,20 @@ class QueryUnit:
     # after the command is run. The schema is pickled.
     global_schema: Optional[bytes] = None
 
+    # Protocol messages describing this unit, encoded by the binary
+    # protocol the first time they are sent; keyed by message type
+    # and whether the protocol version has headers in them.
+    encoded_msgs: Optional[Dict[Tuple[int, bool], bytes]] = (
+        dataclasses.field(default=None, compare=False, repr=False))
+
     @property
     def has_ddl(self) -> bool:
         return bool(self.capabilities & enums.Capability.DDL)
 
+    @property
+    def has_dml(self) -> bool:
+        return bool(self.capabilities & enums.Capability.MODIFICATIONS)
+
 
 #############################
 
@@ -20,7 +20,9 @@
 from __future__ import annotations
 
 import asyncio
+import collections
 import os
+import pickle
 import socket
 import struct
 import typing
@@ -29,32 +31,145 @@ import typing
 _uint64_unpacker = struct.Struct('!Q').unpack
 _uint64_packer = struct.Struct('!Q').pack
 
+# The size of the reads of messages that have not started yet, or of
+# their length headers.
+_READ_SIZE = 64 * 1024
+
+# Byte strings at least this large, like pickled schemas, compiler
+# states and the SQL of big migrations, are sent out of band.
+_OOB_BUFFER_MIN_SIZE = 64 * 1024
+
+Payload = typing.Union[
+    bytes, bytearray, memoryview, typing.Sequence[memoryview]]
+
+
+def out_of_band(data):
+    """Mark *data* to be sent out of band by dumps() if it is large.
+
+    Only the call and reply arguments built right before they are sent
+    should be marked, as the returned buffer can only be pickled with
+    protocol 5.  They are unpickled as bytes by loads().
+    """
+    if isinstance(data, bytes) and len(data) >= _OOB_BUFFER_MIN_SIZE:
+        return pickle.PickleBuffer(data)
+    return data
+
+
+def dumps(obj) -> typing.List[memoryview]:
+    """Pickle *obj* into the buffers of a message payload.
+
+    The byte strings in *obj* marked with out_of_band() are passed
+    along as out-of-band buffers of pickle protocol 5, and are not
+    copied into the pickle.
+    """
+    buffers = []
+    raw = [memoryview(
+        pickle.dumps(obj, protocol=5, buffer_callback=buffers.append))]
+    raw.extend(buf.raw() for buf in buffers)
+    header = struct.pack(
+        f'!{len(raw) + 1}Q', len(raw), *(buf.nbytes for buf in raw))
+    return [memoryview(header), *raw]
+
+
+def loads(data):
+    """Unpickle an object from a payload made by dumps()."""
+    view = memoryview(data)
+    count = _uint64_unpacker(view[:8])[0]
+    sizes = struct.unpack_from(f'!{count}Q', view, 8)
+    pos = 8 * (count + 1)
+    parts = []
+    for size in sizes:
+        parts.append(view[pos:pos + size])
+        pos += size
+    # The out-of-band buffers are copied once, so that the values
+    # are bytes again and don't keep the whole message alive.
+    return pickle.loads(
+        parts[0], buffers=[bytes(part) for part in parts[1:]])
+
+
+def _frame(req_id: int, payload: Payload) -> typing.List[memoryview]:
+    if isinstance(payload, (bytes, bytearray, memoryview)):
+        payload = [memoryview(payload)]
+    size = sum(buf.nbytes for buf in payload)
+    return [
+        memoryview(_uint64_packer(size + 8)),
+        memoryview(_uint64_packer(req_id)),
+        *payload,
+    ]
+
 
 class MessageStream:
-    """Data stream that yields messages."""
+    """Data stream that yields messages.
+
+    Messages are yielded as memoryviews.  A message received within
+    a single chunk of data is a slice of that chunk, and a longer one
+    is collected into a buffer allocated for it once its length is
+    known, so every byte is copied at most once.  The fed data must
+    not be modified afterwards.
+    """
 
     def __init__(self):
-        self._buffer = b''
-        self._curmsg_len = -1
+        self._header = bytearray()
+        self._msg = None
+        self._msg_pos = 0
 
     def feed_data(self, data):
-        # TODO: rewrite to avoid buffer copies.
-        self._buffer += data
-        while self._buffer:
-            if self._curmsg_len == -1:
-                if len(self._buffer) >= 8:
-                    self._curmsg_len = _uint64_unpacker(self._buffer[:8])[0]
-                    self._buffer = self._buffer[8:]
+        view = memoryview(data)
+        pos = 0
+        end = len(view)
+        while pos < end:
+            if self._msg is None:
+                if self._header or end - pos < 8:
+                    take = min(8 - len(self._header), end - pos)
+                    self._header += view[pos:pos + take]
+                    pos += take
+                    if len(self._header) < 8:
+                        return
+                    msg_len = _uint64_unpacker(self._header)[0]
+                    self._header.clear()
                 else:
-                    return
-
-            if self._curmsg_len > 0 and len(self._buffer) >= self._curmsg_len:
-                msg = self._buffer[:self._curmsg_len]
-                self._buffer = self._buffer[self._curmsg_len:]
-                self._curmsg_len = -1
+                    msg_len = _uint64_unpacker(view[pos:pos + 8])[0]
+                    pos += 8
+
+                if end - pos >= msg_len:
+                    pos += msg_len
+                    yield view[pos - msg_len:pos]
+                    continue
+
+                self._msg = memoryview(bytearray(msg_len))
+                self._msg_pos = 0
+
+            take = min(len(self._msg) - self._msg_pos, end - pos)
+            self._msg[self._msg_pos:self._msg_pos + take] = (
+                view[pos:pos + take])
+            pos += take
+            msg = self.buffer_updated(take)
+            if msg is not None:
                 yield msg
-            else:
-                return
+
+    def get_buffer(self):
+        """Return the unfilled part of the message being received.
+
+        Returns None if the length of the next message is not known
+        yet.  The data received into the buffer must be reported to
+        buffer_updated().
+        """
+        if self._msg is None:
+            return None
+        return self._msg[self._msg_pos:]
+
+    def buffer_updated(self, nbytes):
+        """Account for *nbytes* received into the get_buffer() buffer.
+
+        Returns the message if it is complete now, or None otherwise.
+        """
+        self._msg_pos += nbytes
+        if self._msg_pos < len(self._msg):
+            return None
+        msg = self._msg
+        self._msg = None
+        self._msg_pos = 0
+        return msg
 
 
 class HubProtocol(asyncio.Protocol):
@@ -65,7 +180,7 @@ class HubProtocol(asyncio.Protocol):
         self._transport = None
         self._closed = False
         self._stream = MessageStream()
-        self._resp_waiter = None
+        self._resp_waiters = collections.deque()
         self._resp_expected_id = -1
         self._on_pid = on_pid
         self._on_connection_lost = on_connection_lost
@@ -74,14 +189,22 @@ class HubProtocol(asyncio.Protocol):
     def connection_made(self, tr):
         self._transport = tr
 
-    def send(self, req_id: int, waiter: asyncio.Future, payload: bytes):
-        if self._resp_waiter is not None and not self._resp_waiter.done():
+    def send(self, req_id: int, waiter: asyncio.Future, payload: Payload):
+        self.send_multi(req_id, (waiter,), payload)
+
+    def send_multi(
+        self,
+        req_id: int,
+        waiters: typing.Iterable[asyncio.Future],
+        payload: Payload,
+    ):
+        # Send a request the worker replies to with as many messages
+        # as there are *waiters*; the replies are delivered in order.
+        if any(not w.done() for w in self._resp_waiters):
             raise RuntimeError('FramedProtocol: another send() is in progress')
-        self._resp_waiter = waiter
+        self._resp_waiters = collections.deque(waiters)
         self._resp_expected_id = req_id
-        self._transport.writelines(
-            (_uint64_packer(len(payload) + 8), _uint64_packer(req_id), payload)
-        )
+        self._transport.writelines(_frame(req_id, payload))
 
     def process_message(self, msg):
         msgview = memoryview(msg)
@@ -89,9 +212,11 @@ class HubProtocol(asyncio.Protocol):
         if req_id != self._resp_expected_id:
             # This could have happened if the previous request got cancelled.
             return
-        if self._resp_waiter is not None and not self._resp_waiter.done():
-            self._resp_waiter.set_result(msgview[8:])
-            self._resp_waiter = None
+        if self._resp_waiters:
+            waiter = self._resp_waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(msgview[8:])
+        if not self._resp_waiters:
             self._resp_expected_id = -1
 
     def data_received(self, data):
@@ -107,13 +232,15 @@ class HubProtocol(asyncio.Protocol):
     def connection_lost(self, exc):
         self._closed = True
 
-        if self._resp_waiter is not None:
+        waiters, self._resp_waiters = self._resp_waiters, collections.deque()
+        for waiter in waiters:
+            if waiter.done():
+                continue
             if exc is not None:
-                self._resp_waiter.set_exception(exc)
+                waiter.set_exception(exc)
             else:
-                self._resp_waiter.set_exception(ConnectionError(
+                waiter.set_exception(ConnectionError(
                     'lost connection to the worker during a call'))
-            self._resp_waiter = None
 
         self._on_connection_lost(self._pid)
 
@@ -132,7 +259,7 @@ class HubConnection:
     def is_closed(self):
         return self._protocol._closed
 
-    async def request(self, data: bytes) -> bytes:
+    async def request(self, data: Payload) -> memoryview:
         self._req_id_cnt += 1
         req_id = self._req_id_cnt
 
@@ -140,6 +267,23 @@ class HubConnection:
         self._protocol.send(req_id, waiter, data)
         return await waiter
 
+    def request_multi(
+        self,
+        data: Payload,
+        num_replies: int,
+    ) -> typing.List[asyncio.Future]:
+        """Send a request the worker replies to with *num_replies* messages.
+
+        Returns a future for every reply; they are resolved as the
+        replies arrive.
+        """
+        self._req_id_cnt += 1
+        req_id = self._req_id_cnt
+
+        waiters = [self._loop.create_future() for _ in range(num_replies)]
+        self._protocol.send_multi(req_id, waiters, data)
+        return waiters
+
     def abort(self):
         self._aborted = True
         self._transport.abort()
@@ -161,26 +305,38 @@ class WorkerConnection:
         req_id = _uint64_unpacker(msgview[:8])[0]
         return req_id, msgview[8:]
 
-    def reply(self, req_id, payload):
-        self._sock.sendall(
-            b"".join(
-                (
-                    _uint64_packer(len(payload) + 8),
-                    _uint64_packer(req_id),
-                    payload,
-                )
-            )
-        )
+    def reply(self, req_id: int, payload: Payload):
+        # Send the parts with one system call without joining them.
+        bufs = _frame(req_id, payload)
+        while bufs:
+            sent = self._sock.sendmsg(bufs)
+            while bufs and sent >= len(bufs[0]):
+                sent -= len(bufs[0])
+                bufs.pop(0)
+            if sent:
+                bufs[0] = bufs[0][sent:]
 
     def iter_request(self):
-        while True:
-            data = b'' if self._sock is None else self._sock.recv(4096)
+        while self._sock is not None:
+            # Receive the rest of a long message right into its buffer.
+            buf = self._stream.get_buffer()
+            if buf is not None:
+                nbytes = self._sock.recv_into(buf)
+                if not nbytes:
+                    break
+                msg = self._stream.buffer_updated(nbytes)
+                if msg is not None:
+                    yield self._on_message(msg)
+                continue
+
+            data = self._sock.recv(_READ_SIZE)
             if not data:
-                # EOF received - abort
-                self.abort()
-                return
+                break
             yield from map(self._on_message, self._stream.feed_data(data))
 
+        # EOF received - abort
+        self.abort()
+
     def abort(self):
         if self._sock is not None:
             self._sock.close()
@@ -21,6 +21,7 @@ from __future__ import annotations
 from typing import *  # NoQA
 
 import asyncio
+import collections
 import functools
 import logging
 import os
@@ -51,6 +52,11 @@ PROCESS_INITIAL_RESPONSE_TIMEOUT: float = 60.0
 KILL_TIMEOUT: float = 10.0
 ADAPTIVE_SCALE_UP_WAIT_TIME: float = 3.0
 ADAPTIVE_SCALE_DOWN_WAIT_TIME: float = 60.0
+# When every worker is busy, how long a compile request may keep its
+# place in the queue waiting for a worker that already has the schema
+# of the target database, letting the other workers go to the requests
+# behind it.
+AFFINITY_WAIT_TIME: float = 0.02
 WORKER_MOD: str = __name__.rpartition('.')[0] + '.worker'
 
 
@@ -69,6 +75,170 @@ def _pickle_memoized(schema):
     return pickle.dumps(schema, -1)
 
 
+@functools.lru_cache()
+def _pickle_schema_diff_memoized(base, schema):
+    diff = schema.get_diff(base)
+    max_size = len(schema._id_to_data) * defines.COMPILER_SCHEMA_DIFF_MAX_RATIO
+    if diff.get_size() > max_size:
+        # Unpickling the whole schema is cheaper than applying
+        # a diff this large.
+        return None
+    return state.SchemaDiff(
+        base_generation=base._generation,
+        data=pickle.dumps(diff, -1),
+    )
+
+
+def _send_out_of_band(arg):
+    # The schema pickles are not copied into the pickle of the call.
+    if isinstance(arg, state.SchemaDiff):
+        return arg._replace(data=amsg.out_of_band(arg.data))
+    else:
+        return amsg.out_of_band(arg)
+
+
+class _SharedPickleEntry:
+
+    def __init__(
+        self,
+        obj: Any,
+        write: asyncio.Task[state.SharedPickle],
+    ) -> None:
+        self.obj = obj
+        self.write = write
+        # The number of in-flight calls using the file.
+        self.pins = 0
+        # Whether the entry is still reachable by its key.
+        self.current = True
+
+
+class SharedPickles:
+    """Schema pickles written once to files mmap()-ed by the workers.
+
+    Instead of pushing a multi-megabyte schema pickle through the IPC
+    socket to every worker, each schema generation is pickled into a
+    file in the runstate directory once, and workers only receive a
+    small `state.SharedPickle` reference to it.  The files are written
+    in the default executor, so that the event loop is not blocked on
+    the disk after every DDL.
+
+    Entries are keyed by the database name and the schema generation.
+    If a key comes to name another schema, e.g. of a database that was
+    recreated, its entry is replaced, and the old file is removed once
+    the calls using it release it.
+
+    A file is kept for as long as its entry is among the *maxsize*
+    most recently used ones, or is pinned by an in-flight worker call.
+    """
+
+    def __init__(self, dirname: str, *, maxsize: int) -> None:
+        self._dirname = dirname
+        self._maxsize = maxsize
+        self._counter = 0
+        self._entries: collections.OrderedDict[
+            Hashable, _SharedPickleEntry] = collections.OrderedDict()
+        # Shared pickle path -> entry, for the calls to release().
+        self._files: Dict[str, _SharedPickleEntry] = {}
+
+    async def acquire(self, key: Hashable, obj: Any) -> state.SharedPickle:
+        entry = self._entries.get(key)
+        if entry is not None and entry.obj is not obj:
+            del self._entries[key]
+            self._retire(entry)
+            entry = None
+        if entry is None:
+            entry = _SharedPickleEntry(
+                obj, asyncio.create_task(self._write(obj)))
+            self._entries[key] = entry
+        else:
+            self._entries.move_to_end(key)
+        entry.pins += 1
+
+        write = entry.write
+        try:
+            # Concurrent calls with the same schema share the write,
+            # which is not interrupted if one of them is cancelled.
+            ref = await asyncio.shield(write)
+        except BaseException:
+            if (
+                write.done()
+                and (write.cancelled() or write.exception() is not None)
+                and self._entries.get(key) is entry
+            ):
+                del self._entries[key]
+                entry.current = False
+            self._unpin(entry)
+            raise
+
+        self._files[ref.path] = entry
+        return ref
+
+    def release(self, ref: state.SharedPickle) -> None:
+        entry = self._files.get(ref.path)
+        if entry is not None:
+            self._unpin(entry)
+
+    def clear(self) -> None:
+        entries, self._entries = self._entries, collections.OrderedDict()
+        for entry in entries.values():
+            self._retire(entry)
+
+    async def _write(self, obj: Any) -> state.SharedPickle:
+        data = pickle.dumps(obj, -1)
+        self._counter += 1
+        path = os.path.join(self._dirname, f'schema-{self._counter}.pickle')
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, _write_file, path, data)
+        return state.SharedPickle(path, len(data))
+
+    def _unpin(self, entry: _SharedPickleEntry) -> None:
+        entry.pins -= 1
+        if entry.current:
+            self._evict()
+        elif not entry.pins:
+            self._unlink(entry)
+
+    def _retire(self, entry: _SharedPickleEntry) -> None:
+        # The entry is no longer reachable by its key; its file is
+        # removed as soon as no call uses it.
+        entry.current = False
+        if not entry.pins:
+            self._unlink(entry)
+
+    def _evict(self) -> None:
+        excess = len(self._entries) - self._maxsize
+        if excess <= 0:
+            return
+        for key, entry in list(self._entries.items()):
+            # Writes still in progress are pinned by their callers.
+            if not entry.pins and entry.write.done():
+                del self._entries[key]
+                self._retire(entry)
+                excess -= 1
+                if not excess:
+                    break
+
+    def _unlink(self, entry: _SharedPickleEntry) -> None:
+        write = entry.write
+        if not write.done():
+            write.add_done_callback(lambda _: self._unlink(entry))
+            return
+        if write.cancelled() or write.exception() is not None:
+            return
+        path = write.result().path
+        if self._files.get(path) is entry:
+            del self._files[path]
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+def _write_file(path: str, data: bytes) -> None:
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
 class Worker:
 
     _dbs: state.DatabasesState
@@ -87,6 +257,9 @@ class Worker:
         pid
     ):
         self._dbs = dbs
+        # Databases to drop from the state of the worker process
+        # before it is used again, see `BasePool.forget_db()`.
+        self._dbs_to_forget = set()
         self._pid = pid
 
         self._backend_runtime_params = backend_runtime_params
@@ -110,13 +283,13 @@ class Worker:
 
         await self.call(
             '__init_worker__',
-            init_args_pickled,
+            amsg.out_of_band(init_args_pickled),
         )
 
     def get_pid(self):
         return self._pid
 
-    async def call(self, method_name, *args, sync_state=None):
+    def _check_connection(self):
         assert not self._closed
 
         if self._con.is_closed():
@@ -124,16 +297,43 @@ class Worker:
                 'the connection to the compiler worker process is '
                 'unexpectedly closed')
 
-        msg = pickle.dumps((method_name, args))
+    async def call(self, method_name, *args, sync_state=None):
+        self._check_connection()
+
+        msg = amsg.dumps((method_name, args))
         data = await self._con.request(msg)
-        status, *data = pickle.loads(data)
+        return self._process_result(data, sync_state)
+
+    def call_batch(self, calls):
+        """Send several ``(method_name, args)`` calls in one message.
+
+        The worker runs the calls in order.  Returns a future for the
+        reply to every call; they are resolved as the worker finishes
+        the respective call, and the reply must be passed to
+        process_result().  The caller must cancel the futures it
+        stops waiting for.
+        """
+        self._check_connection()
+
+        msg = amsg.dumps(('__batch__', calls))
+        return self._con.request_multi(msg, len(calls))
+
+    def process_result(self, data):
+        return self._process_result(data, None)
+
+    def _process_result(self, data, sync_state):
+        status, *data = amsg.loads(data)
 
         self._last_used = time.monotonic()
 
         if status == 0:
+            result, stage_timings = data
+            for stage, duration in stage_timings.items():
+                metrics.edgeql_query_compilation_stage_duration.observe(
+                    duration, stage)
             if sync_state is not None:
                 sync_state()
-            return data[0]
+            return result
         elif status == 1:
             exc, tb = data
             if (sync_state is not None and
@@ -176,6 +376,7 @@ class BasePool(amsg.ServerProtocol, asyncio.SubprocessProtocol):
         refl_schema,
         schema_class_layout,
         pool_size,
+        shared_schemas=True,
     ):
         self._loop = loop
         self._dbindex = dbindex
@@ -201,6 +402,21 @@ class BasePool(amsg.ServerProtocol, asyncio.SubprocessProtocol):
         self._server = amsg.Server(self._poolsock_name, loop, self)
         self._ready_evt = asyncio.Event()
 
+        # Compile requests waiting for a worker to be batched to it.
+        self._pending_compiles = []
+        self._compile_batcher = None
+        self._compile_batches = set()
+        # Workers currently dropping database states, see `forget_db()`.
+        self._forgetting_workers = set()
+
+        if shared_schemas:
+            self._shared_pickles = SharedPickles(
+                self._runstate_dir,
+                maxsize=defines.COMPILER_SHARED_SCHEMAS_MAX,
+            )
+        else:
+            self._shared_pickles = None
+
         self._running = None
 
         self._stats_spawned = 0
@@ -349,8 +565,21 @@ class BasePool(amsg.ServerProtocol, asyncio.SubprocessProtocol):
         self._workers_queue = queue.WorkerQueue(self._loop)
         self._workers.clear()
 
+        if self._compile_batcher is not None:
+            self._compile_batcher.cancel()
+        for task in self._compile_batches:
+            task.cancel()
+        for task in self._forgetting_workers:
+            task.cancel()
+        pending, self._pending_compiles = self._pending_compiles, []
+        for fut, *_ in pending:
+            fut.cancel()
+
         await self._stop()
 
+        if self._shared_pickles is not None:
+            self._shared_pickles.clear()
+
     async def _stop(self):
         raise NotImplementedError
 
@@ -369,7 +598,7 @@ class BasePool(amsg.ServerProtocol, asyncio.SubprocessProtocol):
             self._stats_killed,
         )
 
-    def _compute_compile_preargs(
+    async def _compute_compile_preargs(
         self,
         worker,
         dbname,
@@ -378,7 +607,28 @@ class BasePool(amsg.ServerProtocol, asyncio.SubprocessProtocol):
         reflection_cache,
         database_config,
         system_config,
+        *,
+        shared,
     ):
+        # References to the schemas written to shared files are
+        # appended to *shared* as soon as they are acquired; the caller
+        # must pass them to `_release_shared_schemas()` once the worker
+        # call is done, even if this fails.
+
+        async def pickle_schema(schema, base=None, *, dbname=None):
+            if base is not None:
+                # The worker has an older version of this schema,
+                # try to only send it what has changed since.
+                diff = _pickle_schema_diff_memoized(base, schema)
+                if diff is not None:
+                    return diff
+            if self._shared_pickles is None:
+                return _pickle_memoized(schema)
+            else:
+                ref = await self._shared_pickles.acquire(
+                    (dbname, schema._generation), schema)
+                shared.append(ref)
+                return ref
 
         def sync_worker_state_cb(
             *,
@@ -433,9 +683,9 @@ class BasePool(amsg.ServerProtocol, asyncio.SubprocessProtocol):
 
         if worker_db is None:
             preargs += (
-                _pickle_memoized(user_schema),
+                await pickle_schema(user_schema, dbname=dbname),
                 _pickle_memoized(reflection_cache),
-                _pickle_memoized(global_schema),
+                await pickle_schema(global_schema),
                 _pickle_memoized(database_config),
                 _pickle_memoized(system_config),
             )
@@ -449,7 +699,8 @@ class BasePool(amsg.ServerProtocol, asyncio.SubprocessProtocol):
         else:
             if worker_db.user_schema is not user_schema:
                 preargs += (
-                    _pickle_memoized(user_schema),
+                    await pickle_schema(
+                        user_schema, worker_db.user_schema, dbname=dbname),
                 )
                 to_update['user_schema'] = user_schema
             else:
@@ -465,7 +716,8 @@ class BasePool(amsg.ServerProtocol, asyncio.SubprocessProtocol):
 
             if worker._global_schema is not global_schema:
                 preargs += (
-                    _pickle_memoized(global_schema),
+                    await pickle_schema(
+                        global_schema, worker._global_schema),
                 )
                 to_update['global_schema'] = global_schema
             else:
@@ -497,21 +749,91 @@ class BasePool(amsg.ServerProtocol, asyncio.SubprocessProtocol):
         else:
             callback = None
 
-        return preargs, callback
+        return tuple(map(_send_out_of_band, preargs)), callback
 
-    async def _acquire_worker(self, *, condition=None):
+    def _release_shared_schemas(self, shared):
+        if self._shared_pickles is not None:
+            for ref in shared:
+                self._shared_pickles.release(ref)
+
+    async def _acquire_worker(self, *, condition=None, condition_wait=None):
         while (
-            worker := await self._workers_queue.acquire(condition=condition)
+            worker := await self._workers_queue.acquire(
+                condition=condition, condition_wait=condition_wait)
         ).get_pid() not in self._workers:
             # The worker was disconnected; skip to the next one.
             pass
         return worker
 
+    async def _acquire_worker_for_db(self, dbname, user_schema, global_schema):
+        # Prefer the workers that already have the current schema of
+        # the database, so that it doesn't have to be synced again.
+        def has_schema(w):
+            worker_db = w._dbs.get(dbname)
+            return (
+                worker_db is not None
+                and worker_db.user_schema is user_schema
+                and w._global_schema is global_schema
+            )
+
+        if any(has_schema(w) for w in self._workers.values()):
+            condition_wait = AFFINITY_WAIT_TIME
+        else:
+            # Nobody has the schema, waiting won't help.
+            condition_wait = None
+
+        worker = await self._acquire_worker(
+            condition=has_schema, condition_wait=condition_wait)
+
+        if has_schema(worker):
+            metrics.compiler_pool_affinity_hits.inc()
+        else:
+            metrics.compiler_pool_affinity_misses.inc()
+
+        return worker
+
     def _release_worker(self, worker):
         # Skip disconnected workers
-        if worker.get_pid() in self._workers:
+        if worker.get_pid() not in self._workers:
+            return
+        if worker._dbs_to_forget:
+            # Keep the worker until it has dropped the databases, so
+            # that nobody syncs them to it in the meantime.
+            task = self._loop.create_task(self._forget_dbs(worker))
+            self._forgetting_workers.add(task)
+            task.add_done_callback(self._forgetting_workers.discard)
+        else:
             self._workers_queue.release(worker)
 
+    def forget_db(self, dbname):
+        """Make the workers drop their copy of the *dbname* state.
+
+        The idle workers do it right away, the busy ones once they
+        are released.
+        """
+        for worker in list(self._workers.values()):
+            if dbname not in worker._dbs:
+                continue
+            worker._dbs_to_forget.add(dbname)
+            if self._workers_queue.remove(worker):
+                self._release_worker(worker)
+
+    async def _forget_dbs(self, worker):
+        dbnames = tuple(worker._dbs_to_forget)
+        worker._dbs_to_forget.clear()
+        try:
+            await worker.call('__forget_dbs__', dbnames)
+        except Exception:
+            # We don't know what the worker has now, make the next
+            # compilation sync everything.
+            worker._dbs = immutables.Map()
+            logger.exception('could not drop database states in a worker')
+        else:
+            for dbname in dbnames:
+                if dbname in worker._dbs:
+                    worker._dbs = worker._dbs.delete(dbname)
+        self._release_worker(worker)
+
     async def compile(
         self,
         dbname,
@@ -522,9 +844,37 @@ class BasePool(amsg.ServerProtocol, asyncio.SubprocessProtocol):
         system_config,
         *compile_args
     ):
-        worker = await self._acquire_worker()
+        if self._workers_queue.qsize() == 0:
+            # All workers are busy; wait for one along with the other
+            # requests and have it compile them all in one go.
+            fut = self._loop.create_future()
+            self._pending_compiles.append((
+                fut,
+                (
+                    dbname,
+                    user_schema,
+                    global_schema,
+                    reflection_cache,
+                    database_config,
+                    system_config,
+                ),
+                compile_args,
+                time.monotonic(),
+            ))
+            if self._compile_batcher is None:
+                self._compile_batcher = self._loop.create_task(
+                    self._run_compile_batcher())
+            return await fut
+
+        started_at = time.monotonic()
+        worker = await self._acquire_worker_for_db(
+            dbname, user_schema, global_schema)
+        metrics.edgeql_query_compilation_stage_duration.observe(
+            time.monotonic() - started_at, 'queue')
+        shared = []
         try:
-            preargs, sync_state = self._compute_compile_preargs(
+            started_at = time.monotonic()
+            preargs, sync_state = await self._compute_compile_preargs(
                 worker,
                 dbname,
                 user_schema,
@@ -532,7 +882,10 @@ class BasePool(amsg.ServerProtocol, asyncio.SubprocessProtocol):
                 reflection_cache,
                 database_config,
                 system_config,
+                shared=shared,
             )
+            metrics.edgeql_query_compilation_stage_duration.observe(
+                time.monotonic() - started_at, 'state_pickle')
 
             units, state_ = await worker.call(
                 'compile',
@@ -544,6 +897,111 @@ class BasePool(amsg.ServerProtocol, asyncio.SubprocessProtocol):
             return units, state_
 
         finally:
+            self._release_shared_schemas(shared)
+            self._release_worker(worker)
+
+    async def _run_compile_batcher(self):
+        try:
+            while self._pending_compiles:
+                _, (dbname, user_schema, global_schema, *_), _, _ = (
+                    self._pending_compiles[0])
+                worker = await self._acquire_worker_for_db(
+                    dbname, user_schema, global_schema)
+                batch = self._take_compile_batch()
+                if batch:
+                    task = self._loop.create_task(
+                        self._compile_batch(worker, batch))
+                    self._compile_batches.add(task)
+                    task.add_done_callback(self._compile_batches.discard)
+                else:
+                    self._release_worker(worker)
+        finally:
+            self._compile_batcher = None
+
+    def _take_compile_batch(self):
+        # Take the oldest pending request along with the ones against
+        # the same schema, so that the worker is synced at most once.
+        batch = []
+        rest = []
+        key = None
+        for item in self._pending_compiles:
+            fut, sync_args, _, _ = item
+            if fut.done():
+                # Cancelled while waiting.
+                continue
+            if key is None:
+                key = sync_args[:3]
+            if (
+                len(batch) < defines.COMPILER_BATCH_MAX_SIZE
+                and sync_args[0] == key[0]
+                and sync_args[1] is key[1]
+                and sync_args[2] is key[2]
+            ):
+                batch.append(item)
+            else:
+                rest.append(item)
+        self._pending_compiles = rest
+        return batch
+
+    async def _compile_batch(self, worker, batch):
+        shared = []
+        sync_failed = False
+        waiters = ()
+        try:
+            calls = []
+            started_at = time.monotonic()
+            for _, sync_args, compile_args, queued_at in batch:
+                metrics.edgeql_query_compilation_stage_duration.observe(
+                    started_at - queued_at, 'queue')
+                preargs, sync_state = await self._compute_compile_preargs(
+                    worker, *sync_args, shared=shared)
+                if sync_state is not None:
+                    # The worker runs the calls in order, so the calls
+                    # after this one don't have to sync this state again.
+                    # If the sync fails, the rest of the batch fails too.
+                    sync_state()
+                calls.append(('compile', (*preargs, *compile_args)))
+            metrics.edgeql_query_compilation_stage_duration.observe(
+                time.monotonic() - started_at, 'state_pickle')
+
+            waiters = worker.call_batch(calls)
+            for (fut, *_), waiter in zip(batch, waiters):
+                data = await waiter
+                try:
+                    units, state_ = worker.process_result(data)
+                except Exception as ex:
+                    if isinstance(ex, state.FailedStateSync):
+                        sync_failed = True
+                    if not fut.done():
+                        fut.set_exception(ex)
+                else:
+                    worker._last_pickled_state = state_
+                    if not fut.done():
+                        fut.set_result((units, state_))
+
+        except asyncio.CancelledError:
+            # The worker goes on with the calls we no longer wait for.
+            sync_failed = True
+            for fut, *_ in batch:
+                fut.cancel()
+            raise
+
+        except Exception as ex:
+            sync_failed = True
+            for fut, *_ in batch:
+                if not fut.done():
+                    fut.set_exception(ex)
+
+        finally:
+            # Drop the replies we won't wait for; the stale ones are
+            # ignored when they arrive.
+            for waiter in waiters:
+                waiter.cancel()
+            if sync_failed:
+                # We don't know what state the worker is in anymore,
+                # make sure the next call sends it everything.
+                worker._dbs = immutables.Map()
+            self._release_shared_schemas(shared)
             self._release_worker(worker)
 
     async def compile_in_tx(self, txid, pickled_state, *compile_args):
@@ -582,7 +1040,7 @@ class BasePool(amsg.ServerProtocol, asyncio.SubprocessProtocol):
         try:
             units, new_pickled_state = await worker.call(
                 'compile_in_tx',
-                pickled_state,
+                amsg.out_of_band(pickled_state),
                 txid,
                 *compile_args
             )
@@ -606,9 +1064,11 @@ class BasePool(amsg.ServerProtocol, asyncio.SubprocessProtocol):
         system_config,
         *compile_args
     ):
-        worker = await self._acquire_worker()
+        worker = await self._acquire_worker_for_db(
+            dbname, user_schema, global_schema)
+        shared = []
         try:
-            preargs, sync_state = self._compute_compile_preargs(
+            preargs, sync_state = await self._compute_compile_preargs(
                 worker,
                 dbname,
                 user_schema,
@@ -616,6 +1076,7 @@ class BasePool(amsg.ServerProtocol, asyncio.SubprocessProtocol):
                 reflection_cache,
                 database_config,
                 system_config,
+                shared=shared,
             )
 
             return await worker.call(
@@ -626,6 +1087,7 @@ class BasePool(amsg.ServerProtocol, asyncio.SubprocessProtocol):
             )
 
         finally:
+            self._release_shared_schemas(shared)
             self._release_worker(worker)
 
     async def try_compile_rollback(
@@ -653,9 +1115,11 @@ class BasePool(amsg.ServerProtocol, asyncio.SubprocessProtocol):
         system_config,
         *compile_args
     ):
-        worker = await self._acquire_worker()
+        worker = await self._acquire_worker_for_db(
+            dbname, user_schema, global_schema)
+        shared = []
         try:
-            preargs, sync_state = self._compute_compile_preargs(
+            preargs, sync_state = await self._compute_compile_preargs(
                 worker,
                 dbname,
                 user_schema,
@@ -663,6 +1127,7 @@ class BasePool(amsg.ServerProtocol, asyncio.SubprocessProtocol):
                 reflection_cache,
                 database_config,
                 system_config,
+                shared=shared,
             )
 
             return await worker.call(
@@ -673,6 +1138,7 @@ class BasePool(amsg.ServerProtocol, asyncio.SubprocessProtocol):
             )
 
         finally:
+            self._release_shared_schemas(shared)
             self._release_worker(worker)
 
     async def describe_database_dump(
@@ -807,7 +1273,7 @@ class SimpleAdaptivePool(BasePool):
         for transport in transports.values():
             await transport._wait()
 
-    async def _acquire_worker(self, *, condition=None):
+    async def _acquire_worker(self, *, condition=None, condition_wait=None):
         if (
             self._running and
             self._scale_up_handle is None
@@ -826,7 +1292,8 @@ class SimpleAdaptivePool(BasePool):
         if self._scale_down_handle is not None:
             self._scale_down_handle.cancel()
             self._scale_down_handle = None
-        return await super()._acquire_worker(condition=condition)
+        return await super()._acquire_worker(
+            condition=condition, condition_wait=condition_wait)
 
     def _release_worker(self, worker):
         if self._scale_down_handle is not None:
@@ -917,6 +1384,7 @@ async def create_compiler_pool(
     refl_schema,
     schema_class_layout,
     pool_class=FixedPool,
+    shared_schemas: bool = True,
 ) -> BasePool:
     assert issubclass(pool_class, BasePool)
     loop = asyncio.get_running_loop()
@@ -929,6 +1397,7 @@ async def create_compiler_pool(
         refl_schema=refl_schema,
         schema_class_layout=schema_class_layout,
         dbindex=dbindex,
+        shared_schemas=shared_schemas,
     )
 
     await pool.start()
@@ -33,11 +33,26 @@ class _AcquireCondition(typing.Protocol[W2]):
         pass
 
 
+class _Waiter(typing.Generic[W]):
+
+    def __init__(
+        self,
+        fut: asyncio.Future[None],
+        condition: typing.Optional[_AcquireCondition[W]],
+        deadline: typing.Optional[float],
+    ) -> None:
+        self.fut = fut
+        self.condition = condition
+        # Until when the waiter only takes a worker satisfying
+        # *condition*.
+        self.deadline = deadline
+
+
 class WorkerQueue(typing.Generic[W]):
 
     loop: asyncio.AbstractEventLoop
 
-    _waiters: typing.Deque[asyncio.Future[None]]
+    _waiters: typing.Deque[_Waiter[W]]
     _queue: typing.Deque[W]
 
     def __init__(
@@ -51,52 +66,90 @@ class WorkerQueue(typing.Generic[W]):
     async def acquire(
         self,
         *,
-        condition: typing.Optional[_AcquireCondition[W]]=None
+        condition: typing.Optional[_AcquireCondition[W]]=None,
+        condition_wait: typing.Optional[float]=None,
     ) -> W:
+        # If *condition* is given, prefer a worker satisfying it.  If
+        # every worker is busy and *condition_wait* is given, wait for
+        # up to that many seconds for one satisfying it to be released;
+        # the other workers released in the meantime go to the waiters
+        # behind, and this one keeps its place in the waiters queue.
         # There can be a race between a waiter scheduled for to wake up
         # and a worker being stolen (due to quota being enforced,
         # for example).  In which case the waiter might get finally
         # woken up with an empty queue -- hence we use a `while` loop here.
-        attempts = 0
-        while not self._queue:
-            waiter = self._loop.create_future()
-
-            attempts += 1
-            if attempts > 1:
-                # If the waiter was woken up only to discover that
-                # it needs to wait again, we don't want it to lose
-                # its place in the waiters queue.
-                self._waiters.appendleft(waiter)
-            else:
-                # On the first attempt the waiter goes to the end
-                # of the waiters queue.
-                self._waiters.append(waiter)
-
-            try:
-                await waiter
-            except Exception:
-                if not waiter.done():
-                    waiter.cancel()
+        if condition is not None and condition_wait and not self._queue:
+            deadline = self._loop.time() + condition_wait
+        else:
+            deadline = None
+
+        worker = self._take(condition, deadline)
+        if worker is not None:
+            return worker
+
+        waiter = _Waiter(self._loop.create_future(), condition, deadline)
+        # The waiter stays in the waiters queue until it gets a worker,
+        # so it never loses its place when woken up in vain.
+        self._waiters.append(waiter)
+        if deadline is not None:
+            timer = self._loop.call_at(
+                deadline, self._wakeup_expired_waiter, waiter)
+        else:
+            timer = None
+        try:
+            while True:
                 try:
-                    self._waiters.remove(waiter)
-                except ValueError:
-                    # The waiter could be removed from self._waiters
-                    # by a previous release() call.
-                    pass
-                if self._queue and not waiter.cancelled():
-                    # We were woken up by release(), but can't take
-                    # the call.  Wake up the next in line.
-                    self._wakeup_next_waiter()
-                raise
-
-        if condition is not None and len(self._queue) > 1:
+                    await waiter.fut
+                except BaseException:
+                    if (
+                        waiter.fut.done()
+                        and not waiter.fut.cancelled()
+                        and self._queue
+                    ):
+                        # We were woken up by release(), but can't take
+                        # the worker.  Wake up the next in line.
+                        self._waiters.remove(waiter)
+                        waiter = None
+                        self._wakeup_next_waiter()
+                    raise
+
+                worker = self._take(condition, deadline)
+                if worker is not None:
+                    return worker
+                waiter.fut = self._loop.create_future()
+                # The worker we were woken up for was taken, the others
+                # might do for the waiters behind.
+                self._wakeup_next_waiter()
+        finally:
+            if timer is not None:
+                timer.cancel()
+            if waiter is not None:
+                self._waiters.remove(waiter)
+
+    def _take(
+        self,
+        condition: typing.Optional[_AcquireCondition[W]],
+        deadline: typing.Optional[float],
+    ) -> typing.Optional[W]:
+        if not self._queue:
+            return None
+        if condition is not None:
             for w in self._queue:
                 if condition(w):
                     self._queue.remove(w)
                     return w
-
+            if deadline is not None and self._loop.time() < deadline:
+                return None
         return self._queue.popleft()
 
+    def _accepts_idle_worker(self, waiter: _Waiter[W]) -> bool:
+        return (
+            waiter.condition is None
+            or waiter.deadline is None
+            or waiter.deadline <= self._loop.time()
+            or any(waiter.condition(w) for w in self._queue)
+        )
+
     def release(self, worker: W, *, put_in_front: bool=True) -> None:
         if put_in_front:
             self._queue.appendleft(worker)
@@ -104,6 +157,14 @@ class WorkerQueue(typing.Generic[W]):
             self._queue.append(worker)
         self._wakeup_next_waiter()
 
+    def remove(self, worker: W) -> bool:
+        # Take *worker* out of the queue if it is idle.
+        try:
+            self._queue.remove(worker)
+        except ValueError:
+            return False
+        return True
+
     def qsize(self) -> int:
         return len(self._queue)
 
@@ -111,8 +172,15 @@ class WorkerQueue(typing.Generic[W]):
         return len(self._waiters)
 
     def _wakeup_next_waiter(self) -> None:
-        while self._waiters:
-            waiter = self._waiters.popleft()
-            if not waiter.done():
-                waiter.set_result(None)
+        # Wake up the first waiter that takes one of the idle workers,
+        # passing over the ones that still wait for another worker.
+        for waiter in self._waiters:
+            if not waiter.fut.done() and self._accepts_idle_worker(waiter):
+                waiter.fut.set_result(None)
                 break
+
+    def _wakeup_expired_waiter(self, waiter: _Waiter[W]) -> None:
+        # The waiter now takes any worker, including the idle ones
+        # it passed over.
+        if self._queue and not waiter.fut.done():
+            waiter.fut.set_result(None)
@@ -17,6 +17,8 @@
 #
 
 
+import mmap
+import pickle
 import typing
 
 import immutables
@@ -38,6 +40,55 @@ class DatabaseState(typing.NamedTuple):
 DatabasesState = immutables.Map[str, DatabaseState]
 
 
+class SharedPickle(typing.NamedTuple):
+    """A reference to a pickle written to a file shared by all workers."""
+
+    path: str
+    size: int
+
+    def load(self) -> typing.Any:
+        with open(self.path, 'rb') as f:
+            with mmap.mmap(
+                f.fileno(), self.size, access=mmap.ACCESS_READ
+            ) as buf:
+                return pickle.loads(buf)
+
+
+PickledObject = typing.Union[bytes, SharedPickle]
+
+
+def unpickle(data: PickledObject) -> typing.Any:
+    if isinstance(data, SharedPickle):
+        return data.load()
+    else:
+        return pickle.loads(data)
+
+
+class SchemaDiff(typing.NamedTuple):
+    """A pickled diff against the schema the worker already has."""
+
+    base_generation: int
+    data: bytes
+
+
+PickledSchema = typing.Union[PickledObject, SchemaDiff]
+
+
+def unpickle_schema(
+    data: PickledSchema,
+    base: typing.Optional[schema.FlatSchema],
+) -> schema.FlatSchema:
+    if isinstance(data, SchemaDiff):
+        if base is None or base._generation != data.base_generation:
+            raise FailedStateSync(
+                f'cannot apply schema diff: expected generation '
+                f'{data.base_generation}, have '
+                f'{base._generation if base is not None else None}')
+        return base.apply_diff(pickle.loads(data.data))
+    else:
+        return unpickle(data)
+
+
 class FailedStateSync(Exception):
     pass
 
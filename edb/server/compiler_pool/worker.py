@@ -102,25 +102,26 @@ def __init_worker__(
 
 def __sync__(
     dbname: str,
-    user_schema: Optional[bytes],
-    reflection_cache: Optional[bytes],
-    global_schema: Optional[bytes],
-    database_config: Optional[bytes],
-    system_config: Optional[bytes],
+    user_schema: Optional[state.PickledSchema],
+    reflection_cache: Optional[state.PickledObject],
+    global_schema: Optional[state.PickledSchema],
+    database_config: Optional[state.PickledObject],
+    system_config: Optional[state.PickledObject],
 ) -> state.DatabaseState:
     global DBS
     global GLOBAL_SCHEMA
     global INSTANCE_CONFIG
 
+    started_at = time.monotonic()
     try:
         db = DBS.get(dbname)
         if db is None:
             assert user_schema is not None
             assert reflection_cache is not None
             assert database_config is not None
-            user_schema_unpacked = pickle.loads(user_schema)
-            reflection_cache_unpacked = pickle.loads(reflection_cache)
-            database_config_unpacked = pickle.loads(database_config)
+            user_schema_unpacked = state.unpickle(user_schema)
+            reflection_cache_unpacked = state.unpickle(reflection_cache)
+            database_config_unpacked = state.unpickle(database_config)
             db = state.DatabaseState(
                 dbname,
                 user_schema_unpacked,
@@ -132,36 +133,61 @@ def __sync__(
             updates = {}
 
             if user_schema is not None:
-                updates['user_schema'] = pickle.loads(user_schema)
+                updates['user_schema'] = state.unpickle_schema(
+                    user_schema, db.user_schema)
             if reflection_cache is not None:
-                updates['reflection_cache'] = pickle.loads(reflection_cache)
+                updates['reflection_cache'] = state.unpickle(reflection_cache)
             if database_config is not None:
-                updates['database_config'] = pickle.loads(database_config)
+                updates['database_config'] = state.unpickle(database_config)
 
             if updates:
                 db = db._replace(**updates)
                 DBS = DBS.set(dbname, db)
 
         if global_schema is not None:
-            GLOBAL_SCHEMA = pickle.loads(global_schema)
+            GLOBAL_SCHEMA = state.unpickle_schema(
+                global_schema, GLOBAL_SCHEMA)
 
         if system_config is not None:
-            INSTANCE_CONFIG = pickle.loads(system_config)
+            INSTANCE_CONFIG = state.unpickle(system_config)
 
     except Exception as ex:
         raise state.FailedStateSync(
             f'failed to sync worker state: {type(ex).__name__}({ex})') from ex
 
+    compiler.record_stage_time('state_sync', started_at)
     return db
 
 
+def __forget_dbs__(dbnames: Tuple[str, ...]) -> None:
+    global DBS
+
+    for dbname in dbnames:
+        if dbname in DBS:
+            DBS = DBS.delete(dbname)
+
+
+def _send_out_of_band(units):
+    # The units are only pickled to be sent to the server from here on,
+    # so mark their large byte strings, like the schema pickles of DDL
+    # and the SQL of migrations, to not be copied into the pickle.
+    for unit in units:
+        unit.sql = tuple(map(amsg.out_of_band, unit.sql))
+        unit.out_type_data = amsg.out_of_band(unit.out_type_data)
+        unit.in_type_data = amsg.out_of_band(unit.in_type_data)
+        unit.user_schema = amsg.out_of_band(unit.user_schema)
+        unit.cached_reflection = amsg.out_of_band(unit.cached_reflection)
+        unit.global_schema = amsg.out_of_band(unit.global_schema)
+    return units
+
+
 def compile(
     dbname: str,
-    user_schema: Optional[bytes],
-    reflection_cache: Optional[bytes],
-    global_schema: Optional[bytes],
-    database_config: Optional[bytes],
-    system_config: Optional[bytes],
+    user_schema: Optional[state.PickledSchema],
+    reflection_cache: Optional[state.PickledObject],
+    global_schema: Optional[state.PickledSchema],
+    database_config: Optional[state.PickledObject],
+    system_config: Optional[state.PickledObject],
     *compile_args: Any,
     **compile_kwargs: Any,
 ):
@@ -190,7 +216,7 @@ def compile(
     if cstate is not None:
         pickled_state = pickle.dumps(cstate, -1)
 
-    return units, pickled_state
+    return _send_out_of_band(units), amsg.out_of_band(pickled_state)
 
 
 def compile_in_tx(cstate, *args, **kwargs):
@@ -201,16 +227,19 @@ def compile_in_tx(cstate, *args, **kwargs):
         cstate = pickle.loads(cstate)
     units, cstate = COMPILER.compile_in_tx(cstate, *args, **kwargs)
     LAST_STATE = cstate
-    return units, pickle.dumps(cstate, -1)
+    return (
+        _send_out_of_band(units),
+        amsg.out_of_band(pickle.dumps(cstate, -1)),
+    )
 
 
 def compile_notebook(
     dbname: str,
-    user_schema: Optional[bytes],
-    reflection_cache: Optional[bytes],
-    global_schema: Optional[bytes],
-    database_config: Optional[bytes],
-    system_config: Optional[bytes],
+    user_schema: Optional[state.PickledSchema],
+    reflection_cache: Optional[state.PickledObject],
+    global_schema: Optional[state.PickledSchema],
+    database_config: Optional[state.PickledObject],
+    system_config: Optional[state.PickledObject],
     *compile_args: Any,
     **compile_kwargs: Any,
 ):
@@ -223,7 +252,7 @@ def compile_notebook(
         system_config,
     )
 
-    return COMPILER.compile_notebook(
+    return _send_out_of_band(COMPILER.compile_notebook(
         db.user_schema,
         GLOBAL_SCHEMA,
         db.reflection_cache,
@@ -231,7 +260,7 @@ def compile_notebook(
         INSTANCE_CONFIG,
         *compile_args,
         **compile_kwargs
-    )
+    ))
 
 
 def try_compile_rollback(
@@ -243,11 +272,11 @@ def try_compile_rollback(
 
 def compile_graphql(
     dbname: str,
-    user_schema: Optional[bytes],
-    reflection_cache: Optional[bytes],
-    global_schema: Optional[bytes],
-    database_config: Optional[bytes],
-    system_config: Optional[bytes],
+    user_schema: Optional[state.PickledSchema],
+    reflection_cache: Optional[state.PickledObject],
+    global_schema: Optional[state.PickledSchema],
+    database_config: Optional[state.PickledObject],
+    system_config: Optional[state.PickledObject],
     *compile_args: Any,
     **compile_kwargs: Any,
 ):
@@ -271,61 +300,89 @@ def compile_graphql(
     )
 
 
+def _call(methname, args):
+    try:
+        if methname == '__init_worker__':
+            meth = __init_worker__
+        else:
+            if not INITED:
+                raise RuntimeError(
+                    'call on uninitialized compiler worker')
+            if methname == 'compile':
+                meth = compile
+            elif methname == 'compile_in_tx':
+                meth = compile_in_tx
+            elif methname == 'compile_notebook':
+                meth = compile_notebook
+            elif methname == 'compile_graphql':
+                meth = compile_graphql
+            elif methname == 'try_compile_rollback':
+                meth = try_compile_rollback
+            elif methname == '__forget_dbs__':
+                meth = __forget_dbs__
+            else:
+                meth = getattr(COMPILER, methname)
+
+        res = meth(*args)
+        return (0, res, compiler.pop_stage_timings())
+    except Exception as ex:
+        compiler.pop_stage_timings()
+        return _format_exception(ex)
+
+
+def _format_exception(ex):
+    prepare_exception(ex)
+    if debug.flags.server:
+        markup.dump(ex)
+    return (
+        1,
+        ex,
+        traceback.format_exc()
+    )
+
+
+def _call_batch(calls):
+    sync_error = None
+    for methname, args in calls:
+        if sync_error is not None:
+            # The calls in a batch expect the state synced by
+            # the calls before them, so they can't proceed.
+            yield sync_error
+            continue
+        data = _call(methname, args)
+        if data[0] == 1 and isinstance(data[1], state.FailedStateSync):
+            sync_error = data
+        yield data
+
+
+def _pickle_result(data):
+    try:
+        return amsg.dumps(data)
+    except Exception as ex:
+        ex_tb = traceback.format_exc()
+        ex_str = f'{ex}:\n\n{ex_tb}'
+        return amsg.dumps((2, ex_str))
+
+
 def worker(sockname, version_serial):
     con = amsg.WorkerConnection(sockname, version_serial)
     try:
         for req_id, req in con.iter_request():
             try:
-                methname, args = pickle.loads(req)
-                if methname == '__init_worker__':
-                    meth = __init_worker__
-                else:
-                    if not INITED:
-                        raise RuntimeError(
-                            'call on uninitialized compiler worker')
-                    if methname == 'compile':
-                        meth = compile
-                    elif methname == 'compile_in_tx':
-                        meth = compile_in_tx
-                    elif methname == 'compile_notebook':
-                        meth = compile_notebook
-                    elif methname == 'compile_graphql':
-                        meth = compile_graphql
-                    elif methname == 'try_compile_rollback':
-                        meth = try_compile_rollback
-                    else:
-                        meth = getattr(COMPILER, methname)
+                methname, args = amsg.loads(req)
             except Exception as ex:
-                prepare_exception(ex)
-                if debug.flags.server:
-                    markup.dump(ex)
-                data = (
-                    1,
-                    ex,
-                    traceback.format_exc()
-                )
-            else:
-                try:
-                    res = meth(*args)
-                    data = (0, res)
-                except Exception as ex:
-                    prepare_exception(ex)
-                    if debug.flags.server:
-                        markup.dump(ex)
-                    data = (
-                        1,
-                        ex,
-                        traceback.format_exc()
-                    )
-
-            try:
-                pickled = pickle.dumps(data, -1)
-            except Exception as ex:
-                ex_tb = traceback.format_exc()
-                ex_str = f'{ex}:\n\n{ex_tb}'
-                pickled = pickle.dumps((2, ex_str), -1)
-
-            con.reply(req_id, pickled)
+                con.reply(req_id, _pickle_result(_format_exception(ex)))
+                continue
+
+            if methname != '__batch__':
+                con.reply(req_id, _pickle_result(_call(methname, args)))
+                continue
+
+            # A batch of calls: reply to each one as soon as it is done,
+            # so that the server can hand the results out without waiting
+            # for the whole batch.
+            for data in _call_batch(args):
+                con.reply(req_id, _pickle_result(data))
     finally:
         con.abort()
 
@@ -54,6 +54,12 @@ class Disconnector(typing.Protocol[CP2]):
         pass
 
 
+# A predicate the caller of acquire() can use to express a preference
+# for some of the idle connections, e.g. the ones that already have the
+# statement it is about to run prepared.
+Preference = typing.Callable[[C], bool]
+
+
 class StatsCollector(typing.Protocol):
 
     def __call__(self, stats: Snapshot) -> None:
@@ -226,7 +232,10 @@ class Block(typing.Generic[C]):
 
         return self.conn_stack.popleft()
 
-    async def acquire(self) -> C:
+    async def acquire(
+        self,
+        prefer: typing.Optional[Preference[C]] = None,
+    ) -> C:
         # There can be a race between a waiter scheduled for to wake up
         # and a connection being stolen (due to quota being enforced,
         # for example).  In which case the waiter might get finally
@@ -271,6 +280,16 @@ class Block(typing.Generic[C]):
                         self._wakeup_next_waiter()
                     raise
 
+            if prefer is not None:
+                # Yield the most recently used connection the caller
+                # prefers.  Taking it out of the middle of the stack keeps
+                # the rest of the stack ordered by `in_stack_since`.
+                for i in range(-1, -len(self.conn_stack) - 1, -1):
+                    conn = self.conn_stack[i]
+                    if prefer(conn):
+                        del self.conn_stack[i]
+                        return conn
+
             # Yield the most recently used connection from the top of the stack
             return self.conn_stack.pop()
         finally:
@@ -1048,7 +1067,11 @@ class Pool(BasePool[C]):
 
         return None, None
 
-    async def _acquire(self, dbname: str) -> C:
+    async def _acquire(
+        self,
+        dbname: str,
+        prefer: typing.Optional[Preference[C]],
+    ) -> C:
         block = self._get_block(dbname)
 
         room_for_new_conns = self._cur_capacity < self._max_capacity
@@ -1076,7 +1099,7 @@ class Pool(BasePool[C]):
                 # Block has no connections at all, or not enough connections.
                 self._schedule_new_conn(block)
 
-            return await block.acquire()
+            return await block.acquire(prefer)
 
         if not block_nconns:
             # This is a block without any connections.
@@ -1084,15 +1107,15 @@ class Pool(BasePool[C]):
             # reallocated for this block.
             if not self._try_steal_conn(block):
                 self._new_blocks_waitlist[block] = True
-            return await block.acquire()
+            return await block.acquire(prefer)
 
         if block_nconns < block.quota:
             # Let's see if we can steal a connection from some block
             # that's over quota and open a new one.
             self._try_steal_conn(block)
-            return await block.acquire()
+            return await block.acquire(prefer)
 
-        return await block.acquire()
+        return await block.acquire(prefer)
 
     def _run_gc(self) -> None:
         loop = self._get_loop()
@@ -1119,11 +1142,23 @@ class Pool(BasePool[C]):
             while (conn := block.try_steal(only_older_than)) is not None:
                 loop.create_task(self._discard_conn(block, conn))
 
-    async def acquire(self, dbname: str) -> C:
+    async def acquire(
+        self,
+        dbname: str,
+        *,
+        prefer: typing.Optional[Preference[C]] = None,
+    ) -> C:
+        """Acquire a connection to *dbname*.
+
+        If *prefer* is given, an idle connection it returns True for is
+        chosen over the other idle connections of the database.  It is
+        only a preference: any idle connection is returned if none of
+        them qualify.
+        """
         self._nacquires += 1
         self._maybe_schedule_tick()
         try:
-            conn = await self._acquire(dbname)
+            conn = await self._acquire(dbname, prefer)
         finally:
             self._nacquires -= 1
 
@@ -1282,7 +1317,12 @@ class _NaivePool(BasePool[C]):
                 self._blocks.move_to_end(block.dbname, last=True)
                 return
 
-    async def acquire(self, dbname: str) -> C:
+    async def acquire(
+        self,
+        dbname: str,
+        *,
+        prefer: typing.Optional[Preference[C]] = None,
+    ) -> C:
         self._maybe_tick()
 
         block = self._get_block(dbname)
@@ -1295,7 +1335,7 @@ class _NaivePool(BasePool[C]):
             # in `release()`, because it would hang if no other block releases.
             await self._steal_conn(block)
 
-        return await block.acquire()
+        return await block.acquire(prefer)
 
     def release(self, dbname: str, conn: C) -> None:
         self._maybe_tick()
@@ -31,19 +31,27 @@ cpdef enum SideEffects:
 cdef class DatabaseIndex:
     cdef:
         dict _dbs
+        set _db_stubs
         object _server
         object _sys_config
         object _comp_sys_config
         object _std_schema
         object _global_schema
+        int _hot_stmts_size
 
 
 cdef class Database:
 
     cdef:
         object _eql_to_compiled
+        object _eql_to_compiled_reported_size
+        object _eql_to_source
+        dict _persisted_queries
+        dict _compiles_in_flight
+        object _hot_stmts
         DatabaseIndex _index
         object _views
+        double _last_used
 
         readonly str name
         readonly object dbver
@@ -54,9 +62,12 @@ cdef class Database:
         readonly object extensions
 
     cdef schedule_config_update(self)
+    cdef signal_data_change(self)
 
     cdef _invalidate_caches(self)
-    cdef _cache_compiled_query(self, key, query_unit)
+    cdef _cache_compiled_query(self, key, query_unit, cost)
+    cdef _report_query_cache_size(self)
+    cdef _lookup_persisted_query(self, key)
     cdef _new_view(self, user, query_cache)
     cdef _remove_view(self, view)
     cdef _update_backend_ids(self, new_types)
@@ -97,12 +108,15 @@ cdef class DatabaseConnectionView:
         int _in_tx_dbver
         bint _in_tx
         bint _in_tx_with_ddl
+        bint _in_tx_with_dml
         bint _in_tx_with_role_ddl
         bint _in_tx_with_sysconfig
         bint _in_tx_with_dbconfig
         bint _in_tx_with_set
         bint _tx_error
 
+        object _last_schema_changes
+
         object __weakref__
 
     cdef _invalidate_local_cache(self)
@@ -115,14 +129,20 @@ cdef class DatabaseConnectionView:
     cpdef in_tx(self)
     cpdef in_tx_error(self)
 
-    cdef cache_compiled_query(self, object key, object query_unit)
+    cdef lookup_source(self, bytes eql)
+    cdef cache_source(self, bytes eql, object source, cost)
+    cdef cache_compiled_query(self, object key, object query_unit, cost)
     cdef lookup_compiled_query(self, object key)
+    cdef note_prepared_stmt(self, bytes stmt_name, bytes sql)
+    cdef get_compile_flight_key(self, object key)
+    cdef dict get_compiles_in_flight(self)
 
     cdef tx_error(self)
 
     cdef start(self, query_unit)
     cdef on_error(self, query_unit)
     cdef on_success(self, query_unit, new_types)
+    cdef get_last_schema_changes(self)
 
     cpdef get_session_config(self)
     cdef set_session_config(self, new_conf)
@@ -19,6 +19,7 @@
 import json
 import os.path
 import pickle
+import time
 import typing
 import weakref
 
@@ -28,7 +29,9 @@ from edb import errors
 from edb.common import lru, uuidgen
 from edb.schema import extensions as s_ext
 from edb.schema import schema as s_schema
-from edb.server import defines, config
+from edb.schema import version as s_ver
+from edb.server import defines, config, metrics
+from edb.server.cache import persistent as cache_persistent
 from edb.server.compiler import dbstate
 from edb.pgsql import dbops
 
@@ -45,6 +48,17 @@ cdef DEFAULT_STATE = json.dumps([
 cdef int VER_COUNTER = 0
 cdef DICTDEFAULT = (None, None)
 
+# A rough estimate of the memory taken by a QueryUnit besides its SQL
+# and type descriptors.
+cdef int QUERY_UNIT_OVERHEAD = 1024
+# The compilation time of queries from the persistent cache is unknown,
+# assume a typical one.
+cdef double PERSISTED_QUERY_COST = 0.01
+# A rough estimate of the memory taken by a tokenized query besides its
+# text, and by each of its tokens.
+cdef int QUERY_SOURCE_OVERHEAD = 512
+cdef int QUERY_TOKEN_SIZE = 200
+
 
 cdef next_dbver():
     global VER_COUNTER
@@ -52,9 +66,66 @@ cdef next_dbver():
     return VER_COUNTER
 
 
+def _compiled_query_size(entry):
+    query_unit, _ = entry
+    return (
+        QUERY_UNIT_OVERHEAD
+        + sum(len(sql) for sql in query_unit.sql)
+        # The type descriptors are also kept encoded in the
+        # CommandDataDescription message, see `QueryUnit.encoded_msgs`.
+        + 2 * len(query_unit.in_type_data)
+        + 2 * len(query_unit.out_type_data)
+    )
+
+
+def _query_source_size(source):
+    return (
+        QUERY_SOURCE_OVERHEAD
+        + 2 * len(source.text())
+        + QUERY_TOKEN_SIZE * len(source.tokens())
+    )
+
+
+def _on_compiled_query_evicted(key, entry):
+    metrics.query_cache_evictions.inc()
+
+
+def get_user_schema_version(user_schema):
+    ver = user_schema.get_global(
+        s_ver.SchemaVersion, '__schema_version__', None)
+    if ver is None:
+        return None
+    return ver.get_version(user_schema)
+
+
+def _describe_schema_changes(old_schema, new_schema):
+    # Sent to the other servers along with the "schema-changes" event,
+    # so that they only need to fetch the objects that have changed,
+    # see Server.introspect_db().
+    base_version = get_user_schema_version(old_schema)
+    version = get_user_schema_version(new_schema)
+    if base_version is None or version is None:
+        return None
+
+    # The new schema is the old one with the DDL applied by the
+    # compiler, so the changes are read from the mutation log it
+    # carries instead of comparing all the objects.
+    changed, deleted = new_schema.get_changed_object_ids(old_schema)
+    if len(changed) + len(deleted) > defines.SCHEMA_CHANGES_MAX_OBJECTS:
+        return None
+
+    return {
+        'base_version': str(base_version),
+        'version': str(version),
+        'changed': [str(objid) for objid in changed],
+        'deleted': [str(objid) for objid in deleted],
+    }
+
+
 cdef class Database:
 
-    # Global LRU cache of compiled anonymous queries
+    # Global cache of compiled anonymous queries, bounded by memory
+    # and evicting the queries that are the cheapest to recompile first.
     _eql_to_compiled: typing.Mapping[str, dbstate.QueryUnit]
 
     def __init__(
@@ -73,9 +144,38 @@ cdef class Database:
 
         self._index = index
         self._views = weakref.WeakSet()
+        self._last_used = time.monotonic()
 
-        self._eql_to_compiled = lru.LRUMapping(
-            maxsize=defines._MAX_QUERIES_CACHE)
+        self._eql_to_compiled = lru.CostAwareMapping(
+            maxsize=defines._MAX_QUERIES_CACHE_BYTES,
+            sizeof=_compiled_query_size,
+            on_evict=_on_compiled_query_evicted,
+        )
+        self._eql_to_compiled_reported_size = 0
+
+        # Tokenized and normalized query texts, keyed by the exact bytes
+        # received from clients, so that hot queries are not tokenized
+        # again.  Normalization does not depend on the schema, so unlike
+        # the compiled queries these survive schema changes.
+        self._eql_to_source = lru.CostAwareMapping(
+            maxsize=defines.QUERY_SOURCE_CACHE_BYTES,
+            sizeof=_query_source_size,
+        )
+
+        # Compiled queries loaded from the persistent query cache on
+        # startup; entries are moved to `_eql_to_compiled` on first use.
+        self._persisted_queries = {}
+
+        # Futures of the compilations currently in progress, see
+        # `DatabaseConnectionView.get_compile_flight_key()`.
+        self._compiles_in_flight = {}
+
+        # SQL of the most recently run prepared statements, used to
+        # warm up new backend connections, see `get_hot_stmts()`.
+        if index._hot_stmts_size > 0:
+            self._hot_stmts = lru.LRUMapping(maxsize=index._hot_stmts_size)
+        else:
+            self._hot_stmts = None
 
         self.db_config = db_config
         self.user_schema = user_schema
@@ -89,6 +189,9 @@ cdef class Database:
     cdef schedule_config_update(self):
         self._index._server._on_local_database_config_change(self.name)
 
+    cdef signal_data_change(self):
+        self._index._server._on_local_data_change(self.name)
+
     cdef _set_and_signal_new_user_schema(
         self,
         new_schema,
@@ -121,24 +224,82 @@ cdef class Database:
 
     cdef _invalidate_caches(self):
         self._eql_to_compiled.clear()
+        self._persisted_queries.clear()
+        if self._hot_stmts is not None:
+            self._hot_stmts.clear()
+        self._report_query_cache_size()
 
-    cdef _cache_compiled_query(self, key, compiled: dbstate.QueryUnit):
+    cdef _cache_compiled_query(self, key, compiled: dbstate.QueryUnit, cost):
         assert compiled.cacheable
 
-        existing, dbver = self._eql_to_compiled.get(key, DICTDEFAULT)
+        # Checking for an existing entry is not a use of it, and must
+        # not raise its priority.
+        existing, dbver = self._eql_to_compiled.peek(key, DICTDEFAULT)
         if existing is not None and dbver == self.dbver:
             # We already have a cached query for a more recent DB version.
             return
 
-        self._eql_to_compiled[key] = compiled, self.dbver
+        self._eql_to_compiled.set(key, (compiled, self.dbver), cost=cost)
+        self._report_query_cache_size()
+
+    cdef _report_query_cache_size(self):
+        size = self._eql_to_compiled.get_size()
+        metrics.query_cache_size.inc(
+            size - self._eql_to_compiled_reported_size)
+        self._eql_to_compiled_reported_size = size
+
+    cdef _lookup_persisted_query(self, key):
+        query_req, modaliases, session_config = key
+        query_unit = self._persisted_queries.pop(
+            (query_req.get_cache_key(), modaliases, session_config), None)
+        if query_unit is not None:
+            self._eql_to_compiled.set(
+                key, (query_unit, self.dbver), cost=PERSISTED_QUERY_COST)
+            self._report_query_cache_size()
+        return query_unit
+
+    def get_cache_fingerprint(self):
+        return cache_persistent.compute_fingerprint(
+            std_schema=self._index._std_schema,
+            user_schema=self.user_schema,
+            global_schema=self._index._global_schema,
+            db_config=self.db_config,
+            comp_sys_config=self._index._comp_sys_config,
+        )
+
+    def set_persisted_queries(self, entries):
+        self._persisted_queries = dict(entries)
+
+    def get_persisted_queries(self):
+        # The persistent cache keeps the last entries if it overflows,
+        # so the entries go from the least to the most valuable ones:
+        # the not yet used persisted queries first, then the compiled
+        # queries in the order they would be evicted in.
+        entries = list(self._persisted_queries.items())
+        for key, (query_unit, dbver) in (
+            self._eql_to_compiled.items_by_priority()
+        ):
+            if dbver != self.dbver:
+                continue
+            query_req, modaliases, session_config = key
+            entries.append((
+                (query_req.get_cache_key(), modaliases, session_config),
+                query_unit,
+            ))
+        return entries
 
     cdef _new_view(self, user, query_cache):
         view = DatabaseConnectionView(self, user=user, query_cache=query_cache)
         self._views.add(view)
+        self._last_used = time.monotonic()
         return view
 
     cdef _remove_view(self, view):
         self._views.remove(view)
+        self._last_used = time.monotonic()
+
+    def touch(self):
+        self._last_used = time.monotonic()
 
     def iter_views(self):
         yield from self._views
@@ -146,6 +307,18 @@ cdef class Database:
     def get_query_cache_size(self):
         return len(self._eql_to_compiled)
 
+    def get_hot_stmts(self):
+        if self._hot_stmts is None:
+            return []
+        # Looking the entries up oldest first keeps their LRU order.
+        stmts = [
+            (stmt_name, self._hot_stmts[stmt_name])
+            for stmt_name in list(self._hot_stmts)
+        ]
+        # Most recently run statements first.
+        stmts.reverse()
+        return stmts
+
 
 cdef class DatabaseConnectionView:
 
@@ -182,6 +355,7 @@ cdef class DatabaseConnectionView:
         self._in_tx_db_config = None
         self._in_tx_modaliases = None
         self._in_tx_with_ddl = False
+        self._in_tx_with_dml = False
         self._in_tx_with_role_ddl = False
         self._in_tx_with_sysconfig = False
         self._in_tx_with_dbconfig = False
@@ -389,7 +563,8 @@ cdef class DatabaseConnectionView:
     cpdef in_tx_error(self):
         return self._tx_error
 
-    cdef cache_compiled_query(self, object key, object query_unit):
+    cdef cache_compiled_query(self, object key, object query_unit, cost):
+        # *cost* is the time it took to compile the query.
         assert query_unit.cacheable
 
         key = (key, self.get_modaliases(), self.get_session_config())
@@ -397,7 +572,16 @@ cdef class DatabaseConnectionView:
         if self._in_tx_with_ddl:
             self._eql_to_compiled[key] = query_unit
         else:
-            self._db._cache_compiled_query(key, query_unit)
+            self._db._cache_compiled_query(key, query_unit, cost)
+
+    cdef lookup_source(self, bytes eql):
+        if not self._query_cache_enabled:
+            return None
+        return self._db._eql_to_source.get(eql)
+
+    cdef cache_source(self, bytes eql, object source, cost):
+        if self._query_cache_enabled:
+            self._db._eql_to_source.set(eql, source, cost=cost)
 
     cdef lookup_compiled_query(self, object key):
         if (self._tx_error or
@@ -414,9 +598,38 @@ cdef class DatabaseConnectionView:
                 key, DICTDEFAULT)
             if query_unit is not None and qu_dbver != self._db.dbver:
                 query_unit = None
+            if query_unit is None and self._db._persisted_queries:
+                query_unit = self._db._lookup_persisted_query(key)
+            if query_unit is None:
+                metrics.query_cache_misses.inc()
+            else:
+                metrics.query_cache_hits.inc()
 
         return query_unit
 
+    cdef note_prepared_stmt(self, bytes stmt_name, bytes sql):
+        # Statements that depend on uncommitted DDL can't be prepared
+        # on other connections.
+        if self._db._hot_stmts is not None and not self._in_tx_with_ddl:
+            self._db._hot_stmts[stmt_name] = sql
+
+    cdef get_compile_flight_key(self, object key):
+        # Concurrent compilations of the same query with the same key
+        # would produce the same result, so only one of them needs to
+        # be sent to the compiler.
+        return (
+            key,
+            self.get_modaliases(),
+            self.get_session_config(),
+            self.get_database_config(),
+            self.get_global_schema(),
+            self.get_compilation_system_config(),
+            self._db.dbver,
+        )
+
+    cdef dict get_compiles_in_flight(self):
+        return self._db._compiles_in_flight
+
     cdef tx_error(self):
         if self._in_tx:
             self._tx_error = True
@@ -440,6 +653,8 @@ cdef class DatabaseConnectionView:
         if self._in_tx:
             if query_unit.has_ddl:
                 self._in_tx_with_ddl = True
+            if query_unit.has_dml:
+                self._in_tx_with_dml = True
             if query_unit.system_config:
                 self._in_tx_with_sysconfig = True
             if query_unit.database_config:
@@ -458,8 +673,12 @@ cdef class DatabaseConnectionView:
     cdef on_error(self, query_unit):
         self.tx_error()
 
+    cdef get_last_schema_changes(self):
+        return self._last_schema_changes
+
     cdef on_success(self, query_unit, new_types):
         side_effects = 0
+        self._last_schema_changes = None
 
         if query_unit.tx_savepoint_rollback:
             # Need to invalidate the cache in case there were
@@ -471,12 +690,15 @@ cdef class DatabaseConnectionView:
                 self._db._update_backend_ids(new_types)
             if query_unit.user_schema is not None:
                 self._in_tx_dbver = next_dbver()
+                old_schema = self._db.user_schema
                 self._db._set_and_signal_new_user_schema(
                     pickle.loads(query_unit.user_schema),
                     pickle.loads(query_unit.cached_reflection)
                         if query_unit.cached_reflection is not None
                         else None
                 )
+                self._last_schema_changes = _describe_schema_changes(
+                    old_schema, self._db.user_schema)
                 side_effects |= SideEffects.SchemaChanges
             if query_unit.system_config:
                 side_effects |= SideEffects.InstanceConfigChanges
@@ -490,6 +712,8 @@ cdef class DatabaseConnectionView:
             if query_unit.has_role_ddl:
                 side_effects |= SideEffects.RoleChanges
                 self._db._index._server._fetch_roles()
+            if query_unit.has_dml:
+                self._db.signal_data_change()
         else:
             if new_types:
                 self._in_tx_new_types.update(new_types)
@@ -509,12 +733,15 @@ cdef class DatabaseConnectionView:
             if self._in_tx_new_types:
                 self._db._update_backend_ids(self._in_tx_new_types)
             if query_unit.user_schema is not None:
+                old_schema = self._db.user_schema
                 self._db._set_and_signal_new_user_schema(
                     pickle.loads(query_unit.user_schema),
                     pickle.loads(query_unit.cached_reflection)
                         if query_unit.cached_reflection is not None
                         else None
                 )
+                self._last_schema_changes = _describe_schema_changes(
+                    old_schema, self._db.user_schema)
                 side_effects |= SideEffects.SchemaChanges
             if self._in_tx_with_sysconfig:
                 side_effects |= SideEffects.InstanceConfigChanges
@@ -528,6 +755,8 @@ cdef class DatabaseConnectionView:
                 self._db._index._server._fetch_roles()
             if self._in_tx_with_role_ddl:
                 side_effects |= SideEffects.RoleChanges
+            if self._in_tx_with_dml:
+                self._db.signal_data_change()
 
             self._reset_tx_state()
 
@@ -566,11 +795,25 @@ cdef class DatabaseConnectionView:
 
 cdef class DatabaseIndex:
 
-    def __init__(self, server, *, std_schema, global_schema, sys_config):
+    def __init__(
+        self,
+        server,
+        *,
+        std_schema,
+        global_schema,
+        sys_config,
+        hot_stmts_size=0,
+    ):
         self._dbs = {}
+        # Databases that are known to exist but have not been
+        # introspected yet (or were evicted after being idle).
+        self._db_stubs = set()
         self._server = server
         self._std_schema = std_schema
         self._global_schema = global_schema
+        # The number of the most recently run prepared statements of
+        # every database to prepare on new backend connections.
+        self._hot_stmts_size = hot_stmts_size
         self.update_sys_config(sys_config)
 
     def count_connections(self, dbname: str):
@@ -594,6 +837,9 @@ cdef class DatabaseIndex:
     def has_db(self, dbname):
         return dbname in self._dbs
 
+    def has_db_stub(self, dbname):
+        return dbname in self._db_stubs
+
     def get_db(self, dbname):
         try:
             return self._dbs[dbname]
@@ -621,6 +867,7 @@ cdef class DatabaseIndex:
         refresh=False
     ):
         cdef Database db
+        self._db_stubs.discard(dbname)
         db = self._dbs.get(dbname)
         if db is not None:
             if not refresh:
@@ -639,8 +886,42 @@ cdef class DatabaseIndex:
             )
             self._dbs[dbname] = db
 
+    def register_db_stub(self, dbname):
+        if dbname in self._dbs:
+            raise RuntimeError(
+                f'cannot register DB {dbname!r}: it is already registered')
+        self._db_stubs.add(dbname)
+
     def unregister_db(self, dbname):
-        self._dbs.pop(dbname)
+        cdef Database db
+        if dbname in self._db_stubs:
+            self._db_stubs.remove(dbname)
+            return
+        db = self._dbs.pop(dbname)
+        db._invalidate_caches()
+
+    def evict_idle_dbs(self, idle_timeout: float):
+        """Turn databases unused for *idle_timeout* seconds into stubs.
+
+        The server is notified of every evicted database before its
+        caches are dropped.  Returns the names of the evicted databases.
+        """
+        cdef Database db
+        now = time.monotonic()
+        evicted = []
+        for db in list(self._dbs.values()):
+            if (
+                db._views
+                or db._compiles_in_flight
+                or now - db._last_used < idle_timeout
+            ):
+                continue
+            del self._dbs[db.name]
+            self._db_stubs.add(db.name)
+            self._server._on_idle_db_evicted(db)
+            db._invalidate_caches()
+            evicted.append(db.name)
+        return evicted
 
     def iter_dbs(self):
         return iter(self._dbs.values())
@@ -49,8 +49,59 @@ BACKEND_COMPILER_POOL_SIZE_MIN = 1
 # after it exits unexpectedly.
 BACKEND_COMPILER_TEMPLATE_PROC_RESTART_INTERVAL = 1
 
+# The maximum number of schema pickles shared with the compiler workers
+# through files that are kept around when not in use.
+COMPILER_SHARED_SCHEMAS_MAX = 128
+
+# Schema changes are sent to compiler workers that already have an
+# older version of the schema as a diff, unless the diff touches more
+# entries than this fraction of the number of schema objects, in which
+# case the whole schema is sent instead.
+COMPILER_SCHEMA_DIFF_MAX_RATIO = 0.25
+
+# The maximum number of queries in one batch request to the EdgeQL
+# over HTTP extension.
+HTTP_EDGEQL_BATCH_MAX_SIZE = 100
+
+# The maximum number of backend connections used by a single DUMP or
+# RESTORE.  It is further limited to a quarter of the connection pool.
+MAX_DUMP_RESTORE_JOBS = 4
+
+# The maximum number of compile requests sent to a compiler worker in
+# one message when all workers are busy and the requests pile up.
+COMPILER_BATCH_MAX_SIZE = 16
+
 _MAX_QUERIES_CACHE = 1000
 
+# The approximate maximum memory in bytes taken by the compiled queries
+# cached for every database.
+_MAX_QUERIES_CACHE_BYTES = 16 * 1024 * 1024
+
+# The approximate maximum memory in bytes taken by the tokenized texts
+# of the queries run on every database.
+QUERY_SOURCE_CACHE_BYTES = 4 * 1024 * 1024
+
+# The maximum number of compiled queries per database to keep in
+# the persistent query cache (see --query-cache-dir).
+PERSISTENT_QUERY_CACHE_SIZE = 5000
+# The time in seconds between flushes of the compiled queries
+# to the persistent query cache.
+PERSISTENT_QUERY_CACHE_SAVE_INTERVAL = 60
+
+# The default time in seconds a cached result of a read-only
+# HTTP query stays valid.
+HTTP_RESULT_CACHE_TTL = 60.0
+
+# The maximum number of changed schema objects a "schema-changes"
+# system event lists; other servers reintrospect the whole schema of
+# the database after larger changes.  Also keeps the event well within
+# the 8000 byte limit of a Postgres notification payload.
+SCHEMA_CHANGES_MAX_OBJECTS = 150
+
+# The minimum time in seconds between checks for databases that have
+# been idle long enough to have their schemas evicted.
+DB_IDLE_EVICTION_MIN_INTERVAL = 10.0
+
 _QUERY_ROLLING_AVG_LEN = 10
 _QUERIES_ROLLING_AVG_LEN = 300
 
@@ -66,6 +117,9 @@ MAX_UNIX_SOCKET_PATH_LENGTH = 21
 MAX_RUNSTATE_DIR_PATH = 104 - MAX_UNIX_SOCKET_PATH_LENGTH - 1
 
 HTTP_PORT_QUERY_CACHE_SIZE = 1000
+# The maximum number of GraphQL queries registered by their SHA-256
+# hash (persisted queries) the server remembers.
+HTTP_PORT_PERSISTED_QUERIES_SIZE = 1000
 HTTP_PORT_MAX_CONCURRENCY = 250  # XXX
 
 # The time in seconds the EdgeDB server shall wait between retries to connect
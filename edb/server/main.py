@@ -190,6 +190,12 @@ async def _run_server(
             cluster=cluster,
             runstate_dir=runstate_dir,
             internal_runstate_dir=internal_runstate_dir,
+            query_cache_dir=args.query_cache_dir,
+            http_result_cache_size=args.http_result_cache_size,
+            http_result_cache_ttl=args.http_result_cache_ttl,
+            lazy_db_introspection=args.lazy_db_introspection,
+            db_idle_timeout=args.db_idle_timeout,
+            backend_prepare_hot_stmts=args.backend_prepare_hot_stmts,
             max_backend_connections=args.max_backend_connections,
             compiler_pool_size=args.compiler_pool_size,
             compiler_pool_mode=args.compiler_pool_mode,
@@ -32,6 +32,18 @@ current_compiler_processes = registry.new_gauge(
     'Current number of active compiler processes.'
 )
 
+compiler_pool_affinity_hits = registry.new_counter(
+    'compiler_pool_affinity_hits_total',
+    'Number of compile requests sent to a compiler process that already '
+    'had the current schema of the database.'
+)
+
+compiler_pool_affinity_misses = registry.new_counter(
+    'compiler_pool_affinity_misses_total',
+    'Number of compile requests that required the schema of the database '
+    'to be sent to the compiler process.'
+)
+
 total_backend_connections = registry.new_counter(
     'backend_connections_total',
     'Total number of backend connections established.'
@@ -59,6 +71,51 @@ backend_connection_aborted = registry.new_labeled_counter(
     labels=('pgcode',)
 )
 
+backend_prepared_stmt_hits = registry.new_counter(
+    'backend_prepared_stmt_hits_total',
+    'Number of queries run on a backend connection that already had '
+    'the statement prepared.'
+)
+
+backend_prepared_stmt_misses = registry.new_counter(
+    'backend_prepared_stmt_misses_total',
+    'Number of queries that had to be prepared on the acquired backend '
+    'connection.'
+)
+
+backend_prepared_stmt_warmups = registry.new_counter(
+    'backend_prepared_stmt_warmups_total',
+    'Number of statements prepared on new backend connections ahead of '
+    'their first use.'
+)
+
+db_lazy_introspections = registry.new_counter(
+    'db_lazy_introspections_total',
+    'Number of databases introspected on first use.'
+)
+
+schema_incremental_reintrospections = registry.new_counter(
+    'schema_incremental_reintrospections_total',
+    'Number of remote DDL events handled by fetching only the changed '
+    'schema objects.'
+)
+
+db_idle_evictions = registry.new_counter(
+    'db_idle_evictions_total',
+    'Number of database schemas evicted from memory after being idle.'
+)
+
+http_result_cache_hits = registry.new_counter(
+    'http_result_cache_hits_total',
+    'Number of read-only HTTP queries answered from the result cache.'
+)
+
+http_result_cache_misses = registry.new_counter(
+    'http_result_cache_misses_total',
+    'Number of read-only HTTP queries that were run because their result '
+    'was not in the result cache.'
+)
+
 backend_query_duration = registry.new_histogram(
     'backend_query_duration',
     'Time it takes to run a query on a backend connection.',
@@ -86,12 +143,50 @@ edgeql_query_compilations = registry.new_labeled_counter(
     labels=('path',)
 )
 
+edgeql_query_compilations_coalesced = registry.new_counter(
+    'edgeql_query_compilations_coalesced_total',
+    'Number of query compilations avoided by waiting for a concurrent '
+    'compilation of the same query.'
+)
+
+query_cache_hits = registry.new_counter(
+    'query_cache_hits_total',
+    'Number of compiled queries found in the query cache.'
+)
+
+query_cache_misses = registry.new_counter(
+    'query_cache_misses_total',
+    'Number of queries not found in the query cache.'
+)
+
+query_cache_evictions = registry.new_counter(
+    'query_cache_evictions_total',
+    'Number of compiled queries evicted from the query cache.'
+)
+
+query_cache_size = registry.new_gauge(
+    'query_cache_size',
+    'Approximate memory taken by the compiled queries in the query cache.',
+    unit=prom.Unit.BYTES,
+)
+
 edgeql_query_compilation_duration = registry.new_histogram(
     'edgeql_query_compilation_duration',
     'Time it takes to compile an EdgeQL query or script.',
     unit=prom.Unit.SECONDS,
 )
 
+edgeql_query_compilation_stage_duration = registry.new_labeled_histogram(
+    'edgeql_query_compilation_stage_duration',
+    'Time spent in a stage of compiling an EdgeQL query or script: '
+    'waiting for a compiler process (queue), serializing (state_pickle) '
+    'and loading (state_sync) the schema and config, parsing (parse), '
+    'compiling to IR (ql_to_ir) and to SQL (ir_to_sql), and generating '
+    'type descriptors (describe).',
+    unit=prom.Unit.SECONDS,
+    labels=('stage',),
+)
+
 background_errors = registry.new_labeled_counter(
     'background_errors_total',
     'Number of unhandled errors in background server routines.',
@@ -115,6 +115,7 @@ cdef class PGConnection:
     cdef fallthrough_idle(self)
 
     cdef before_prepare(self, stmt_name, dbver, WriteBuffer outbuf)
+    cdef _decode_json_result(self, WriteBuffer out, sql)
 
     cdef make_clean_stmt_message(self, bytes stmt_name)
     cdef make_auth_password_md5_message(self, bytes salt)
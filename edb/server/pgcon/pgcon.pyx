@@ -620,6 +620,84 @@ cdef class PGConnection:
 
         return parse, store_stmt
 
+    def has_prepared(self, bytes stmt_name, dbver):
+        return self.prep_stmts.peek(stmt_name, None) == dbver
+
+    async def _prepare_statements(self, stmts, dbver):
+        cdef:
+            WriteBuffer out
+            WriteBuffer buf
+            ssize_t prepared = 0
+
+        if not stmts:
+            return 0
+
+        out = WriteBuffer.new()
+        for stmt_name, sql in stmts:
+            buf = WriteBuffer.new_message(b'P')
+            buf.write_bytestring(stmt_name)
+            buf.write_bytestring(sql)
+            buf.write_int16(0)
+            out.write_buffer(buf.end_message())
+        out.write_bytes(SYNC_MESSAGE)
+        self.waiting_for_sync = True
+        self.write(out)
+
+        # Postgres skips the rest of the Parse messages after an error,
+        # so the N-th ParseComplete always refers to the N-th statement.
+        error = None
+        while True:
+            if not self.buffer.take_message():
+                await self.wait_for_message()
+            mtype = self.buffer.get_message_type()
+
+            try:
+                if mtype == b'1':
+                    # ParseComplete
+                    self.buffer.discard_message()
+                    self.prep_stmts[stmts[prepared][0]] = dbver
+                    prepared += 1
+
+                elif mtype == b'E':
+                    # ErrorResponse
+                    er_cls, fields = self.parse_error_message()
+                    error = er_cls(fields=fields)
+
+                elif mtype == b'Z':
+                    # ReadyForQuery
+                    self.parse_sync_message()
+                    break
+
+                else:
+                    self.fallthrough()
+
+            finally:
+                self.buffer.finish_message()
+
+        if error is not None:
+            raise error
+
+        return prepared
+
+    async def prepare_statements(self, stmts, dbver):
+        """Prepare ``(stmt_name, sql)`` pairs ahead of their first use.
+
+        Returns the number of statements that were prepared.  The ones
+        following a statement that failed to prepare are skipped.
+        """
+        self.before_command()
+        try:
+            return await self._prepare_statements(
+                [
+                    (stmt_name, sql)
+                    for stmt_name, sql in stmts
+                    if stmt_name not in self.prep_stmts
+                ][:PREP_STMTS_CACHE],
+                dbver,
+            )
+        finally:
+            await self.after_command()
+
     async def _parse_execute_to_buf(
         self,
         sql,
@@ -741,11 +819,15 @@ cdef class PGConnection:
     ):
         cdef:
             WriteBuffer out
-            Py_buffer pybuf
 
         out = WriteBuffer.new()
         await self._parse_execute_to_buf(
             sql, sql_hash, dbver, use_prep_stmt, args, out)
+        return self._decode_json_result(out, sql)
+
+    cdef _decode_json_result(self, WriteBuffer out, sql):
+        cdef:
+            Py_buffer pybuf
 
         cpython.PyObject_GetBuffer(out, &pybuf, cpython.PyBUF_SIMPLE)
         try:
@@ -805,6 +887,138 @@ cdef class PGConnection:
             metrics.backend_query_duration.observe(time.monotonic() - started_at)
             await self.after_command()
 
+    async def _parse_execute_json_batch(self, list queries, dbver):
+        cdef:
+            WriteBuffer out
+            WriteBuffer buf
+            list outs
+            ssize_t i = 0
+
+        # All queries are sent in one go, followed by a single Sync, so
+        # they run in one implicit transaction: if one of them fails,
+        # Postgres skips the rest and rolls back the whole batch.
+        out = WriteBuffer.new()
+        parsing = []
+        parsing_names = set()
+        for sql, sql_hash, use_prep_stmt, args in queries:
+            store_stmt = 0
+            if use_prep_stmt:
+                stmt_name = sql_hash
+                if stmt_name in parsing_names:
+                    # Parsed by an earlier query of this batch.
+                    parse = 0
+                else:
+                    parse, store_stmt = self.before_prepare(
+                        stmt_name, dbver, out)
+            else:
+                stmt_name = b''
+                parse = 1
+
+            if parse:
+                buf = WriteBuffer.new_message(b'P')
+                buf.write_bytestring(stmt_name)
+                buf.write_bytestring(sql)
+                buf.write_int16(0)
+                out.write_buffer(buf.end_message())
+                parsing.append(stmt_name if store_stmt else None)
+                if store_stmt:
+                    parsing_names.add(stmt_name)
+
+            buf = WriteBuffer.new_message(b'B')
+            buf.write_bytestring(b'')  # portal name
+            buf.write_bytestring(stmt_name)  # statement name
+            buf.write_int32(0x00010001)  # binary for all parameters
+            buf.write_int16(<int16_t><uint16_t>(len(args)))
+            for arg in args:
+                if isinstance(arg, decimal.Decimal):
+                    jarg = str(arg)
+                else:
+                    jarg = json.dumps(arg)
+                pgproto.jsonb_encode(DEFAULT_CODEC_CONTEXT, buf, jarg)
+            buf.write_int32(0x00010001)  # binary for the output
+            out.write_buffer(buf.end_message())
+
+            buf = WriteBuffer.new_message(b'E')
+            buf.write_bytestring(b'')  # portal name
+            buf.write_int32(0)  # return all rows
+            out.write_buffer(buf.end_message())
+
+        out.write_bytes(SYNC_MESSAGE)
+        self.write(out)
+
+        outs = [WriteBuffer.new() for _ in queries]
+        parsing.reverse()
+        error = None
+        self.waiting_for_sync = True
+        while True:
+            if not self.buffer.take_message():
+                await self.wait_for_message()
+            mtype = self.buffer.get_message_type()
+
+            try:
+                if mtype == b'D':
+                    # DataRow
+                    self.buffer.redirect_messages(outs[i], b'D', 0)
+
+                elif mtype == b'C' or mtype == b'I':
+                    # CommandComplete
+                    # EmptyQueryResponse
+                    self.buffer.discard_message()
+                    i += 1
+
+                elif mtype == b'E':
+                    # ErrorResponse
+                    er_cls, fields = self.parse_error_message()
+                    error = er_cls(fields=fields)
+
+                elif mtype == b'1':
+                    # ParseComplete
+                    self.buffer.discard_message()
+                    stmt_name = parsing.pop()
+                    if stmt_name is not None:
+                        self.prep_stmts[stmt_name] = dbver
+
+                elif mtype in {b'n', b'2', b'3'}:
+                    # NoData
+                    # BindComplete
+                    # CloseComplete
+                    self.buffer.discard_message()
+
+                elif mtype == b'Z':
+                    # ReadyForQuery
+                    self.parse_sync_message()
+                    break
+
+                else:
+                    self.fallthrough()
+
+            finally:
+                self.buffer.finish_message()
+
+        if error is not None:
+            raise error
+
+        return [
+            self._decode_json_result(outs[i], queries[i][0])
+            for i in range(len(queries))
+        ]
+
+    async def parse_execute_json_batch(self, list queries, dbver):
+        """Run ``(sql, sql_hash, use_prep_stmt, args)`` JSON queries.
+
+        The queries are pipelined: they are sent at once and run in a
+        single implicit transaction.  Returns the JSON result of every
+        query; if any of them fails, the error is raised instead.
+        """
+        self.before_command()
+        started_at = time.monotonic()
+        try:
+            return await self._parse_execute_json_batch(queries, dbver)
+        finally:
+            metrics.backend_query_duration.observe(
+                time.monotonic() - started_at)
+            await self.after_command()
+
     async def _parse_execute_extract_single_data_frame(
         self,
         sql,
@@ -1091,6 +1305,9 @@ cdef class PGConnection:
                         if buf.len() >= DATA_BUFFER_SIZE:
                             edgecon.write(buf)
                             buf = None
+                            write_waiter = edgecon.get_write_waiter()
+                            if write_waiter is not None:
+                                await self._wait_for_client(write_waiter)
 
                     elif mtype == b'C':  ## result
                         # CommandComplete
@@ -1143,6 +1360,19 @@ cdef class PGConnection:
         finally:
             await self.wait_for_sync()
 
+    async def _wait_for_client(self, write_waiter):
+        # The client doesn't keep up with reading the result.  Stop
+        # reading from Postgres until it does, so that the result
+        # isn't buffered in memory; Postgres will block on its socket.
+        if self.transport is None:
+            raise ConnectionAbortedError
+        self.transport.pause_reading()
+        try:
+            await write_waiter
+        finally:
+            if self.transport is not None:
+                self.transport.resume_reading()
+
     async def parse_execute(
         self,
         object query,
@@ -1433,22 +1663,24 @@ cdef class PGConnection:
         if er is not None:
             raise er[0](fields=er[1])
 
-        buf = WriteBuffer.new()
-        cpython.PyBytes_AsStringAndSize(data, &cbuf, &clen)
         if (
             restore_block.compat_elided_cols
             or any(desc for desc in restore_block.data_mending_desc)
         ):
-            self._rewrite_copy_data(
-                buf,
-                cbuf,
-                clen,
+            # Rewriting a large block takes a while; do it in a thread,
+            # so that the other connections are served in the meantime.
+            buf = await self.loop.run_in_executor(
+                None,
+                self._mend_copy_data,
+                data,
                 ncols,
                 restore_block.data_mending_desc,
                 type_map,
                 restore_block.compat_elided_cols,
             )
         else:
+            buf = WriteBuffer.new()
+            cpython.PyBytes_AsStringAndSize(data, &cbuf, &clen)
             if cbuf[0] != b'd':
                 raise RuntimeError('unexpected dump data message structure')
             ln = <uint32_t>hton.unpack_int32(cbuf + 1)
@@ -1484,6 +1716,33 @@ cdef class PGConnection:
         if er is not None:
             raise er[0](fields=er[1])
 
+    def _mend_copy_data(
+        self,
+        bytes data,
+        ssize_t ncols,
+        tuple data_mending_desc,
+        dict type_id_map,
+        tuple elided_cols,
+    ):
+        # Called in a thread by _restore(); doesn't touch the connection.
+        cdef:
+            WriteBuffer buf
+            char* cbuf
+            ssize_t clen
+
+        buf = WriteBuffer.new()
+        cpython.PyBytes_AsStringAndSize(data, &cbuf, &clen)
+        self._rewrite_copy_data(
+            buf,
+            cbuf,
+            clen,
+            ncols,
+            data_mending_desc,
+            type_id_map,
+            elided_cols,
+        )
+        return buf
+
     cdef _rewrite_copy_data(
         self,
         WriteBuffer wbuf,
@@ -1508,6 +1767,7 @@ cdef class PGConnection:
             const char *datum
             bint first = True
             bint received_eof = False
+            ssize_t nrows = 0
 
         real_ncols = ncols + len(elided_cols)
         frb_init(&rbuf, data, data_len)
@@ -1550,6 +1810,13 @@ cdef class PGConnection:
                 else:
                     mbuf.write_int16(<int16_t>ncols)
 
+                nrows += 1
+                if nrows % 256 == 0:
+                    # This runs in a thread and holds the GIL throughout,
+                    # give the event loop a chance to run.
+                    with nogil:
+                        pass
+
                 # Tuple data
                 for i in range(real_ncols):
                     datum_len = hton.unpack_int32(frb_read(&rbuf, 4))
@@ -1939,7 +2206,8 @@ cdef class PGConnection:
                 event_payload = event_data.get('args')
                 if event == 'schema-changes':
                     dbname = event_payload['dbname']
-                    self.server._on_remote_ddl(dbname)
+                    self.server._on_remote_ddl(
+                        dbname, event_payload.get('changes'))
                 elif event == 'database-config-changes':
                     dbname = event_payload['dbname']
                     self.server._on_remote_database_config_change(dbname)
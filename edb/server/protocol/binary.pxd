@@ -133,7 +133,9 @@ cdef class EdgeConnection:
     cdef char render_cardinality(self, query_unit) except -1
 
     cdef write(self, WriteBuffer buf)
+    cdef write_encoded_msg(self, bytes msg)
     cdef flush(self)
+    cpdef get_write_waiter(self)
 
     cdef abort_pinned_pgcon(self)
 
@@ -144,8 +146,9 @@ cdef class EdgeConnection:
     cdef WriteBuffer recode_bind_args(self,
         bytes bind_args, CompiledQuery compiled)
 
-    cdef WriteBuffer make_describe_msg(self, CompiledQuery query)
-    cdef WriteBuffer make_command_complete_msg(self, query_unit)
+    cdef bytes make_describe_msg(self, CompiledQuery query)
+    cdef bytes make_command_complete_msg(self, query_unit)
+    cdef bytes get_encoded_msg(self, query_unit, char mtype)
 
     cdef inline reject_headers(self)
     cdef dict parse_headers(self)
@@ -67,6 +67,7 @@ from edb.server.pgcon cimport pgcon
 from edb.server.pgcon import errors as pgerror
 from edb.server import metrics
 
+from edb.pgsql import common as pg_common
 from edb.schema import objects as s_obj
 
 from edb import errors
@@ -191,6 +192,20 @@ cdef class QueryRequestInfo:
             self.inline_objectids == other.inline_objectids
         )
 
+    def get_cache_key(self):
+        # A picklable equivalent of this request used as a key in
+        # the persistent query cache.
+        return (
+            self.source.cache_key(),
+            self.protocol_version,
+            self.io_format,
+            self.expect_one,
+            self.implicit_limit,
+            self.inline_typeids,
+            self.inline_typenames,
+            self.inline_objectids,
+        )
+
 
 @cython.final
 cdef class CompiledQuery:
@@ -267,7 +282,10 @@ cdef class EdgeConnection:
     def get_id(self):
         return self._id
 
-    async def get_pgcon(self) -> pgcon.PGConnection:
+    async def get_pgcon(
+        self,
+        bytes stmt_name=None,
+    ) -> pgcon.PGConnection:
         cdef dbview.DatabaseConnectionView _dbview
         if self._cancelled or self._pgcon_released_in_connection_lost:
             raise RuntimeError(
@@ -286,7 +304,11 @@ cdef class EdgeConnection:
                 return self._pinned_pgcon
             if self._pinned_pgcon is not None:
                 raise RuntimeError('there is already a pinned pgcon')
-            conn = await self.server.acquire_pgcon(self.dbname)
+            if stmt_name is not None:
+                conn = await self.server.acquire_pgcon(
+                    self.dbname, stmt_name=stmt_name, dbver=_dbview.dbver)
+            else:
+                conn = await self.server.acquire_pgcon(self.dbname)
             self._pinned_pgcon = conn
             conn.pinned_by = self
             return conn
@@ -364,6 +386,22 @@ cdef class EdgeConnection:
         else:
             self._write_buf = buf
 
+    cdef write_encoded_msg(self, bytes msg):
+        # Same as write(), but for a complete message that is already
+        # encoded; it is copied into the output buffer just once.
+        if self._write_buf is None:
+            self._write_buf = WriteBuffer.new()
+        self._write_buf.write_bytes(msg)
+        if self._write_buf.len() >= FLUSH_BUFFER_AFTER:
+            self.flush()
+
+    cpdef get_write_waiter(self):
+        # A future that is resolved when the client transport can be
+        # written to again, or None if writing isn't paused.
+        if self._write_waiter is not None and not self._write_waiter.done():
+            return self._write_waiter
+        return None
+
     cdef abort_pinned_pgcon(self):
         if self._pinned_pgcon is not None:
             self._pinned_pgcon.pinned_by = None
@@ -494,6 +532,7 @@ cdef class EdgeConnection:
                 f'accept connections'
             )
 
+        await self.server.ensure_db_introspected(database)
         self._start_connection(database, user)
 
         # The user has already been authenticated by other means
@@ -621,6 +660,7 @@ cdef class EdgeConnection:
         script: str,
     ) -> None:
         conn = cls(server)
+        await server.ensure_db_introspected(database)
         conn._start_connection(database, user)
         try:
             await conn._simple_query(
@@ -910,30 +950,72 @@ cdef class EdgeConnection:
                     query_req.inline_objectids,
                 )
             else:
-                units, self.last_state = await compiler_pool.compile(
-                    _dbview.dbname,
-                    _dbview.get_user_schema(),
-                    _dbview.get_global_schema(),
-                    _dbview.reflection_cache,
-                    _dbview.get_database_config(),
-                    _dbview.get_compilation_system_config(),
-                    query_req.source,
-                    _dbview.get_modaliases(),
-                    _dbview.get_session_config(),
-                    query_req.io_format,
-                    query_req.expect_one,
-                    query_req.implicit_limit,
-                    query_req.inline_typeids,
-                    query_req.inline_typenames,
-                    'single',
-                    self.protocol_version,
-                    query_req.inline_objectids,
-                )
+                units, self.last_state = await self._compile_coalesced(
+                    _dbview, query_req)
         finally:
             metrics.edgeql_query_compilation_duration.observe(
                 time.monotonic() - started_at)
         return units
 
+    async def _compile_coalesced(
+        self,
+        dbview.DatabaseConnectionView _dbview,
+        QueryRequestInfo query_req,
+    ):
+        # After a DDL many connections are likely to miss the cache for
+        # the same queries at the same time.  Compile each query once and
+        # have the concurrent requests for it wait for the result.
+        in_flight = _dbview.get_compiles_in_flight()
+        key = _dbview.get_compile_flight_key(query_req)
+
+        fut = in_flight.get(key)
+        if fut is not None:
+            result = await asyncio.shield(fut)
+            # Don't share the compiler state (it is only there if the
+            # query starts a transaction), and compile the query anew if
+            # its compilation failed to get the error for this request.
+            if result is not None and result[1] is None:
+                metrics.edgeql_query_compilations_coalesced.inc()
+                return result
+            return await self._compile_single(_dbview, query_req)
+
+        fut = self.loop.create_future()
+        in_flight[key] = fut
+        result = None
+        try:
+            result = await self._compile_single(_dbview, query_req)
+            return result
+        finally:
+            if in_flight.get(key) is fut:
+                del in_flight[key]
+            fut.set_result(result)
+
+    async def _compile_single(
+        self,
+        dbview.DatabaseConnectionView _dbview,
+        QueryRequestInfo query_req,
+    ):
+        compiler_pool = self.server.get_compiler_pool()
+        return await compiler_pool.compile(
+            _dbview.dbname,
+            _dbview.get_user_schema(),
+            _dbview.get_global_schema(),
+            _dbview.reflection_cache,
+            _dbview.get_database_config(),
+            _dbview.get_compilation_system_config(),
+            query_req.source,
+            _dbview.get_modaliases(),
+            _dbview.get_session_config(),
+            query_req.io_format,
+            query_req.expect_one,
+            query_req.implicit_limit,
+            query_req.inline_typeids,
+            query_req.inline_typenames,
+            'single',
+            self.protocol_version,
+            query_req.inline_objectids,
+        )
+
     async def _compile_script(
         self,
         query: bytes,
@@ -1073,7 +1155,7 @@ cdef class EdgeConnection:
             )
             if stmt_mode == 'done':
                 packet = WriteBuffer.new()
-                packet.write_buffer(
+                packet.write_bytes(
                     self.make_command_complete_msg(query_unit))
                 packet.write_buffer(self.sync_status())
                 self.write(packet)
@@ -1088,7 +1170,7 @@ cdef class EdgeConnection:
             eql, allow_capabilities, stmt_mode)
 
         packet = WriteBuffer.new()
-        packet.write_buffer(self.make_command_complete_msg(query_unit))
+        packet.write_bytes(self.make_command_complete_msg(query_unit))
         packet.write_buffer(self.sync_status())
         self.write(packet)
         self.flush()
@@ -1215,6 +1297,7 @@ cdef class EdgeConnection:
                 self.server._signal_sysevent(
                     'schema-changes',
                     dbname=self.get_dbview().dbname,
+                    changes=self.get_dbview().get_last_schema_changes(),
                 ),
                 interruptable=False,
             )
@@ -1242,11 +1325,20 @@ cdef class EdgeConnection:
             )
 
     def _tokenize(self, eql: bytes) -> edgeql.Source:
+        cdef dbview.DatabaseConnectionView _dbview = self.get_dbview()
+
+        source = _dbview.lookup_source(eql)
+        if source is not None:
+            return source
+
+        started_at = time.monotonic()
         text = eql.decode('utf-8')
         if debug.flags.edgeql_disable_normalization:
-            return edgeql.Source.from_string(text)
+            source = edgeql.Source.from_string(text)
         else:
-            return edgeql.NormalizedSource.from_string(text)
+            source = edgeql.NormalizedSource.from_string(text)
+        _dbview.cache_source(eql, source, time.monotonic() - started_at)
+        return source
 
     async def _parse(
         self,
@@ -1270,6 +1362,7 @@ cdef class EdgeConnection:
         if query_unit is None:
             # Cache miss; need to compile this query.
             cached = False
+            compile_started_at = time.monotonic()
 
             if _dbview.in_tx_error():
                 # The current transaction is aborted; only
@@ -1299,7 +1392,11 @@ cdef class EdgeConnection:
                 _dbview.raise_in_tx_error()
 
         if not cached and query_unit.cacheable:
-            _dbview.cache_compiled_query(query_req, query_unit)
+            _dbview.cache_compiled_query(
+                query_req,
+                query_unit,
+                time.monotonic() - compile_started_at,
+            )
 
         metrics.edgeql_query_compilations.inc(
             1.0,
@@ -1465,76 +1562,72 @@ cdef class EdgeConnection:
         eql, query_req, stmt_name = self.parse_prepare_query_part(True)
         compiled_query = await self._parse(eql, query_req)
 
-        buf = WriteBuffer.new_message(b'1')  # ParseComplete
-
-        if self.protocol_version >= (0, 9):
-            buf.write_int16(1)
-            buf.write_int16(SERVER_HEADER_CAPABILITIES)
-            buf.write_int32(sizeof(uint64_t))
-            buf.write_int64(<int64_t>(
-                <uint64_t>compiled_query.query_unit.capabilities
-            ))
-        else:
-            buf.write_int16(0)  # no headers
-
-        buf.write_byte(self.render_cardinality(compiled_query.query_unit))
-        buf.write_bytes(compiled_query.query_unit.in_type_id)
-        buf.write_bytes(compiled_query.query_unit.out_type_id)
-        buf.end_message()
-
         self._last_anon_compiled = compiled_query
 
-        self.write(buf)
+        self.write_encoded_msg(
+            self.get_encoded_msg(compiled_query.query_unit, b'1'))
 
     #############
 
-    cdef WriteBuffer make_describe_msg(self, CompiledQuery query):
+    cdef bytes make_describe_msg(self, CompiledQuery query):
+        return self.get_encoded_msg(query.query_unit, b'T')
+
+    cdef bytes make_command_complete_msg(self, query_unit):
+        return self.get_encoded_msg(query_unit, b'C')
+
+    cdef bytes get_encoded_msg(self, query_unit, char mtype):
+        # ParseComplete, CommandDataDescription and CommandComplete
+        # only depend on the query unit and on whether the protocol
+        # has headers in them, so for cacheable units they are encoded
+        # once and kept in the unit, which is shared by all connections.
         cdef:
             WriteBuffer msg
+            bint with_headers = self.protocol_version >= (0, 9)
+
+        key = (mtype, with_headers)
+        encoded_msgs = query_unit.encoded_msgs
+        if encoded_msgs is not None:
+            data = encoded_msgs.get(key)
+            if data is not None:
+                return data
 
-        msg = WriteBuffer.new_message(b'T')
-        if self.protocol_version >= (0, 9):
+        msg = WriteBuffer.new_message(mtype)
+        if with_headers:
             msg.write_int16(1)
             msg.write_int16(SERVER_HEADER_CAPABILITIES)
             msg.write_int32(sizeof(uint64_t))
-            msg.write_int64(<int64_t>(<uint64_t>query.query_unit.capabilities))
+            msg.write_int64(<int64_t><uint64_t>query_unit.capabilities)
         else:
             msg.write_int16(0)  # no headers
 
-        msg.write_byte(self.render_cardinality(query.query_unit))
-
-        in_data = query.query_unit.in_type_data
-        msg.write_bytes(query.query_unit.in_type_id)
-        msg.write_len_prefixed_bytes(in_data)
-
-        out_data = query.query_unit.out_type_data
-        msg.write_bytes(query.query_unit.out_type_id)
-        msg.write_len_prefixed_bytes(out_data)
+        if mtype == b'1':  # ParseComplete
+            msg.write_byte(self.render_cardinality(query_unit))
+            msg.write_bytes(query_unit.in_type_id)
+            msg.write_bytes(query_unit.out_type_id)
+        elif mtype == b'T':  # CommandDataDescription
+            msg.write_byte(self.render_cardinality(query_unit))
+            msg.write_bytes(query_unit.in_type_id)
+            msg.write_len_prefixed_bytes(query_unit.in_type_data)
+            msg.write_bytes(query_unit.out_type_id)
+            msg.write_len_prefixed_bytes(query_unit.out_type_data)
+        elif mtype == b'C':  # CommandComplete
+            msg.write_len_prefixed_bytes(query_unit.status)
+        else:
+            raise AssertionError(f'unexpected message type {chr(mtype)!r}')
 
         msg.end_message()
-        return msg
+        data = bytes(memoryview(msg))
 
-    cdef WriteBuffer make_command_complete_msg(self, query_unit):
-        cdef:
-            WriteBuffer msg
-
-        msg = WriteBuffer.new_message(b'C')
-
-        if self.protocol_version >= (0, 9):
-            msg.write_int16(1)
-            msg.write_int16(SERVER_HEADER_CAPABILITIES)
-            msg.write_int32(sizeof(uint64_t))
-            msg.write_int64(<int64_t><uint64_t>query_unit.capabilities)
-        else:
-            msg.write_int16(0)
+        if query_unit.cacheable:
+            if encoded_msgs is None:
+                encoded_msgs = query_unit.encoded_msgs = {}
+            encoded_msgs[key] = data
 
-        msg.write_len_prefixed_bytes(query_unit.status)
-        return msg.end_message()
+        return data
 
     async def describe(self):
         cdef:
             char rtype
-            WriteBuffer msg
 
         self.reject_headers()
 
@@ -1551,8 +1644,8 @@ cdef class EdgeConnection:
                     raise errors.TypeSpecNotFoundError(
                         'no prepared anonymous statement found')
 
-                msg = self.make_describe_msg(self._last_anon_compiled)
-                self.write(msg)
+                self.write_encoded_msg(
+                    self.make_describe_msg(self._last_anon_compiled))
 
         else:
             raise errors.BinaryProtocolError(
@@ -1611,7 +1704,8 @@ cdef class EdgeConnection:
                     assert query_unit.tx_rollback
                     _dbview.abort_tx()
 
-                self.write(self.make_command_complete_msg(query_unit))
+                self.write_encoded_msg(
+                    self.make_command_complete_msg(query_unit))
             finally:
                 self.maybe_release_pgcon(conn)
             return
@@ -1624,7 +1718,11 @@ cdef class EdgeConnection:
         ):
             orig_state = state = _dbview.serialize_state()
         new_types = None
-        conn = await self.get_pgcon()
+        if use_prep_stmt:
+            # Prefer a backend connection that has the statement prepared.
+            conn = await self.get_pgcon(query_unit.sql_hash)
+        else:
+            conn = await self.get_pgcon()
         try:
             if conn.last_state == state:
                 # the current status in conn is in sync with dbview, skip the
@@ -1656,6 +1754,9 @@ cdef class EdgeConnection:
                             state,              # =state
                             _dbview.dbver,      # =dbver
                         )
+                        if use_prep_stmt:
+                            _dbview.note_prepared_stmt(
+                                query_unit.sql_hash, query_unit.sql[0])
                     if state is not None:
                         # state is restored, clear orig_state so that we can
                         # set conn.last_state correctly later
@@ -1700,7 +1801,7 @@ cdef class EdgeConnection:
                     #   3. We came out from a transaction (orig_state is None)
                     conn.last_state = state
 
-            self.write(self.make_command_complete_msg(query_unit))
+            self.write_encoded_msg(self.make_command_complete_msg(query_unit))
         finally:
             self.maybe_release_pgcon(conn)
 
@@ -1797,7 +1898,7 @@ cdef class EdgeConnection:
             if self.debug:
                 self.debug_print('OPTIMISTIC EXECUTE /MISMATCH', query)
 
-            self.write(self.make_describe_msg(compiled))
+            self.write_encoded_msg(self.make_describe_msg(compiled))
 
             if self._cancelled:
                 raise ConnectionAbortedError
@@ -2315,6 +2416,10 @@ cdef class EdgeConnection:
             # We're parsing the protocol. We can abort that.
             self._msg_take_waiter.cancel()
 
+        # Nothing is going to be written anymore; unblock whoever is
+        # waiting for the client to read the data that was sent to it.
+        self.resume_writing()
+
         if (
             self._main_task is not None
             and not self._main_task.done()
@@ -2423,8 +2528,9 @@ cdef class EdgeConnection:
             #   2. in the compiler process we connect to that transaction
             #      and re-introspect the schema in it.
             #
-            #   3. all dump worker pg connection would work on the same
-            #      connection.
+            #   3. all dump worker pg connections would work on the
+            #      snapshot of that transaction; additional connections
+            #      import it with SET TRANSACTION SNAPSHOT.
             #
             # This guarantees that every pg connection and the compiler work
             # with the same DB state.
@@ -2503,15 +2609,35 @@ cdef class EdgeConnection:
             self.flush()
 
             blocks_queue = collections.deque(blocks)
-            output_queue = asyncio.Queue(maxsize=2)
+            # The main job runs even if there are no blocks (e.g. in a
+            # database without object types) to signal the end of data.
+            jobs = max(1, min(server.get_max_dump_restore_jobs(), len(blocks)))
+            snapshot_id = None
+            if jobs > 1:
+                snapshot_id = (await pgcon.simple_query(
+                    b'SELECT pg_export_snapshot()',
+                    ignore_data=False,
+                ))[0][0]
+            output_queue = asyncio.Queue(maxsize=2 * jobs)
 
             async with taskgroup.TaskGroup() as g:
-                g.create_task(pgcon.dump(
+                main_job = g.create_task(pgcon.dump(
                     blocks_queue,
                     output_queue,
                     DUMP_BLOCK_SIZE,
                 ))
-
+                for _ in range(jobs - 1):
+                    g.create_task(self._dump_job(
+                        dbname,
+                        snapshot_id,
+                        main_job,
+                        blocks_queue,
+                        output_queue,
+                    ))
+
+                # Every job dumps whole blocks, so the fragments of a
+                # block are still sent in order; fragments of different
+                # blocks may be interleaved.
                 nstops = 0
                 while True:
                     if self._cancelled:
@@ -2520,8 +2646,7 @@ cdef class EdgeConnection:
                     out = await output_queue.get()
                     if out is None:
                         nstops += 1
-                        if nstops == 1:
-                            # we only have one worker right now
+                        if nstops == jobs:
                             break
                     else:
                         block, block_num, data = out
@@ -2560,6 +2685,79 @@ cdef class EdgeConnection:
         self.write(msg_buf.end_message())
         self.flush()
 
+    async def _acquire_helper_pgcon(self, str dbname, done):
+        # Acquires an additional backend connection for a dump or
+        # restore, unless *done* completes first: the connection would
+        # have nothing to do then, so None is returned instead of
+        # holding up the operation until another connection frees up.
+        server = self.server
+
+        def release_unused(fut):
+            if not fut.cancelled() and fut.exception() is None:
+                server.release_pgcon(dbname, fut.result())
+
+        acquire = asyncio.ensure_future(server.acquire_pgcon(dbname))
+        try:
+            await asyncio.wait(
+                [acquire, done],
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+        except BaseException:
+            acquire.add_done_callback(release_unused)
+            acquire.cancel()
+            raise
+
+        if not acquire.done():
+            acquire.add_done_callback(release_unused)
+            acquire.cancel()
+            return None
+
+        return acquire.result()
+
+    async def _dump_job(
+        self,
+        str dbname,
+        bytes snapshot_id,
+        main_job,
+        blocks_queue,
+        output_queue,
+    ):
+        # Dumps blocks from *blocks_queue* alongside the main dump
+        # connection, over a backend connection of its own that sees
+        # the same snapshot.
+        server = self.server
+
+        pgcon = await self._acquire_helper_pgcon(dbname, main_job)
+        if pgcon is None or not blocks_queue:
+            if pgcon is not None:
+                server.release_pgcon(dbname, pgcon)
+            await output_queue.put(None)
+            return
+
+        try:
+            # SET TRANSACTION SNAPSHOT must come before anything else
+            # in the transaction.
+            await pgcon.simple_query(
+                b'''START TRANSACTION
+                        ISOLATION LEVEL REPEATABLE READ
+                        READ ONLY;
+                    SET TRANSACTION SNAPSHOT ''' +
+                pg_common.quote_literal(snapshot_id.decode()).encode() +
+                b''';
+                    SET idle_in_transaction_session_timeout = 0;
+                    SET statement_timeout = 0;
+                ''',
+                True
+            )
+            await pgcon.dump(blocks_queue, output_queue, DUMP_BLOCK_SIZE)
+            await pgcon.simple_query(b'''ROLLBACK;''', True)
+        except BaseException:
+            # The connection could be left in the middle of a COPY.
+            server.release_pgcon(dbname, pgcon, discard=True)
+            raise
+        else:
+            server.release_pgcon(dbname, pgcon)
+
     async def _execute_utility_stmt(self, eql: str, pgcon):
         cdef dbview.DatabaseConnectionView _dbview
 
@@ -2595,7 +2793,6 @@ cdef class EdgeConnection:
     async def restore(self):
         cdef:
             WriteBuffer msg_buf
-            char mtype
             dbview.DatabaseConnectionView _dbview
 
         _dbview = self.get_dbview()
@@ -2605,7 +2802,7 @@ cdef class EdgeConnection:
             )
 
         self.reject_headers()
-        self.buffer.read_int16()  # discard -j level
+        jobs = self.buffer.read_int16()
 
         # Now parse the embedded dump header message:
 
@@ -2655,6 +2852,17 @@ cdef class EdgeConnection:
 
         self.buffer.finish_message()
         dbname = _dbview.dbname
+
+        # Data is loaded over several backend connections only if the
+        # client asks for it, as the restore can't be done in a single
+        # transaction then: the schema has to be committed first for
+        # the other connections to see it.
+        jobs = max(
+            1, min(jobs, server.get_max_dump_restore_jobs(), len(blocks)))
+        schema_committed = False
+        deferred_builds = []
+        enable_trigger_q = ''
+
         pgcon = await server.acquire_pgcon(dbname)
 
         self._in_dump_restore = True
@@ -2721,7 +2929,6 @@ cdef class EdgeConnection:
             }
 
             disable_trigger_q = ''
-            enable_trigger_q = ''
             for table in tables:
                 disable_trigger_q += (
                     f'ALTER TABLE {table} DISABLE TRIGGER ALL;'
@@ -2735,74 +2942,59 @@ cdef class EdgeConnection:
                 ignore_data=True,
             )
 
+            if jobs > 1:
+                deferred_builds = await self._drop_deferrable_indexes(
+                    pgcon, tables)
+                await self._execute_utility_stmt('COMMIT', pgcon)
+                schema_committed = True
+
             # Send "RestoreReadyMessage"
             msg = WriteBuffer.new_message(b'+')
             msg.write_int16(0)  # no headers
-            msg.write_int16(1)  # -j1
+            msg.write_int16(jobs)
             self.write(msg.end_message())
             self.flush()
 
-            while True:
-                if not self.buffer.take_message():
-                    # Don't report idling when restoring a dump.
-                    # This is an edge case and the client might be
-                    # legitimately slow.
-                    await self.wait_for_message(report_idling=False)
-                mtype = self.buffer.get_message_type()
-
-                if mtype == b'=':
-                    block_type = None
-                    block_id = None
-                    block_num = None
-                    block_data = None
-
-                    num_headers = self.buffer.read_int16()
-                    for _ in range(num_headers):
-                        header = self.buffer.read_int16()
-                        if header == DUMP_HEADER_BLOCK_TYPE:
-                            block_type = self.buffer.read_len_prefixed_bytes()
-                        elif header == DUMP_HEADER_BLOCK_ID:
-                            block_id = self.buffer.read_len_prefixed_bytes()
-                            block_id = pg_UUID(block_id)
-                        elif header == DUMP_HEADER_BLOCK_NUM:
-                            block_num = self.buffer.read_len_prefixed_bytes()
-                        elif header == DUMP_HEADER_BLOCK_DATA:
-                            block_data = self.buffer.read_len_prefixed_bytes()
-
-                    self.buffer.finish_message()
-
-                    if (block_type is None or block_id is None
-                            or block_num is None or block_data is None):
-                        raise errors.ProtocolError('incomplete data block')
-
-                    restore_block = restore_blocks[block_id]
-                    type_id_map = self._build_type_id_map_for_restore_mending(
-                        restore_block)
-                    await pgcon.restore(restore_block, block_data, type_id_map)
-
-                elif mtype == b'.':
-                    self.buffer.finish_message()
-                    break
-
-                else:
-                    self.fallthrough()
+            if jobs > 1:
+                await self._restore_data_parallel(
+                    dbname, pgcon, jobs, restore_blocks, deferred_builds)
+            else:
+                await self._read_restore_data(restore_blocks, pgcon.restore)
 
             await pgcon.simple_query(
                 enable_trigger_q.encode(),
                 ignore_data=True,
             )
 
-        except Exception:
-            await pgcon.simple_query(b'ROLLBACK', ignore_data=True)
-            _dbview.abort_tx()
+        except Exception as ex:
+            if not schema_committed:
+                await pgcon.simple_query(b'ROLLBACK', ignore_data=True)
+                _dbview.abort_tx()
+            else:
+                # The main connection may be left in the middle of
+                # a COPY by a failed load job, and its slot may be
+                # needed by the recovery.
+                server.release_pgcon(dbname, pgcon, discard=True)
+                pgcon = None
+                await self._recover_failed_restore(
+                    dbname, enable_trigger_q, deferred_builds)
+                if isinstance(ex, errors.EdgeDBError):
+                    ex.set_hint_and_details(
+                        f'the schema and part of the data of database '
+                        f'{dbname!r} were committed before the restore '
+                        f'failed; drop and recreate the database before '
+                        f'restoring it again'
+                    )
             raise
 
         else:
-            await self._execute_utility_stmt('COMMIT', pgcon)
+            if not schema_committed:
+                await self._execute_utility_stmt('COMMIT', pgcon)
 
         finally:
             self._in_dump_restore = False
-            server.release_pgcon(dbname, pgcon)
+            if pgcon is not None:
+                server.release_pgcon(dbname, pgcon)
 
         await server.introspect_db(dbname)
 
@@ -2812,6 +3004,224 @@ cdef class EdgeConnection:
         self.write(msg.end_message())
         self.flush()
 
+    async def _recover_failed_restore(
+        self,
+        str dbname,
+        str enable_trigger_q,
+        list deferred_builds,
+    ):
+        # The schema of a restore over several backend connections is
+        # committed before the data is loaded and can't be rolled back,
+        # so at least don't leave the partially restored tables without
+        # their triggers, and their indexes and exclusive constraints.
+        server = self.server
+        logger.warning(
+            'restore of database %r failed after its schema was '
+            'committed; the database is left partially restored', dbname)
+
+        try:
+            pgcon = await server.acquire_pgcon(dbname)
+        except Exception as ex:
+            logger.warning(
+                'could not re-enable triggers and rebuild indexes after '
+                'a failed restore of database %r: %s', dbname, ex)
+            return
+
+        try:
+            for query in (enable_trigger_q.encode(), *deferred_builds):
+                if not query:
+                    continue
+                try:
+                    await pgcon.simple_query(query, ignore_data=True)
+                except Exception as ex:
+                    logger.warning(
+                        'could not restore the triggers or indexes of '
+                        'database %r after a failed restore: %s: %s',
+                        dbname, query.decode(), ex)
+        finally:
+            server.release_pgcon(dbname, pgcon)
+
+        try:
+            await server.introspect_db(dbname)
+        except Exception as ex:
+            logger.warning(
+                'could not introspect database %r after a failed '
+                'restore: %s', dbname, ex)
+
+    async def _read_restore_data(self, dict restore_blocks, on_data):
+        # Reads the data blocks sent by the client until the end of the
+        # dump and passes every one of them to *on_data*.
+        cdef:
+            char mtype
+
+        while True:
+            if not self.buffer.take_message():
+                # Don't report idling when restoring a dump.
+                # This is an edge case and the client might be
+                # legitimately slow.
+                await self.wait_for_message(report_idling=False)
+            mtype = self.buffer.get_message_type()
+
+            if mtype == b'=':
+                block_type = None
+                block_id = None
+                block_num = None
+                block_data = None
+
+                num_headers = self.buffer.read_int16()
+                for _ in range(num_headers):
+                    header = self.buffer.read_int16()
+                    if header == DUMP_HEADER_BLOCK_TYPE:
+                        block_type = self.buffer.read_len_prefixed_bytes()
+                    elif header == DUMP_HEADER_BLOCK_ID:
+                        block_id = self.buffer.read_len_prefixed_bytes()
+                        block_id = pg_UUID(block_id)
+                    elif header == DUMP_HEADER_BLOCK_NUM:
+                        block_num = self.buffer.read_len_prefixed_bytes()
+                    elif header == DUMP_HEADER_BLOCK_DATA:
+                        block_data = self.buffer.read_len_prefixed_bytes()
+
+                self.buffer.finish_message()
+
+                if (block_type is None or block_id is None
+                        or block_num is None or block_data is None):
+                    raise errors.ProtocolError('incomplete data block')
+
+                restore_block = restore_blocks[block_id]
+                type_id_map = self._build_type_id_map_for_restore_mending(
+                    restore_block)
+                await on_data(restore_block, block_data, type_id_map)
+
+            elif mtype == b'.':
+                self.buffer.finish_message()
+                break
+
+            else:
+                self.fallthrough()
+
+    async def _drop_deferrable_indexes(self, pgcon, tables):
+        # Drops the indexes and unique constraints of *tables*, so that
+        # they are built once after the data is loaded instead of being
+        # updated on every row.  Returns the statements recreating them.
+        if not tables:
+            return []
+
+        table_oids = (
+            'ARRAY[' +
+            ', '.join(pg_common.quote_literal(t) for t in tables) +
+            ']::regclass[]'
+        )
+        rows = await pgcon.simple_query(
+            f'''
+                SELECT
+                    'DROP INDEX ' || i.indexrelid::regclass::text,
+                    pg_get_indexdef(i.indexrelid)
+                FROM
+                    pg_index i
+                WHERE
+                    i.indrelid = ANY({table_oids})
+                    AND NOT i.indisprimary
+                    AND NOT EXISTS (
+                        SELECT FROM pg_constraint c
+                        WHERE c.conindid = i.indexrelid
+                    )
+                UNION ALL
+                SELECT
+                    'ALTER TABLE ' || c.conrelid::regclass::text
+                        || ' DROP CONSTRAINT ' || quote_ident(c.conname),
+                    'ALTER TABLE ' || c.conrelid::regclass::text
+                        || ' ADD CONSTRAINT ' || quote_ident(c.conname)
+                        || ' ' || pg_get_constraintdef(c.oid)
+                FROM
+                    pg_constraint c
+                WHERE
+                    c.conrelid = ANY({table_oids})
+                    AND c.contype IN ('u', 'x')
+                    AND NOT EXISTS (
+                        SELECT FROM pg_constraint f
+                        WHERE f.contype = 'f' AND f.conindid = c.conindid
+                    )
+            '''.encode(),
+            ignore_data=False,
+        )
+        if not rows:
+            return []
+
+        await pgcon.simple_query(
+            b';'.join(drop for drop, _ in rows),
+            ignore_data=True,
+        )
+        return [create for _, create in rows]
+
+    async def _restore_data_parallel(
+        self,
+        str dbname,
+        pgcon,
+        int jobs,
+        dict restore_blocks,
+        list deferred_builds,
+    ):
+        # Loads the data blocks over up to *jobs* backend connections,
+        # each in a transaction of its own, and then builds the indexes
+        # dropped by _drop_deferrable_indexes() over the same connections.
+        # The builds that are done are removed from *deferred_builds*,
+        # so that _recover_failed_restore() only runs the rest.
+        server = self.server
+        data_queue = asyncio.Queue(maxsize=2 * jobs)
+        pgcons = [pgcon]
+
+        async def read_data():
+            await self._read_restore_data(
+                restore_blocks,
+                lambda *args: data_queue.put(args),
+            )
+            for _ in range(jobs):
+                await data_queue.put(None)
+
+        async def load_data(conn):
+            await conn.simple_query(
+                b'''START TRANSACTION;
+                    SET idle_in_transaction_session_timeout = 0;
+                    SET statement_timeout = 0;
+                ''',
+                True
+            )
+            while True:
+                item = await data_queue.get()
+                if item is None:
+                    break
+                await conn.restore(*item)
+            await conn.simple_query(b'COMMIT', True)
+
+        async def load_data_extra(reader):
+            conn = await self._acquire_helper_pgcon(dbname, reader)
+            if conn is not None:
+                pgcons.append(conn)
+                await load_data(conn)
+
+        async def build_indexes(conn, builds):
+            while builds:
+                build = builds.popleft()
+                await conn.simple_query(build, True)
+                deferred_builds.remove(build)
+
+        ok = False
+        try:
+            async with taskgroup.TaskGroup() as g:
+                reader = g.create_task(read_data())
+                g.create_task(load_data(pgcon))
+                for _ in range(jobs - 1):
+                    g.create_task(load_data_extra(reader))
+
+            builds = collections.deque(deferred_builds)
+            async with taskgroup.TaskGroup() as g:
+                for conn in pgcons:
+                    g.create_task(build_indexes(conn, builds))
+            ok = True
+        finally:
+            for conn in pgcons[1:]:
+                server.release_pgcon(dbname, conn, discard=not ok)
+
     def _build_type_id_map_for_restore_mending(self, restore_block):
         type_map = {}
         descriptor_stack = []
@@ -17,6 +17,7 @@
 #
 
 
+import asyncio
 import http
 import json
 import urllib.parse
@@ -26,6 +27,7 @@ import immutables
 from edb import errors
 from edb import edgeql
 from edb.server import defines as edbdef
+from edb.server import metrics
 from edb.server.pgcon import errors as pgerrors
 
 from edb.common import debug
@@ -56,16 +58,21 @@ async def handle_request(
 
     variables = None
     query = None
+    batch = None
 
     try:
         if request.method == b'POST':
             if request.content_type and b'json' in request.content_type:
                 body = json.loads(request.body)
-                if not isinstance(body, dict):
+                if isinstance(body, list):
+                    batch = _parse_batch(body)
+                elif not isinstance(body, dict):
                     raise TypeError(
-                        'the body of the request must be a JSON object')
-                query = body.get('query')
-                variables = body.get('variables')
+                        'the body of the request must be a JSON object '
+                        'or an array of JSON objects')
+                else:
+                    query = body.get('query')
+                    variables = body.get('variables')
             else:
                 raise TypeError(
                     'unable to interpret EdgeQL POST request')
@@ -90,11 +97,8 @@ async def handle_request(
         else:
             raise TypeError('expected a GET or a POST request')
 
-        if not query:
-            raise TypeError('invalid EdgeQL request: query is missing')
-
-        if variables is not None and not isinstance(variables, dict):
-            raise TypeError('"variables" must be a JSON object')
+        if batch is None:
+            _check_query(query, variables)
 
     except Exception as ex:
         if debug.flags.server:
@@ -108,7 +112,10 @@ async def handle_request(
     response.status = http.HTTPStatus.OK
     response.content_type = b'application/json'
     try:
-        result = await execute(db, server, query.encode(), variables)
+        if batch is not None:
+            result = await execute_batch(db, server, batch)
+        else:
+            result = await execute(db, server, query.encode(), variables)
     except Exception as ex:
         if debug.flags.server:
             markup.dump(ex)
@@ -126,7 +133,38 @@ async def handle_request(
 
         response.body = json.dumps({'error': err_dct}).encode()
     else:
-        response.body = b'{"data":' + result + b'}'
+        if batch is not None:
+            response.body = b'[' + b','.join(
+                b'{"data":' + data + b'}' for data in result) + b']'
+        else:
+            response.body = b'{"data":' + result + b'}'
+
+
+def _check_query(query, variables):
+    if not query:
+        raise TypeError('invalid EdgeQL request: query is missing')
+
+    if variables is not None and not isinstance(variables, dict):
+        raise TypeError('"variables" must be a JSON object')
+
+
+def _parse_batch(list body):
+    if not body:
+        raise TypeError('invalid EdgeQL request: the batch is empty')
+    if len(body) > edbdef.HTTP_EDGEQL_BATCH_MAX_SIZE:
+        raise TypeError(
+            f'invalid EdgeQL request: the batch has more than '
+            f'{edbdef.HTTP_EDGEQL_BATCH_MAX_SIZE} queries')
+
+    batch = []
+    for item in body:
+        if not isinstance(item, dict):
+            raise TypeError('every item of the batch must be a JSON object')
+        query = item.get('query')
+        variables = item.get('variables')
+        _check_query(query, variables)
+        batch.append((query.encode(), variables))
+    return batch
 
 
 async def compile(db, server, bytes query):
@@ -155,8 +193,7 @@ async def compile(db, server, bytes query):
     return units[0]
 
 
-async def execute(db, server, bytes query, variables):
-    dbver = db.dbver
+async def _get_query_unit(db, server, bytes query, dbver):
     query_cache = server._http_query_cache
 
     cache_key = ('edgeql_http', query, dbver)
@@ -177,6 +214,10 @@ async def execute(db, server, bytes query, variables):
         # This is at least the second time this query is used.
         use_prep_stmt = True
 
+    return query_unit, use_prep_stmt
+
+
+def _get_args(query_unit, variables):
     args = []
     if query_unit.in_type_args:
         for param in query_unit.in_type_args:
@@ -189,6 +230,33 @@ async def execute(db, server, bytes query, variables):
                     raise errors.QueryError(
                         f'parameter ${param.name} is required')
                 args.append(value)
+    return args
+
+
+async def execute(db, server, bytes query, variables):
+    dbver = db.dbver
+    query_unit, use_prep_stmt = await _get_query_unit(
+        db, server, query, dbver)
+    args = _get_args(query_unit, variables)
+
+    result_cache = server.get_http_result_cache()
+    if (
+        result_cache is not None
+        and not query_unit.has_dml
+        and not query_unit.is_volatile
+    ):
+        result_key = ('edgeql_http', query_unit.sql_hash, dbver,
+                      json.dumps(args))
+        data = result_cache.get(db.name, result_key)
+        if data is not None:
+            metrics.http_result_cache_hits.inc()
+            return data
+        metrics.http_result_cache_misses.inc()
+        # Taken before running the query so that the result of a query
+        # that raced with a data modification is not cached.
+        generation = result_cache.get_generation(db.name)
+    else:
+        result_cache = None
 
     pgcon = await server.acquire_pgcon(db.name)
     try:
@@ -197,9 +265,50 @@ async def execute(db, server, bytes query, variables):
             use_prep_stmt, args)
     finally:
         server.release_pgcon(db.name, pgcon)
+        if query_unit.has_dml:
+            server._on_local_data_change(db.name)
 
     if data is None:
         raise errors.InternalServerError(
             f'no data received for a JSON query {query_unit.sql[0]!r}')
 
+    if result_cache is not None:
+        result_cache.set(db.name, result_key, data, generation=generation)
+
     return data
+
+
+async def execute_batch(db, server, list batch):
+    # Queries that are not in the cache are compiled concurrently,
+    # which lets the compiler pool batch them, and then all of them
+    # are run over one backend connection in a single round trip.
+    # The batch is atomic: it runs in one implicit transaction.
+    dbver = db.dbver
+    compiled = await asyncio.gather(*(
+        _get_query_unit(db, server, query, dbver)
+        for query, _ in batch
+    ))
+
+    queries = []
+    for (query_unit, use_prep_stmt), (_, variables) in zip(compiled, batch):
+        queries.append((
+            query_unit.sql[0],
+            query_unit.sql_hash,
+            use_prep_stmt,
+            _get_args(query_unit, variables),
+        ))
+
+    pgcon = await server.acquire_pgcon(db.name)
+    try:
+        results = await pgcon.parse_execute_json_batch(queries, dbver)
+    finally:
+        server.release_pgcon(db.name, pgcon)
+        if any(query_unit.has_dml for query_unit, _ in compiled):
+            server._on_local_data_change(db.name)
+
+    for data, (sql, *_) in zip(results, queries):
+        if data is None:
+            raise errors.InternalServerError(
+                f'no data received for a JSON query {sql!r}')
+
+    return results
@@ -400,6 +400,7 @@ cdef class HttpProtocol:
         # Check if this is a request to a registered extension
         if len(path_parts) >= 3 and path_parts[0] == 'db':
             root, dbname, extname, *args = path_parts
+            await self.server.ensure_db_introspected(dbname)
             db = self.server.maybe_get_db(dbname=dbname)
             if extname == 'edgeql':
                 extname = 'edgeql_http'
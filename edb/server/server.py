@@ -29,6 +29,7 @@ import ipaddress
 import json
 import logging
 import os
+import pathlib
 import pickle
 import socket
 import ssl
@@ -43,7 +44,9 @@ import immutables
 from edb import errors
 
 from edb.common import devmode
+from edb.common import lru
 from edb.common import taskgroup
+from edb.common import uuidgen
 from edb.common import windowedsum
 
 from edb.schema import reflection as s_refl
@@ -57,6 +60,8 @@ from edb.server import connpool
 from edb.server import compiler_pool
 from edb.server import defines
 from edb.server import protocol
+from edb.server.cache import persistent as cache_persistent
+from edb.server.cache import results as cache_results
 from edb.server.ha import base as ha_base
 from edb.server.ha import adaptive as adaptive_ha
 from edb.server.protocol import binary  # type: ignore
@@ -90,6 +95,7 @@ class Server(ha_base.ClusterProtocol):
     _instance_data: Mapping[str, str]
     _sys_queries: Mapping[str, str]
     _local_intro_query: bytes
+    _local_intro_changes_query: bytes
     _global_intro_query: bytes
     _report_config_typedesc: bytes
     _report_config_data: bytes
@@ -141,6 +147,12 @@ class Server(ha_base.ClusterProtocol):
         startup_script: Optional[srvargs.StartupScript] = None,
         backend_adaptive_ha: bool = False,
         default_auth_method: srvargs.ServerAuthMethod,
+        query_cache_dir: Optional[pathlib.Path] = None,
+        http_result_cache_size: int = 0,
+        http_result_cache_ttl: float = defines.HTTP_RESULT_CACHE_TTL,
+        lazy_db_introspection: bool = False,
+        db_idle_timeout: float = 0,
+        backend_prepare_hot_stmts: int = 0,
     ):
         self.__loop = asyncio.get_running_loop()
         self._config_settings = config.get_settings()
@@ -220,10 +232,35 @@ class Server(ha_base.ClusterProtocol):
 
         self._http_query_cache = cache.StatementsCache(
             maxsize=defines.HTTP_PORT_QUERY_CACHE_SIZE)
+        self._graphql_persisted_queries = lru.LRUMapping(
+            maxsize=defines.HTTP_PORT_PERSISTED_QUERIES_SIZE)
+        if http_result_cache_size > 0:
+            self._http_result_cache = cache_results.ResultCache(
+                maxsize=http_result_cache_size, ttl=http_result_cache_ttl)
+        else:
+            self._http_result_cache = None
 
         self._http_last_minute_requests = windowedsum.WindowedSum()
         self._http_request_logger = None
 
+        if query_cache_dir is not None:
+            self._persistent_query_cache = (
+                cache_persistent.PersistentQueryCache(query_cache_dir))
+        else:
+            self._persistent_query_cache = None
+        self._persistent_query_cache_saver = None
+
+        self._lazy_db_introspection = lazy_db_introspection
+        self._db_idle_timeout = db_idle_timeout
+        self._backend_prepare_hot_stmts = backend_prepare_hot_stmts
+        self._db_idle_evictor = None
+        # Introspections of stub databases currently in progress,
+        # see `ensure_db_introspected()`.
+        self._db_introspections = {}
+        # Saves of the persistent query cache of evicted databases
+        # still in progress, see `_on_idle_db_evicted()`.
+        self._evicted_db_cache_saves = {}
+
         self._task_group = None
         self._stop_evt = asyncio.Event()
         self._tls_cert_file = None
@@ -349,11 +386,38 @@ class Server(ha_base.ClusterProtocol):
                 )
             metrics.total_backend_connections.inc()
             metrics.current_backend_connections.inc()
+            if (
+                self._backend_prepare_hot_stmts > 0
+                and dbname != defines.EDGEDB_SYSTEM_DB
+            ):
+                await self._prepare_hot_stmts(dbname, rv)
             return rv
         else:
             rv.terminate()
             raise ConnectionError("connected to outdated Postgres master")
 
+    async def _prepare_hot_stmts(self, dbname, conn):
+        # Prepare the statements recently run against the database, so
+        # that the first queries on the new connection don't have to.
+        if self._dbindex is None:
+            return
+        db = self._dbindex.maybe_get_db(dbname)
+        if db is None:
+            return
+        stmts = db.get_hot_stmts()
+        if not stmts:
+            return
+        try:
+            prepared = await conn.prepare_statements(stmts, db.dbver)
+        except Exception as ex:
+            # Not fatal: the statements will be prepared on first use,
+            # and a broken connection is discarded by acquire_pgcon().
+            logger.debug(
+                'could not prepare statements on a new connection to '
+                '%r: %s', dbname, ex)
+        else:
+            metrics.backend_prepared_stmt_warmups.inc(prepared)
+
     async def _pg_disconnect(self, conn):
         metrics.current_backend_connections.dec()
         conn.terminate()
@@ -377,10 +441,12 @@ class Server(ha_base.ClusterProtocol):
                 std_schema=self._std_schema,
                 global_schema=global_schema,
                 sys_config=sys_config,
+                hot_stmts_size=self._backend_prepare_hot_stmts,
             )
 
             self._fetch_roles()
             await self._introspect_dbs()
+            self._load_persistent_query_caches()
 
             # Now, once all DBs have been introspected, start listening on
             # any notifications about schema/roles/etc changes.
@@ -486,6 +552,9 @@ class Server(ha_base.ClusterProtocol):
     def get_compiler_pool(self):
         return self._compiler_pool
 
+    def get_http_result_cache(self):
+        return self._http_result_cache
+
     def get_suggested_client_pool_size(self) -> int:
         return self._suggested_client_pool_size
 
@@ -510,15 +579,27 @@ class Server(ha_base.ClusterProtocol):
     def get_compilation_system_config(self):
         return self._dbindex.get_compilation_system_config()
 
-    async def acquire_pgcon(self, dbname):
+    async def acquire_pgcon(self, dbname, *, stmt_name=None, dbver=None):
+        # If *stmt_name* is given, a connection that already has
+        # that statement prepared for *dbver* is preferred.
         if self._pg_unavailable_msg is not None:
             raise errors.BackendUnavailableError(
                 'Postgres is not available: ' + self._pg_unavailable_msg
             )
 
+        if stmt_name is not None:
+            prefer = lambda conn: conn.has_prepared(stmt_name, dbver)
+        else:
+            prefer = None
+
         for _ in range(self._pg_pool.max_capacity + 1):
-            conn = await self._pg_pool.acquire(dbname)
+            conn = await self._pg_pool.acquire(dbname, prefer=prefer)
             if conn.is_healthy():
+                if prefer is not None:
+                    if prefer(conn):
+                        metrics.backend_prepared_stmt_hits.inc()
+                    else:
+                        metrics.backend_prepared_stmt_misses.inc()
                 return conn
             else:
                 logger.warning('Acquired an unhealthy pgcon; discard now.')
@@ -644,13 +725,74 @@ class Server(ha_base.ClusterProtocol):
             schema_class_layout=self._schema_class_layout,
         )
 
-    async def introspect_db(self, dbname):
+    async def _introspect_user_schema_changes(self, conn, db, changes):
+        """Apply the schema changes made by another server.
+
+        Only the objects listed in *changes* (see the "schema-changes"
+        system event) are fetched and parsed.  Returns None if that
+        is not enough to get to the new schema version, e.g. when this
+        server missed an earlier change.
+        """
+        changed = changes.get('changed')
+        deleted = changes.get('deleted')
+        if not isinstance(changed, list) or not isinstance(deleted, list):
+            return None
+
+        schema = db.user_schema
+        base_version = dbview.get_user_schema_version(schema)
+        if str(base_version) != changes.get('base_version'):
+            return None
+
+        json_data = await conn.parse_execute_json(
+            self._local_intro_changes_query, b'__local_intro_db_changes',
+            dbver=0, use_prep_stmt=True, args=(changed,),
+        )
+
+        if db.user_schema is not schema:
+            # The schema was refreshed while we were fetching the changes.
+            return None
+
+        base_schema = s_schema.ChainedSchema(
+            self._std_schema,
+            schema,
+            self.get_global_schema(),
+        )
+
+        try:
+            new_schema = s_refl.parse_changes_into(
+                base_schema=base_schema,
+                schema=schema,
+                data=json_data,
+                stale_ids=[
+                    uuidgen.UUID(objid) for objid in changed + deleted
+                ],
+                schema_class_layout=self._schema_class_layout,
+            )
+        except Exception:
+            logger.warning(
+                'could not apply schema changes to database %r',
+                db.name, exc_info=True)
+            return None
+
+        # The objects are fetched in their current state, which might
+        # already include later changes.
+        version = dbview.get_user_schema_version(new_schema)
+        if str(version) != changes.get('version'):
+            return None
+
+        return new_schema
+
+    async def introspect_db(self, dbname, *, schema_changes=None):
         """Use this method to (re-)introspect a DB.
 
         If the DB is already registered in self._dbindex, its
         schema, config, etc. would simply be updated. If it's missing
         an entry for it would be created.
 
+        If *schema_changes* describing the changes made to the schema
+        by a remote DDL are passed, only the changed schema objects are
+        reintrospected if possible.
+
         All remote notifications of remote events should use this method
         to refresh the state. Even if the remote event was a simple config
         change, a lot of other events could happen before it was sent to us
@@ -669,14 +811,25 @@ class Server(ha_base.ClusterProtocol):
                     "Detected concurrently-dropped database %s; skipping.",
                     dbname,
                 )
-                if self._dbindex is not None and self._dbindex.has_db(dbname):
+                if self._dbindex is not None and (
+                    self._dbindex.has_db(dbname)
+                    or self._dbindex.has_db_stub(dbname)
+                ):
                     self._dbindex.unregister_db(dbname)
                 return
             else:
                 raise
 
         try:
-            user_schema = await self.introspect_user_schema(conn)
+            user_schema = None
+            db = self._dbindex.maybe_get_db(dbname)
+            if schema_changes is not None and db is not None:
+                user_schema = await self._introspect_user_schema_changes(
+                    conn, db, schema_changes)
+                if user_schema is not None:
+                    metrics.schema_incremental_reintrospections.inc()
+            if user_schema is None:
+                user_schema = await self.introspect_user_schema(conn)
 
             reflection_cache_json = await conn.parse_execute_json(
                 b'''
@@ -757,6 +910,13 @@ class Server(ha_base.ClusterProtocol):
         finally:
             self._release_sys_pgcon()
 
+        if self._lazy_db_introspection:
+            # Databases are introspected on first use,
+            # see ensure_db_introspected().
+            for dbname in dbnames:
+                self._dbindex.register_db_stub(dbname)
+            return
+
         async with taskgroup.TaskGroup(name='introspect DBs') as g:
             for dbname in dbnames:
                 # There's a risk of the DB being dropped by another server
@@ -764,6 +924,143 @@ class Server(ha_base.ClusterProtocol):
                 # information about them.
                 g.create_task(self.introspect_db(dbname))
 
+    async def ensure_db_introspected(self, dbname: str) -> None:
+        """Introspect *dbname* if it is only registered as a stub.
+
+        Concurrent callers wait for the same introspection.  Does nothing
+        for databases that are already introspected or are not known
+        at all, in which case the following lookup reports the error.
+        """
+        assert self._dbindex is not None
+
+        if self._dbindex.has_db_stub(dbname):
+            task = self._db_introspections.get(dbname)
+            if task is None:
+                task = self.__loop.create_task(
+                    self._introspect_db_stub(dbname))
+                self._db_introspections[dbname] = task
+                task.add_done_callback(
+                    lambda _: self._db_introspections.pop(dbname, None))
+            # Don't let a cancelled waiter cancel the introspection
+            # other connections are waiting for as well.
+            await asyncio.shield(task)
+
+        db = self._dbindex.maybe_get_db(dbname)
+        if db is not None:
+            db.touch()
+
+    async def _introspect_db_stub(self, dbname: str) -> None:
+        started_at = time.monotonic()
+        await self.introspect_db(dbname)
+        metrics.db_lazy_introspections.inc()
+        logger.debug(
+            'introspected database %r on first use in %.3fs',
+            dbname, time.monotonic() - started_at)
+
+        save = self._evicted_db_cache_saves.get(dbname)
+        if save is not None:
+            # The queries compiled before the database was evicted
+            # must be saved before the cache is loaded back.
+            await asyncio.wait([save])
+
+        db = self._dbindex.maybe_get_db(dbname)
+        if db is not None:
+            self._load_persistent_query_cache(db)
+
+    def _on_idle_db_evicted(self, db) -> None:
+        # Called by the DB index before the caches of *db* are dropped.
+        if self._compiler_pool is not None:
+            self._compiler_pool.forget_db(db.name)
+
+        if self._persistent_query_cache is None:
+            return
+        snapshots = [
+            (db.name, db.get_cache_fingerprint(), db.get_persisted_queries())
+        ]
+        task = self.__loop.create_task(
+            self._save_evicted_db_query_cache(snapshots))
+        self._evicted_db_cache_saves[db.name] = task
+
+        def done(_):
+            if self._evicted_db_cache_saves.get(db.name) is task:
+                del self._evicted_db_cache_saves[db.name]
+
+        task.add_done_callback(done)
+
+    async def _save_evicted_db_query_cache(self, snapshots):
+        try:
+            await self._write_persistent_query_caches(snapshots)
+        except Exception:
+            metrics.background_errors.inc(1.0, 'save_persistent_query_cache')
+            logger.exception('could not save the persistent query cache')
+
+    async def _db_idle_evictor_loop(self):
+        while True:
+            await asyncio.sleep(
+                max(self._db_idle_timeout / 2,
+                    defines.DB_IDLE_EVICTION_MIN_INTERVAL))
+            try:
+                evicted = self._dbindex.evict_idle_dbs(self._db_idle_timeout)
+            except Exception:
+                metrics.background_errors.inc(1.0, 'evict_idle_dbs')
+                logger.exception('could not evict idle databases')
+            else:
+                if evicted:
+                    metrics.db_idle_evictions.inc(len(evicted))
+                    logger.info(
+                        'evicted schemas of %d idle database(s): %s',
+                        len(evicted), ', '.join(evicted))
+
+    def _load_persistent_query_caches(self):
+        if self._persistent_query_cache is None:
+            return
+
+        self._persistent_query_cache.ensure_dir()
+
+        total = 0
+        for db in self._dbindex.iter_dbs():
+            total += self._load_persistent_query_cache(db)
+
+        logger.info(
+            'Loaded %d compiled queries from the persistent query cache',
+            total,
+        )
+
+    def _load_persistent_query_cache(self, db) -> int:
+        if self._persistent_query_cache is None:
+            return 0
+        entries = self._persistent_query_cache.load(
+            db.name, db.get_cache_fingerprint())
+        db.set_persisted_queries(entries)
+        return len(entries)
+
+    async def _save_persistent_query_caches(self):
+        # The snapshot of the caches is taken on the event loop, only
+        # pickling and writing the files happens in the executor.
+        snapshots = [
+            (db.name, db.get_cache_fingerprint(), db.get_persisted_queries())
+            for db in self._dbindex.iter_dbs()
+        ]
+        await self._write_persistent_query_caches(snapshots)
+
+    async def _write_persistent_query_caches(self, snapshots):
+        def save():
+            for dbname, fingerprint, entries in snapshots:
+                self._persistent_query_cache.save(
+                    dbname, fingerprint, entries)
+
+        await self.__loop.run_in_executor(None, save)
+
+    async def _persistent_query_cache_saver_loop(self):
+        while True:
+            await asyncio.sleep(defines.PERSISTENT_QUERY_CACHE_SAVE_INTERVAL)
+            try:
+                await self._save_persistent_query_caches()
+            except Exception:
+                metrics.background_errors.inc(
+                    1.0, 'save_persistent_query_cache')
+                logger.exception('could not save the persistent query cache')
+
     def _fetch_roles(self):
         global_schema = self._dbindex.get_global_schema()
 
@@ -802,6 +1099,12 @@ class Server(ha_base.ClusterProtocol):
             ''', ignore_data=False)
             self._local_intro_query = result[0][0]
 
+            result = await syscon.simple_query(b'''\
+                SELECT text FROM edgedbinstdata.instdata
+                WHERE key = 'local_intro_changes_query';
+            ''', ignore_data=False)
+            self._local_intro_changes_query = result[0][0]
+
             result = await syscon.simple_query(b'''\
                 SELECT text FROM edgedbinstdata.instdata
                 WHERE key = 'global_intro_query';
@@ -959,6 +1262,10 @@ class Server(ha_base.ClusterProtocol):
         try:
             assert self._dbindex is not None
             self._dbindex.unregister_db(dbname)
+            if self._persistent_query_cache is not None:
+                self._persistent_query_cache.drop(dbname)
+            if self._http_result_cache is not None:
+                self._http_result_cache.invalidate(dbname)
         except Exception:
             metrics.background_errors.inc(1.0, 'on_after_drop_db')
             raise
@@ -1113,7 +1420,18 @@ class Server(ha_base.ClusterProtocol):
             metrics.background_errors.inc(1.0, 'signal_sysevent')
             raise
 
-    def _on_remote_ddl(self, dbname):
+    async def _refresh_db(self, dbname, *, schema_changes=None):
+        task = self._db_introspections.get(dbname)
+        if task is not None:
+            # The ongoing introspection might have read the state
+            # from before the change.
+            await asyncio.shield(task)
+        elif self._dbindex.has_db_stub(dbname):
+            # Nothing is loaded, the stub is introspected on first use.
+            return
+        await self.introspect_db(dbname, schema_changes=schema_changes)
+
+    def _on_remote_ddl(self, dbname, schema_changes=None):
         if not self._accept_new_tasks:
             return
 
@@ -1121,7 +1439,8 @@ class Server(ha_base.ClusterProtocol):
         # on the __edgedb_sysevent__ channel
         async def task():
             try:
-                await self.introspect_db(dbname)
+                await self._refresh_db(
+                    dbname, schema_changes=schema_changes)
             except Exception:
                 metrics.background_errors.inc(1.0, 'on_remote_ddl')
                 raise
@@ -1136,7 +1455,7 @@ class Server(ha_base.ClusterProtocol):
         # on the __edgedb_sysevent__ channel
         async def task():
             try:
-                await self.introspect_db(dbname)
+                await self._refresh_db(dbname)
             except Exception:
                 metrics.background_errors.inc(
                     1.0, 'on_remote_database_config_change')
@@ -1161,6 +1480,12 @@ class Server(ha_base.ClusterProtocol):
 
         self.create_task(task(), interruptable=True)
 
+    def _on_local_data_change(self, dbname):
+        # Triggered by DB Index after a data-modifying query
+        # has been committed.
+        if self._http_result_cache is not None:
+            self._http_result_cache.invalidate(dbname)
+
     def _on_remote_system_config_change(self):
         if not self._accept_new_tasks:
             return
@@ -1519,6 +1844,16 @@ class Server(ha_base.ClusterProtocol):
             self._request_stats_logger(), interruptable=True
         )
 
+        if self._persistent_query_cache is not None:
+            self._persistent_query_cache_saver = self.create_task(
+                self._persistent_query_cache_saver_loop(), interruptable=True
+            )
+
+        if self._db_idle_timeout > 0:
+            self._db_idle_evictor = self.create_task(
+                self._db_idle_evictor_loop(), interruptable=True
+            )
+
         await self._cluster.start_watching(self)
         await self._create_compiler_pool()
 
@@ -1576,6 +1911,20 @@ class Server(ha_base.ClusterProtocol):
             await self._stop_servers(self._servers.values())
             self._servers = {}
 
+            if self._persistent_query_cache is not None:
+                if self._persistent_query_cache_saver is not None:
+                    self._persistent_query_cache_saver.cancel()
+                    self._persistent_query_cache_saver = None
+                try:
+                    await self._save_persistent_query_caches()
+                except Exception:
+                    logger.exception(
+                        'could not save the persistent query cache')
+
+            if self._db_idle_evictor is not None:
+                self._db_idle_evictor.cancel()
+                self._db_idle_evictor = None
+
             for conn in self._binary_conns:
                 conn.stop()
             self._binary_conns.clear()
@@ -1666,6 +2015,16 @@ class Server(ha_base.ClusterProtocol):
                 call_on_switch_over=False
             )
 
+    def get_max_dump_restore_jobs(self) -> int:
+        # Don't let a single dump or restore take over the pool.
+        return max(
+            1,
+            min(
+                defines.MAX_DUMP_RESTORE_JOBS,
+                self._pg_pool.max_capacity // 4,
+            ),
+        )
+
     def get_active_pgcon_num(self) -> int:
         return (
             self._pg_pool.current_capacity - self._pg_pool.get_pending_conns()
@@ -175,6 +175,29 @@ class EdgeQLTestCase(BaseHttpExtensionTest, server.QueryTestCase):
 
         raise edgedb.EdgeDBError._from_code(ex_code, ex_msg)
 
+    def edgeql_batch_query(self, queries):
+        # *queries* is a list of (query, variables) pairs.
+        req_data = []
+        for query, variables in queries:
+            item = {'query': query}
+            if variables is not None:
+                item['variables'] = variables
+            req_data.append(item)
+
+        req = urllib.request.Request(self.http_addr, method='POST')
+        req.add_header('Content-Type', 'application/json')
+        response = urllib.request.urlopen(
+            req, json.dumps(req_data).encode(), context=self.tls_context
+        )
+        resp_data = json.loads(response.read())
+
+        if isinstance(resp_data, list):
+            return [item['data'] for item in resp_data]
+
+        err = resp_data['error']
+        raise edgedb.EdgeDBError._from_code(
+            err['code'], err['message'].strip())
+
     def assert_edgeql_query_result(self, query, result, *,
                                    msg=None, sort=None,
                                    use_http_post=True,
@@ -203,10 +226,12 @@ class GraphQLTestCase(BaseHttpExtensionTest, server.QueryTestCase):
 
     def graphql_query(self, query, *, operation_name=None,
                       use_http_post=True,
-                      variables=None):
-        req_data = {
-            'query': query
-        }
+                      variables=None,
+                      extensions=None):
+        req_data = {}
+
+        if query is not None:
+            req_data['query'] = query
 
         if operation_name is not None:
             req_data['operationName'] = operation_name
@@ -214,6 +239,8 @@ class GraphQLTestCase(BaseHttpExtensionTest, server.QueryTestCase):
         if use_http_post:
             if variables is not None:
                 req_data['variables'] = variables
+            if extensions is not None:
+                req_data['extensions'] = extensions
             req = urllib.request.Request(self.http_addr, method='POST')
             req.add_header('Content-Type', 'application/json')
             response = urllib.request.urlopen(
@@ -223,6 +250,8 @@ class GraphQLTestCase(BaseHttpExtensionTest, server.QueryTestCase):
         else:
             if variables is not None:
                 req_data['variables'] = json.dumps(variables)
+            if extensions is not None:
+                req_data['extensions'] = json.dumps(extensions)
             response = urllib.request.urlopen(
                 f'{self.http_addr}/?{urllib.parse.urlencode(req_data)}',
                 context=self.tls_context,
@@ -234,6 +263,9 @@ class GraphQLTestCase(BaseHttpExtensionTest, server.QueryTestCase):
 
         err = resp_data['errors'][0]
 
+        if err['message'] == 'PersistedQueryNotFound':
+            raise LookupError(err['message'])
+
         typename, msg = err['message'].split(':', 1)
         msg = msg.strip()
 
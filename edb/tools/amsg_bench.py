@@ -0,0 +1,163 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2022-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""A benchmark of the messaging between the compiler pool and workers.
+
+Sends large pickles, like the schemas synced to the workers after DDL,
+from the hub to an echoing worker and back over the compiler pool
+socket, and times the round trips and the framing of the messages:
+
+    $ edb compiler-ipc-bench --size 1M --size 64M
+"""
+
+
+from __future__ import annotations
+from typing import *
+
+import asyncio
+import os
+import pickle
+import statistics
+import tempfile
+import threading
+import time
+
+import click
+
+from edb.server.compiler_pool import amsg
+from edb.tools.edb import edbcommands
+
+
+# The size of the chunks the framing is fed with, like the reads of
+# the event loop transports.
+CHUNK_SIZE = 256 * 1024
+
+SIZE_SUFFIXES = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+def parse_size(size: str) -> int:
+    mult = SIZE_SUFFIXES.get(size[-1:].upper())
+    try:
+        if mult is None:
+            return int(size)
+        return int(size[:-1]) * mult
+    except ValueError:
+        raise click.BadParameter(f'invalid size: {size!r}') from None
+
+
+def make_payload(size: int) -> bytes:
+    """Return a pickled request of about *size* bytes."""
+    count = max(size // 4096, 1)
+    return pickle.dumps(
+        ('sync', [os.urandom(4096) for _ in range(count)]), -1)
+
+
+def _echo_worker(sockname: str) -> None:
+    con = amsg.WorkerConnection(sockname, 1)
+    try:
+        for req_id, req in con.iter_request():
+            con.reply(req_id, req)
+    finally:
+        con.abort()
+
+
+class _ServerProtocol(amsg.ServerProtocol):
+
+    def __init__(self, connected: asyncio.Future[int]) -> None:
+        self._connected = connected
+
+    def worker_connected(self, pid: int, version: int) -> None:
+        if not self._connected.done():
+            self._connected.set_result(pid)
+
+
+async def time_round_trips(
+    payloads: Sequence[bytes],
+    repeat: int,
+) -> List[List[float]]:
+    loop = asyncio.get_running_loop()
+    connected: asyncio.Future[int] = loop.create_future()
+    timings = []
+
+    with tempfile.TemporaryDirectory() as td:
+        sockname = os.path.join(td, 'bench.sock')
+        server = amsg.Server(sockname, loop, _ServerProtocol(connected))
+        await server.start()
+        worker = threading.Thread(
+            target=_echo_worker, args=(sockname,), daemon=True)
+        worker.start()
+        try:
+            conn = server.get_by_pid(await connected)
+            for payload in payloads:
+                runs = []
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    reply = await conn.request(payload)
+                    runs.append(time.perf_counter() - started)
+                    if reply != payload:
+                        raise click.ClickException(
+                            'the worker replied with a different message')
+                    del reply
+                timings.append(runs)
+        finally:
+            await server.stop()
+            await loop.run_in_executor(None, worker.join)
+
+    return timings
+
+
+def time_framing(payload: bytes, repeat: int) -> List[float]:
+    data = amsg._uint64_packer(len(payload)) + payload
+    chunks = [
+        data[i:i + CHUNK_SIZE] for i in range(0, len(data), CHUNK_SIZE)
+    ]
+    runs = []
+    for _ in range(repeat):
+        stream = amsg.MessageStream()
+        started = time.perf_counter()
+        for chunk in chunks:
+            for _msg in stream.feed_data(chunk):
+                pass
+        runs.append(time.perf_counter() - started)
+    return runs
+
+
+@edbcommands.command('compiler-ipc-bench')
+@click.option(
+    '--size', 'sizes', type=str, multiple=True,
+    default=('64K', '1M', '16M', '64M'),
+    help='approximate size of the pickles sent, e.g. 16M')
+@click.option(
+    '--repeat', type=int, default=5,
+    help='number of round trips of each size')
+def compiler_ipc_bench(*, sizes: Sequence[str], repeat: int) -> None:
+    """Time large messages between the compiler pool and a worker."""
+    payloads = [make_payload(parse_size(size)) for size in sizes]
+    trips = asyncio.run(time_round_trips(payloads, repeat))
+
+    click.echo(
+        f'{"size":>12} {"round trip":>12} {"framing":>12} {"MB/s":>10}')
+    for payload, runs in zip(payloads, trips):
+        trip = statistics.median(runs)
+        framing = statistics.median(time_framing(payload, repeat))
+        # The payload crosses the socket twice per round trip.
+        rate = 2 * len(payload) / trip / 1024 ** 2
+        click.echo(
+            f'{len(payload):>12} {trip * 1000:>10.2f}ms '
+            f'{framing * 1000:>10.2f}ms {rate:>10.1f}')
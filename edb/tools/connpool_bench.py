@@ -0,0 +1,458 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2022-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""A load benchmark of the backend connection pool.
+
+Replays a multi-database workload against the pool with fake
+connections, and reports acquire latencies, connection churn and
+fairness for every block (database):
+
+    $ edb connpool-bench --workload workload.json --format json
+
+A workload is a JSON object describing a synthetic load, e.g.:
+
+    {
+        "duration": 10,
+        "dbs": [
+            {"db": "t1", "qps": 500, "start_at": 0, "end_at": 10,
+             "query_cost_base": 0.01, "query_cost_var": 0.005},
+            {"db": "t2", "qps": 50, "start_at": 2, "end_at": 8,
+             "query_cost_base": 0.1, "query_cost_var": 0.05}
+        ]
+    }
+
+The queries generated from a workload can be saved with --record and
+replayed exactly with --trace, which also accepts traces recorded
+elsewhere: a JSON object with an "events" list of [at, db, duration]
+triples, times in seconds.
+"""
+
+
+from __future__ import annotations
+from typing import *
+
+import asyncio
+import collections
+import dataclasses
+import json
+import random
+import statistics
+import time
+
+import click
+
+from edb import buildmeta
+from edb.common import taskgroup
+from edb.server import connpool
+from edb.tools.edb import edbcommands
+
+
+# Bumped whenever the JSON output changes incompatibly.
+OUTPUT_FORMAT_VERSION = 1
+TRACE_FORMAT_VERSION = 1
+
+# The pace at which the synthetic workload generates queries.
+TICK_EVERY = 0.001
+
+POOLS = {
+    'pool': connpool.Pool,
+    'naive': connpool._NaivePool,
+}
+
+DEFAULT_WORKLOAD = {
+    'duration': 10,
+    'dbs': [
+        {
+            'db': f't{i}',
+            'qps': qps,
+            'start_at': start_at,
+            'end_at': end_at,
+            'query_cost_base': cost,
+            'query_cost_var': cost / 2,
+        }
+        for i, (qps, start_at, end_at, cost) in enumerate([
+            (400, 0, 10, 0.01),
+            (200, 0, 10, 0.03),
+            (50, 2, 8, 0.1),
+            (20, 4, 10, 0.2),
+            (5, 0, 10, 0.5),
+        ])
+    ],
+}
+
+
+class Event(NamedTuple):
+
+    at: float
+    db: str
+    duration: float
+
+
+@dataclasses.dataclass
+class DBWorkload:
+
+    db: str
+    qps: float
+    start_at: float
+    end_at: float
+    query_cost_base: float
+    query_cost_var: float = 0.0
+
+
+@dataclasses.dataclass
+class BlockStats:
+
+    latencies: List[float] = dataclasses.field(default_factory=list)
+    connects: int = 0
+    disconnects: int = 0
+
+
+class FakeConnection:
+
+    def __init__(self, dbname: str) -> None:
+        self.dbname = dbname
+
+
+def generate_events(workload: Mapping[str, Any]) -> List[Event]:
+    """Generate the queries of a synthetic workload."""
+    duration = float(workload['duration'])
+    dbs = [DBWorkload(**db) for db in workload['dbs']]
+
+    events = []
+    ticks = int(duration / TICK_EVERY)
+    for tick in range(ticks):
+        at = tick * TICK_EVERY
+        for db in dbs:
+            if not (db.start_at <= at < db.end_at):
+                continue
+
+            qpt = db.qps * TICK_EVERY
+            qpt = int(random.random() <= qpt - int(qpt)) + int(qpt)
+            for _ in range(qpt):
+                query_duration = max(
+                    db.query_cost_base + random.triangular(
+                        -db.query_cost_var, db.query_cost_var),
+                    0.001,
+                )
+                events.append(Event(at, db.db, query_duration))
+
+    return events
+
+
+def load_trace(path: str) -> List[Event]:
+    with open(path) as f:
+        data = json.load(f)
+
+    version = data.get('version', TRACE_FORMAT_VERSION)
+    if version != TRACE_FORMAT_VERSION:
+        raise click.ClickException(
+            f'unsupported trace format version: {version}')
+
+    events = [
+        Event(float(at), str(db), float(duration))
+        for at, db, duration in data['events']
+    ]
+    events.sort(key=lambda e: e.at)
+    return events
+
+
+def save_trace(path: str, events: List[Event]) -> None:
+    with open(path, 'w') as f:
+        json.dump(
+            {
+                'version': TRACE_FORMAT_VERSION,
+                'events': [list(e) for e in events],
+            },
+            f,
+        )
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """Nearest-rank percentile of already sorted *values*."""
+    if not values:
+        return 0.0
+    rank = max(int(round(q / 100 * len(values))) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def jain_index(values: Sequence[float]) -> float:
+    """Jain's fairness index: 1.0 if all *values* are equal."""
+    if not values:
+        return 1.0
+    total = sum(values)
+    squares = sum(v * v for v in values)
+    if not squares:
+        return 1.0
+    return total * total / (len(values) * squares)
+
+
+async def run_benchmark(
+    events: List[Event],
+    *,
+    pool_cls: Type[Any],
+    capacity: int,
+    conn_cost_base: float,
+    conn_cost_var: float,
+    disconn_cost_base: float,
+    disconn_cost_var: float,
+) -> Tuple[Dict[str, BlockStats], float]:
+    blocks: DefaultDict[str, BlockStats] = (
+        collections.defaultdict(BlockStats))
+
+    async def connect(dbname: str) -> FakeConnection:
+        blocks[dbname].connects += 1
+        dur = conn_cost_base + random.triangular(-conn_cost_var, conn_cost_var)
+        await asyncio.sleep(max(dur, 0.001))
+        return FakeConnection(dbname)
+
+    async def disconnect(conn: FakeConnection) -> None:
+        blocks[conn.dbname].disconnects += 1
+        dur = disconn_cost_base + random.triangular(
+            -disconn_cost_var, disconn_cost_var)
+        await asyncio.sleep(max(dur, 0.001))
+
+    pool = pool_cls(
+        connect=connect,
+        disconnect=disconnect,
+        max_capacity=capacity,
+    )
+
+    async def query(event: Event) -> None:
+        st = time.monotonic()
+        conn = await pool.acquire(event.db)
+        blocks[event.db].latencies.append(time.monotonic() - st)
+        try:
+            await asyncio.sleep(event.duration)
+        finally:
+            pool.release(event.db, conn)
+
+    started_at = time.monotonic()
+    async with taskgroup.TaskGroup() as g:
+        for event in events:
+            delay = event.at - (time.monotonic() - started_at)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            g.create_task(query(event))
+
+    elapsed = time.monotonic() - started_at
+
+    if pool.failed_connects or pool.failed_disconnects:
+        raise click.ClickException(
+            f'the pool failed {pool.failed_connects} connects and '
+            f'{pool.failed_disconnects} disconnects')
+
+    return dict(blocks), elapsed
+
+
+def make_report(
+    blocks: Mapping[str, BlockStats],
+    *,
+    elapsed: float,
+    params: Mapping[str, Any],
+) -> Dict[str, Any]:
+    all_latencies = sorted(
+        lat for block in blocks.values() for lat in block.latencies)
+    total_mean = statistics.fmean(all_latencies) if all_latencies else 0.0
+
+    block_reports = {}
+    for dbname, block in sorted(blocks.items()):
+        latencies = sorted(block.latencies)
+        mean = statistics.fmean(latencies) if latencies else 0.0
+        block_reports[dbname] = {
+            'queries': len(latencies),
+            'p50': percentile(latencies, 50),
+            'p99': percentile(latencies, 99),
+            'mean': mean,
+            'max': latencies[-1] if latencies else 0.0,
+            'connects': block.connects,
+            'disconnects': block.disconnects,
+            # How much longer this block waits for connections than
+            # an average query does; 1.0 is a fair share.
+            'slowdown': mean / total_mean if total_mean else 1.0,
+        }
+
+    # Fairness is measured on the acquire "speed" (inverse mean
+    # latency) of the blocks that ran any queries.
+    speeds = [
+        1 / b['mean'] for b in block_reports.values() if b['mean'] > 0
+    ]
+
+    return {
+        'format_version': OUTPUT_FORMAT_VERSION,
+        'edgedb_version': buildmeta.get_version_string(),
+        'params': dict(params),
+        'elapsed': elapsed,
+        'total': {
+            'queries': len(all_latencies),
+            'p50': percentile(all_latencies, 50),
+            'p99': percentile(all_latencies, 99),
+            'mean': total_mean,
+            'connects': sum(b.connects for b in blocks.values()),
+            'disconnects': sum(b.disconnects for b in blocks.values()),
+            'fairness': jain_index(speeds),
+        },
+        'blocks': block_reports,
+    }
+
+
+def format_report(report: Mapping[str, Any]) -> str:
+    def ms(v: float) -> str:
+        return f'{v * 1000:.2f}'
+
+    header = (
+        f'{"block":<16}{"queries":>9}{"p50 ms":>10}{"p99 ms":>10}'
+        f'{"connects":>10}{"disconn":>10}{"slowdown":>10}'
+    )
+    lines = [
+        f'pool: {report["params"]["pool"]}, '
+        f'capacity: {report["params"]["capacity"]}, '
+        f'elapsed: {report["elapsed"]:.2f}s',
+        '',
+        header,
+        '-' * len(header),
+    ]
+
+    for name, b in report['blocks'].items():
+        lines.append(
+            f'{name:<16}{b["queries"]:>9}{ms(b["p50"]):>10}'
+            f'{ms(b["p99"]):>10}{b["connects"]:>10}{b["disconnects"]:>10}'
+            f'{b["slowdown"]:>10.2f}'
+        )
+
+    t = report['total']
+    lines.append('-' * len(header))
+    lines.append(
+        f'{"total":<16}{t["queries"]:>9}{ms(t["p50"]):>10}'
+        f'{ms(t["p99"]):>10}{t["connects"]:>10}{t["disconnects"]:>10}'
+    )
+    lines.append('')
+    lines.append(f'fairness index: {t["fairness"]:.3f}')
+    return '\n'.join(lines)
+
+
+@edbcommands.command('connpool-bench')
+@click.option(
+    '--workload', type=click.Path(exists=True, dir_okay=False),
+    help='JSON file describing a synthetic workload '
+         '(a built-in one is used by default)')
+@click.option(
+    '--trace', type=click.Path(exists=True, dir_okay=False),
+    help='replay the queries of a recorded trace instead of '
+         'generating a workload')
+@click.option(
+    '--record', type=click.Path(dir_okay=False, writable=True),
+    help='save the generated queries as a trace to replay later')
+@click.option(
+    '--pool', 'pool_name', type=click.Choice(list(POOLS)), default='pool',
+    show_default=True,
+    help='the pool implementation to benchmark')
+@click.option(
+    '--capacity', type=int, default=100, show_default=True,
+    help='the maximum number of connections in the pool')
+@click.option(
+    '--conn-cost', type=float, default=0.05, show_default=True,
+    help='the average time in seconds to open a connection')
+@click.option(
+    '--conn-cost-var', type=float, default=0.01, show_default=True,
+    help='the variation of the time to open a connection')
+@click.option(
+    '--disconn-cost', type=float, default=0.006, show_default=True,
+    help='the average time in seconds to close a connection')
+@click.option(
+    '--disconn-cost-var', type=float, default=0.001, show_default=True,
+    help='the variation of the time to close a connection')
+@click.option(
+    '--seed', type=int, default=0, show_default=True,
+    help='seed of the random generator, for reproducible runs')
+@click.option(
+    '--format', 'output_format', type=click.Choice(['text', 'json']),
+    default='text', show_default=True,
+    help='output format; use json to compare runs across versions')
+@click.option(
+    '-o', '--output', type=click.File('w'), default='-',
+    help='write the report to this file instead of stdout')
+def connpool_bench(
+    *,
+    workload: Optional[str],
+    trace: Optional[str],
+    record: Optional[str],
+    pool_name: str,
+    capacity: int,
+    conn_cost: float,
+    conn_cost_var: float,
+    disconn_cost: float,
+    disconn_cost_var: float,
+    seed: int,
+    output_format: str,
+    output: TextIO,
+) -> None:
+    """Benchmark the connection pool with a replayable workload."""
+    if workload and trace:
+        raise click.UsageError('--workload and --trace are exclusive')
+
+    random.seed(seed)
+
+    if trace:
+        events = load_trace(trace)
+    else:
+        if workload:
+            with open(workload) as f:
+                spec = json.load(f)
+        else:
+            spec = DEFAULT_WORKLOAD
+        events = generate_events(spec)
+
+    if record:
+        save_trace(record, events)
+
+    params = {
+        'pool': pool_name,
+        'capacity': capacity,
+        'conn_cost': conn_cost,
+        'conn_cost_var': conn_cost_var,
+        'disconn_cost': disconn_cost,
+        'disconn_cost_var': disconn_cost_var,
+        'seed': seed,
+        'workload': trace or workload or 'default',
+        'events': len(events),
+    }
+
+    try:
+        import uvloop
+    except ImportError:
+        pass
+    else:
+        uvloop.install()
+
+    blocks, elapsed = asyncio.run(run_benchmark(
+        events,
+        pool_cls=POOLS[pool_name],
+        capacity=capacity,
+        conn_cost_base=conn_cost,
+        conn_cost_var=conn_cost_var,
+        disconn_cost_base=disconn_cost,
+        disconn_cost_var=disconn_cost_var,
+    ))
+
+    report = make_report(blocks, elapsed=elapsed, params=params)
+    if output_format == 'json':
+        json.dump(report, output, indent=2)
+        output.write('\n')
+    else:
+        output.write(format_report(report) + '\n')
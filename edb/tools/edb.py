@@ -67,4 +67,7 @@ from . import inittestdb  # noqa
 from . import test  # noqa
 from . import wipe  # noqa
 from . import gen_test_dumps  # noqa
+from . import connpool_bench  # noqa
+from . import schema_delta_bench  # noqa
+from . import amsg_bench  # noqa
 from .profiling import cli as prof_cli  # noqa
@@ -0,0 +1,217 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2022-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""A benchmark of the schema delta on large synthetic schemas.
+
+Generates a schema with thousands of object types and a changed
+version of it with renamed, altered, dropped and created types, and
+times the migration proposals between the two with and without the
+pruning of the candidate pairs in delta_objects():
+
+    $ edb schema-delta-bench --types 2000 --changed 0.2
+
+The proposals of both runs are checked to be identical.
+"""
+
+
+from __future__ import annotations
+from typing import *
+
+import contextlib
+import random
+import sys
+import time
+
+import click
+
+from edb.schema import ddl as s_ddl
+from edb.schema import defines as s_def
+from edb.schema import schema as s_schema
+from edb.tools.edb import edbcommands
+
+
+PROPERTY_TYPES = ('str', 'int64', 'float64', 'bool', 'datetime', 'json')
+
+# Property names shared by many types, next to the ones that are
+# specific to a type.
+COMMON_PROPERTIES = (
+    'name', 'title', 'description', 'created_at', 'updated_at',
+    'status', 'priority', 'owner_id', 'data', 'version',
+)
+
+
+def _gen_type(
+    name: str,
+    base: str,
+    target: str,
+    props: Mapping[str, str],
+) -> str:
+    body = ''.join(f'property {pn} -> {pt}; ' for pn, pt in props.items())
+    return f'type {name} extending {base} {{ {body}link parent -> {target}; }}'
+
+
+def generate_sdl(
+    *,
+    types: int,
+    changed: float,
+    seed: int,
+) -> Tuple[str, str]:
+    """Return the SDL of a synthetic schema and of its changed version.
+
+    Of the *changed* fraction of the types, a quarter is renamed, a
+    quarter gets an extra property, a quarter is dropped and as many
+    new types are created.
+    """
+    rng = random.Random(seed)
+    bases = [f'Base{i}' for i in range(max(types // 100, 1))]
+    base_decls = [
+        f'abstract type {b} {{ property {b.lower()}_key -> str; }}'
+        for b in bases
+    ]
+
+    props = {}
+    extends = {}
+    for i in range(types):
+        names = rng.sample(COMMON_PROPERTIES, rng.randint(1, 4))
+        names.extend(f'prop{i}_{j}' for j in range(rng.randint(1, 4)))
+        props[i] = {pn: rng.choice(PROPERTY_TYPES) for pn in names}
+        extends[i] = (rng.choice(bases), rng.choice(bases))
+
+    old = [
+        _gen_type(f'Type{i}', *extends[i], props[i]) for i in range(types)
+    ]
+
+    picked = rng.sample(range(types), int(types * changed))
+    quarter = len(picked) // 4
+    renamed = set(picked[:quarter])
+    altered = set(picked[quarter:quarter * 2])
+    dropped = set(picked[quarter * 2:quarter * 3])
+
+    new = []
+    for i in range(types):
+        if i in dropped:
+            continue
+        type_props = dict(props[i])
+        if i in altered:
+            type_props[f'extra{i}'] = rng.choice(PROPERTY_TYPES)
+        name = f'Renamed{i}' if i in renamed else f'Type{i}'
+        new.append(_gen_type(name, *extends[i], type_props))
+
+    for i in range(len(picked) - quarter * 3):
+        type_props = {
+            f'new{i}_{j}': rng.choice(PROPERTY_TYPES) for j in range(3)}
+        new.append(_gen_type(
+            f'NewType{i}', rng.choice(bases), rng.choice(bases), type_props))
+
+    return (
+        '\n'.join(base_decls + old),
+        '\n'.join(base_decls + new),
+    )
+
+
+def load_schema(sdl: str) -> s_schema.Schema:
+    from edb.testbase import lang as tb
+
+    return tb.BaseSchemaTest.load_schema(sdl)
+
+
+def get_proposals(
+    old_schema: s_schema.Schema,
+    new_schema: s_schema.Schema,
+) -> List[Tuple[str, Optional[float]]]:
+    """Return the DDL and confidence of every proposed migration step."""
+    delta = s_ddl.delta_schemas(
+        old_schema,
+        new_schema,
+        generate_prompts=True,
+    )
+    return [
+        (text, cmd.get_annotation('confidence'))
+        for text, _, cmd in s_ddl.statements_from_delta(
+            old_schema, new_schema, delta)
+    ]
+
+
+@contextlib.contextmanager
+def candidate_pruning(enabled: bool) -> Iterator[None]:
+    min_pairs = s_def.DELTA_PRUNE_MIN_PAIRS
+    if not enabled:
+        s_def.DELTA_PRUNE_MIN_PAIRS = sys.maxsize
+    try:
+        yield
+    finally:
+        s_def.DELTA_PRUNE_MIN_PAIRS = min_pairs
+
+
+@edbcommands.command('schema-delta-bench')
+@click.option(
+    '--types', type=int, default=2000,
+    help='number of object types in the synthetic schema')
+@click.option(
+    '--changed', type=float, default=0.2,
+    help='fraction of the object types that are changed')
+@click.option(
+    '--seed', type=int, default=0,
+    help='random seed of the synthetic schema')
+@click.option(
+    '--repeat', type=int, default=1,
+    help='number of timed runs of each variant')
+@click.option(
+    '--no-baseline', is_flag=True,
+    help='only time the proposals with pruning of candidate pairs')
+def schema_delta_bench(
+    *,
+    types: int,
+    changed: float,
+    seed: int,
+    repeat: int,
+    no_baseline: bool,
+) -> None:
+    """Time the migration proposals between large synthetic schemas."""
+    if not 0 <= changed <= 1:
+        raise click.UsageError('--changed must be between 0 and 1')
+
+    old_sdl, new_sdl = generate_sdl(types=types, changed=changed, seed=seed)
+    started = time.monotonic()
+    old_schema = load_schema(old_sdl)
+    new_schema = load_schema(new_sdl)
+    click.echo(
+        f'loaded schemas with {types} types '
+        f'in {time.monotonic() - started:.2f}s')
+
+    variants = [('pruned', True)]
+    if not no_baseline:
+        variants.append(('all pairs', False))
+
+    results = {}
+    for label, enabled in variants:
+        timings = []
+        with candidate_pruning(enabled):
+            for _ in range(repeat):
+                started = time.monotonic()
+                proposals = get_proposals(old_schema, new_schema)
+                timings.append(time.monotonic() - started)
+        results[label] = proposals
+        click.echo(
+            f'{label:>10}: best {min(timings):.2f}s, '
+            f'{len(proposals)} proposed steps')
+
+    if not no_baseline and results['pruned'] != results['all pairs']:
+        raise click.ClickException(
+            'proposals differ with and without pruning of candidate pairs')
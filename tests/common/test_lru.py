@@ -71,3 +71,61 @@ class TestLRU(unittest.TestCase):
 
         l[k4] = l[k4]
         self.assertEqual(list(l), [k1, k5, k4])
+
+    def test_lru_cost_aware_1(self):
+        evicted = []
+        l = lru.CostAwareMapping(  # noqa
+            maxsize=10,
+            sizeof=len,
+            on_evict=lambda k, v: evicted.append(k),
+        )
+
+        k1 = Key('1')
+        k2 = Key('2')
+        k3 = Key('3')
+        k4 = Key('4')
+
+        l.set(k1, 'aaaa', cost=1)
+        l.set(k2, 'bbbb', cost=10)
+        self.assertEqual(l.get_size(), 8)
+
+        # The cheapest entry to recreate goes first.
+        l.set(k3, 'cccc', cost=5)
+        self.assertEqual(evicted, [k1])
+        self.assertEqual(set(l), {k2, k3})
+        self.assertEqual(l.get_size(), 8)
+
+        # Peeking at entries doesn't count as using them.
+        for _ in range(3):
+            self.assertEqual(l.peek(k2), 'bbbb')
+        self.assertIsNone(l.peek(k1))
+
+        # Frequently used entries are kept.
+        for _ in range(3):
+            self.assertEqual(l[k3], 'cccc')
+        l.set(k4, 'dddd', cost=20)
+        self.assertEqual(evicted, [k1, k2])
+        self.assertEqual(set(l), {k3, k4})
+
+        # Values that don't fit are not stored at all.
+        l.set(k1, 'a' * 11)
+        self.assertNotIn(k1, l)
+        self.assertEqual(evicted, [k1, k2, k1])
+
+        # Items can be listed from the first to be evicted to the last.
+        l.set(k2, 'bb', cost=20)
+        self.assertEqual([k for k, _ in l.items_by_priority()], [k3, k4, k2])
+        l[k3]
+        self.assertEqual([k for k, _ in l.items_by_priority()], [k4, k3, k2])
+        del l[k2]
+
+        # Replacing a value updates the size.
+        l[k4] = 'dd'
+        self.assertEqual(l.get_size(), 6)
+        del l[k3]
+        self.assertEqual(l.get_size(), 2)
+        self.assertEqual(list(l.items()), [(k4, 'dd')])
+
+        l.clear()
+        self.assertEqual(len(l), 0)
+        self.assertEqual(l.get_size(), 0)
@@ -358,3 +358,45 @@ class TestPrometheusClient(unittest.TestCase):
         pmc_r = run_pmc()
         emc_r = run_emc()
         self.assertEqual(pmc_r, emc_r)
+
+    def test_prometheus_08(self):
+
+        def run_pmc():
+            registry = PMC.Registry()
+
+            test_hist = PMC.Histogram(
+                'test_labeled_hist_seconds', 'A test labeled histogram',
+                labelnames=['stage'], registry=registry)
+
+            r1 = PMC.generate(registry)
+
+            test_hist.labels('parse').observe(0.22)
+            test_hist.labels('parse').observe(2.0)
+            test_hist.labels('compile').observe(0.01)
+
+            r2 = PMC.generate(registry)
+
+            return [r1, r2]
+
+        def run_emc():
+            r = EP.Registry()
+
+            test_hist = r.new_labeled_histogram(
+                'test_labeled_hist', 'A test labeled histogram',
+                unit=prom.Unit.SECONDS,
+                labels=('stage',),
+            )
+
+            r1 = r.generate()
+
+            test_hist.observe(0.22, 'parse')
+            test_hist.observe(2.0, 'parse')
+            test_hist.observe(0.01, 'compile')
+
+            r2 = r.generate()
+
+            return [r1, r2]
+
+        pmc_r = run_pmc()
+        emc_r = run_emc()
+        self.assertEqual(pmc_r, emc_r)
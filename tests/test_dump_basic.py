@@ -17,13 +17,30 @@
 #
 
 import hashlib
+import io
 import os
 import random
 import tempfile
 
+import edgedb
+
+from edb import protocol
+from edb.common import binwrapper
+from edb.protocol import protocol as tproto
 from edb.testbase import server as tb
 
 
+DUMP_HEADER_BLOCK_DATA = 112
+
+
+def _message_payload(msg):
+    # The contents of a message without its type and length, which is
+    # how Restore and RestoreBlock pass on DumpHeader and DumpBlock.
+    buf = io.BytesIO()
+    type(msg).dump(msg, binwrapper.BinWrapper(buf))
+    return buf.getvalue()
+
+
 class TestDumpBasics(tb.DatabaseTestCase, tb.CLITestCaseMixin):
     DEFAULT_MODULE = 'test'
 
@@ -118,3 +135,204 @@ class TestDumpBasics(tb.DatabaseTestCase, tb.CLITestCaseMixin):
         finally:
             await con2.aclose()
             await self.con.execute(f'DROP DATABASE {restored_dbname}')
+
+    async def test_dump_empty_01(self):
+        if not self.has_create_database:
+            self.skipTest('create database is not supported by the backend')
+
+        # A database without any object types has no data blocks.
+        dbname = f'{self.get_database_name()}_empty'
+        restored_dbname = f'{dbname}_restored'
+
+        await self.con.execute(f'CREATE DATABASE {dbname}')
+        try:
+            with tempfile.NamedTemporaryFile() as f:
+                self.run_cli('-d', dbname, 'dump', f.name)
+
+                await self.con.execute(f'CREATE DATABASE {restored_dbname}')
+                try:
+                    self.run_cli('-d', restored_dbname, 'restore', f.name)
+                finally:
+                    await self.con.execute(
+                        f'DROP DATABASE {restored_dbname}')
+        finally:
+            await self.con.execute(f'DROP DATABASE {dbname}')
+
+    PARALLEL_SCHEMA = '''
+        CREATE SCALAR TYPE test::Color EXTENDING enum<Red, Green, Blue>;
+        CREATE TYPE test::Item {
+            CREATE REQUIRED PROPERTY name -> str {
+                CREATE CONSTRAINT exclusive;
+            };
+            CREATE PROPERTY colors -> array<test::Color>;
+        };
+        CREATE TYPE test::Box {
+            CREATE MULTI LINK items -> test::Item;
+        };
+    '''
+
+    async def _create_parallel_db(self, dbname):
+        await self.con.execute(f'CREATE DATABASE {dbname}')
+        con = await self.connect(database=dbname)
+        try:
+            await con.execute(self.PARALLEL_SCHEMA)
+            await con.query('''
+                FOR name IN {array_unpack(<array<str>>$names)} UNION (
+                    INSERT test::Item {
+                        name := name,
+                        colors := [test::Color.Red, test::Color.Blue],
+                    }
+                )
+            ''', names=[str(i) for i in range(1000)])
+            await con.execute('''
+                INSERT test::Box {
+                    items := (SELECT test::Item FILTER .name IN {'1', '2'})
+                };
+            ''')
+        finally:
+            await con.aclose()
+
+    async def _dump_raw(self, dbname):
+        con = await tproto.new_connection(
+            **self.get_connect_args(database=dbname))
+        try:
+            await con.connect()
+            await con.send(protocol.Dump(headers=[]), protocol.Sync())
+            header = None
+            blocks = []
+            while True:
+                msg = await con.recv()
+                if isinstance(msg, protocol.DumpHeader):
+                    header = _message_payload(msg)
+                elif isinstance(msg, protocol.DumpBlock):
+                    blocks.append(msg)
+                elif isinstance(msg, protocol.ReadyForCommand):
+                    break
+                elif not isinstance(msg, protocol.CommandComplete):
+                    raise AssertionError(f'unexpected message: {msg!r}')
+        finally:
+            await con.aclose()
+        return header, blocks
+
+    async def _restore_raw(self, dbname, header, blocks, *, jobs):
+        # Returns the number of jobs the restore runs with and the
+        # messages the server replies with once it got all the data.
+        con = await tproto.new_connection(
+            **self.get_connect_args(database=dbname))
+        try:
+            await con.connect()
+            await con.send(protocol.Restore(
+                headers=[], jobs=jobs, header_data=header))
+            ready = await con.recv()
+            if not isinstance(ready, protocol.RestoreReady):
+                raise AssertionError(f'unexpected message: {ready!r}')
+            await con.send(
+                *(
+                    protocol.RestoreBlock(block_data=_message_payload(block))
+                    for block in blocks
+                ),
+                protocol.RestoreEof(),
+                protocol.Sync(),
+            )
+            replies = []
+            while not replies or not isinstance(
+                replies[-1], protocol.ReadyForCommand
+            ):
+                replies.append(await con.recv())
+        finally:
+            await con.aclose()
+        return ready.jobs, replies
+
+    async def test_dump_restore_parallel_01(self):
+        if not self.has_create_database:
+            self.skipTest('create database is not supported by the backend')
+
+        dbname = f'{self.get_database_name()}_par'
+        restored_dbname = f'{dbname}_restored'
+
+        await self._create_parallel_db(dbname)
+        try:
+            header, blocks = await self._dump_raw(dbname)
+        finally:
+            await self.con.execute(f'DROP DATABASE {dbname}')
+
+        await self.con.execute(f'CREATE DATABASE {restored_dbname}')
+        try:
+            jobs, replies = await self._restore_raw(
+                restored_dbname, header, blocks, jobs=4)
+            self.assertGreater(jobs, 1)
+            self.assertIsInstance(replies[0], protocol.CommandComplete)
+            self.assertEqual(replies[0].status, 'RESTORE')
+
+            con = await self.connect(database=restored_dbname)
+            try:
+                self.assertEqual(
+                    await con.query_single('''
+                        SELECT count(test::Item FILTER
+                            .colors = [test::Color.Red, test::Color.Blue])
+                    '''),
+                    1000,
+                )
+                self.assertEqual(
+                    await con.query_single(
+                        'SELECT count(test::Box.items)'),
+                    2,
+                )
+                # The indexes dropped for the load are back.
+                with self.assertRaises(edgedb.ConstraintViolationError):
+                    await con.query("INSERT test::Item { name := '1' }")
+            finally:
+                await con.aclose()
+        finally:
+            await self.con.execute(f'DROP DATABASE {restored_dbname}')
+
+    async def test_dump_restore_parallel_02(self):
+        if not self.has_create_database:
+            self.skipTest('create database is not supported by the backend')
+
+        dbname = f'{self.get_database_name()}_parfail'
+        restored_dbname = f'{dbname}_restored'
+
+        await self._create_parallel_db(dbname)
+        try:
+            header, blocks = await self._dump_raw(dbname)
+        finally:
+            await self.con.execute(f'DROP DATABASE {dbname}')
+
+        # Break the data of the biggest block, so that loading it
+        # fails after the schema is committed.
+        def block_size(block):
+            return max(
+                (
+                    len(h.value) for h in block.headers
+                    if h.code == DUMP_HEADER_BLOCK_DATA
+                ),
+                default=0,
+            )
+
+        broken = max(blocks, key=block_size)
+        broken.headers = [
+            protocol.Header(code=h.code, value=b'x' + h.value[1:])
+            if h.code == DUMP_HEADER_BLOCK_DATA else h
+            for h in broken.headers
+        ]
+
+        await self.con.execute(f'CREATE DATABASE {restored_dbname}')
+        try:
+            jobs, replies = await self._restore_raw(
+                restored_dbname, header, blocks, jobs=4)
+            self.assertGreater(jobs, 1)
+            self.assertIsInstance(replies[0], protocol.ErrorResponse)
+            self.assertIsInstance(replies[-1], protocol.ReadyForCommand)
+
+            # The partially restored database is usable, with its
+            # triggers and indexes recreated.
+            con = await self.connect(database=restored_dbname)
+            try:
+                await con.query("INSERT test::Item { name := 'new' }")
+                with self.assertRaises(edgedb.ConstraintViolationError):
+                    await con.query("INSERT test::Item { name := 'new' }")
+            finally:
+                await con.aclose()
+        finally:
+            await self.con.execute(f'DROP DATABASE {restored_dbname}')
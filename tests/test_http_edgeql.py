@@ -18,6 +18,7 @@
 
 
 import os
+import urllib.error
 
 import edgedb
 
@@ -257,3 +258,40 @@ class TestHttpEdgeQL(tb.EdgeQLTestCase):
                 r'''SELECT <str>$x ?? '-default' ''',
                 variables={'x': None},
             )
+
+    def test_http_edgeql_batch_01(self):
+        for _ in range(3):  # repeat to test prepared pgcon statements
+            self.assertEqual(
+                self.edgeql_batch_query([
+                    ('SELECT 1', None),
+                    ('SELECT <str>$x', {'x': 'a'}),
+                    ('SELECT <str>$x', {'x': 'b'}),
+                    ('SELECT {1, 2} + <int64>$y', {'y': 10}),
+                ]),
+                [[1], ['a'], ['b'], [11, 12]],
+            )
+
+    def test_http_edgeql_batch_02(self):
+        with self.assertRaisesRegex(
+                edgedb.QueryError,
+                r'parameter \$x is required'):
+            self.edgeql_batch_query([
+                ('SELECT 1', None),
+                ('SELECT <str>$x', {'x': None}),
+            ])
+
+        with self.assertRaisesRegex(
+                edgedb.DivisionByZeroError,
+                r'division by zero'):
+            self.edgeql_batch_query([
+                ('SELECT 1', None),
+                ('SELECT 1 // <int64>$x', {'x': 0}),
+                ('SELECT 2', None),
+            ])
+
+    def test_http_edgeql_batch_03(self):
+        with self.assertRaises(urllib.error.HTTPError) as cm:
+            self.edgeql_batch_query([])
+
+        self.assertEqual(cm.exception.code, 400)
+        self.assertIn(b'the batch is empty', cm.exception.read())
@@ -17,8 +17,10 @@
 #
 
 
+import hashlib
 import json
 import os
+import urllib.error
 import uuid
 
 import edgedb
@@ -4009,6 +4011,65 @@ class TestGraphQLFunctional(tb.GraphQLTestCase):
             ]
         })
 
+    def test_graphql_functional_persisted_01(self):
+        query = r"""
+            query($name: String) {
+                User(filter: {name: {eq: $name}}) {
+                    name
+                    age
+                }
+            }
+        """
+        ext = {
+            'persistedQuery': {
+                'version': 1,
+                'sha256Hash': hashlib.sha256(query.encode()).hexdigest(),
+            },
+        }
+
+        for use_http_post in [True, False]:
+            with self.subTest(use_http_post=use_http_post):
+                # The query has to be registered by sending its text once.
+                res = self.graphql_query(
+                    query,
+                    variables={'name': 'Bob'},
+                    extensions=ext,
+                    use_http_post=use_http_post,
+                )
+                self.assertEqual(res, {'User': [{'name': 'Bob', 'age': 21}]})
+
+                for name, age in [('Alice', 27), ('Jane', 25)]:
+                    res = self.graphql_query(
+                        None,
+                        variables={'name': name},
+                        extensions=ext,
+                        use_http_post=use_http_post,
+                    )
+                    self.assertEqual(
+                        res, {'User': [{'name': name, 'age': age}]})
+
+    def test_graphql_functional_persisted_02(self):
+        query = r"""
+            query {
+                User(filter: {name: {eq: "persisted_02"}}) {
+                    name
+                }
+            }
+        """
+        ext = {
+            'persistedQuery': {
+                'version': 1,
+                'sha256Hash': hashlib.sha256(query.encode()).hexdigest(),
+            },
+        }
+
+        with self.assertRaisesRegex(LookupError, 'PersistedQueryNotFound'):
+            self.graphql_query(None, extensions=ext)
+
+        ext['persistedQuery']['sha256Hash'] = '0' * 64
+        with self.assertRaisesRegex(urllib.error.HTTPError, 'Bad Request'):
+            self.graphql_query(query, extensions=ext)
+
 
 class TestGraphQLInit(tb.GraphQLTestCase):
     """Test GraphQL initialization on an empty database."""
@@ -20,7 +20,11 @@
 from __future__ import annotations
 from typing import *
 
+import pickle
 import re
+import unittest.mock
+
+import immutables
 
 from edb import errors
 
@@ -30,17 +34,20 @@ from edb.edgeql import compiler as qlcompiler
 from edb.edgeql import parser as qlparser
 from edb.edgeql import qltypes
 
+from edb.schema import constraints as s_constr
 from edb.schema import ddl as s_ddl
+from edb.schema import expr as s_expr
 from edb.schema import links as s_links
 from edb.schema import name as s_name
 from edb.schema import objtypes as s_objtypes
+from edb.schema import schema as s_schema
+
+from edb.server import defines as edbdef
 
 from edb.testbase import lang as tb
+from edb.tools import schema_delta_bench
 from edb.tools import test
 
-if TYPE_CHECKING:
-    from edb.schema import schema as s_schema
-
 
 class TestSchema(tb.BaseSchemaLoadTest):
     DEFAULT_MODULE = 'test'
@@ -1276,6 +1283,191 @@ class TestSchema(tb.BaseSchemaLoadTest):
         finally:
             type(schema).get_children = orig_get_children
 
+    def test_schema_flat_diff(self):
+        # Like in the server, every schema after a DDL is unpickled
+        # from the compiler output, so no values are shared between
+        # the diffed schemas.
+        schema = pickle.loads(pickle.dumps(
+            self.run_ddl(tb._load_std_schema(), '''
+                CREATE MODULE default;
+                CREATE TYPE default::A;
+                CREATE TYPE default::B EXTENDING A;
+                CREATE TYPE default::D {
+                    CREATE PROPERTY bar -> str {
+                        SET default := 'bar';
+                    };
+                };
+            '''),
+            -1,
+        ))
+        new_schema = pickle.loads(pickle.dumps(
+            self.run_ddl(schema, '''
+                DROP TYPE default::B;
+                ALTER TYPE default::A CREATE PROPERTY foo -> str;
+                CREATE TYPE default::C;
+            '''),
+            -1,
+        ))
+
+        diff = new_schema.get_diff(schema)
+        self.assertEqual(diff.base_generation, schema._generation)
+        self.assertEqual(diff.generation, new_schema._generation)
+        self.assertLess(diff.get_size(), len(schema._id_to_data))
+        self.assertEqual(new_schema.get_diff(new_schema).changes, ())
+
+        # Unchanged objects holding expressions are not in the diff.
+        D = schema.get('default::D', type=s_objtypes.ObjectType)
+        bar = D.getptr(schema, s_name.UnqualName('bar'))
+        max_value = schema.get('std::max_value', type=s_constr.Constraint)
+        self.assertIsNotNone(bar.get_default(schema))
+        self.assertIsNotNone(max_value.get_expr(schema))
+        updates = {attr: upd for attr, upd, _ in diff.changes}
+        self.assertNotIn(bar.id, updates['id_to_data'])
+        self.assertNotIn(max_value.id, updates['id_to_data'])
+
+        # The new schema was derived from the base one by the logged
+        # mutations, so only the objects they changed were compared,
+        # with the same result as comparing all of them.
+        self.assertTrue(diff.base_log)
+        unlogged = pickle.loads(pickle.dumps(new_schema, -1))
+        unlogged._mutation_log = immutables.Map()
+        full_diff = unlogged.get_diff(schema)
+        self.assertFalse(full_diff.base_log)
+        self.assertEqual(
+            {attr: (set(upd), set(dels)) for attr, upd, dels in diff.changes},
+            {
+                attr: (set(upd), set(dels))
+                for attr, upd, dels in full_diff.changes
+            },
+        )
+
+        # Diffs are applied to independently unpickled copies of the
+        # base schema in the compiler workers.
+        base_copy = pickle.loads(pickle.dumps(schema, -1))
+        applied = base_copy.apply_diff(
+            pickle.loads(pickle.dumps(diff, -1)))
+
+        self.assertEqual(applied._generation, new_schema._generation)
+        self.assertIsNone(
+            applied.get('default::B', type=s_objtypes.ObjectType,
+                        default=None))
+        self.assertIsNotNone(
+            applied.get('default::C', type=s_objtypes.ObjectType))
+        A = applied.get('default::A', type=s_objtypes.ObjectType)
+        self.assertIsNotNone(
+            A.maybe_get_ptr(applied, s_name.UnqualName('foo')))
+        self.assertEqual(
+            set(applied._id_to_data.keys()),
+            set(new_schema._id_to_data.keys()),
+        )
+
+        # The copy gets the mutation log too, so that the next diff
+        # from it is found from the log as well.
+        self.assertEqual(applied._mutation_log, new_schema._mutation_log)
+
+        with self.assertRaises(ValueError):
+            applied.apply_diff(diff)
+
+    def test_schema_flat_changed_object_ids(self):
+        # The server compares schemas that were each unpickled from
+        # the compiler output, see dbview.
+        schema = pickle.loads(pickle.dumps(
+            self.run_ddl(tb._load_std_schema(), '''
+                CREATE MODULE default;
+                CREATE TYPE default::A;
+                CREATE TYPE default::B EXTENDING A;
+                CREATE TYPE default::D {
+                    CREATE PROPERTY bar -> str {
+                        SET default := 'bar';
+                    };
+                };
+            '''),
+            -1,
+        ))
+        new_schema = pickle.loads(pickle.dumps(
+            self.run_ddl(schema, '''
+                DROP TYPE default::B;
+                CREATE TYPE default::C;
+            '''),
+            -1,
+        ))
+
+        B = schema.get('default::B', type=s_objtypes.ObjectType)
+        C = new_schema.get('default::C', type=s_objtypes.ObjectType)
+        D = schema.get('default::D', type=s_objtypes.ObjectType)
+        bar = D.getptr(schema, s_name.UnqualName('bar'))
+
+        changed, deleted = new_schema.get_changed_object_ids(schema)
+        self.assertIn(C.id, changed)
+        self.assertNotIn(C.id, deleted)
+        self.assertIn(B.id, deleted)
+        self.assertNotIn(B.id, changed)
+        # Objects holding expressions are only changed if those are.
+        self.assertNotIn(bar.id, changed)
+        self.assertLess(
+            len(changed) + len(deleted),
+            edbdef.SCHEMA_CHANGES_MAX_OBJECTS,
+        )
+
+        self.assertEqual(
+            new_schema.get_changed_object_ids(new_schema),
+            (frozenset(), frozenset()),
+        )
+
+        # The ids are found from the mutation log, without comparing
+        # all the objects, and are the same as if they were.
+        with unittest.mock.patch.object(
+            s_schema, '_diff_maps', side_effect=AssertionError,
+        ):
+            self.assertEqual(
+                new_schema.get_changed_object_ids(schema),
+                (changed, deleted),
+            )
+        unlogged = pickle.loads(pickle.dumps(new_schema, -1))
+        unlogged._mutation_log = immutables.Map()
+        self.assertEqual(
+            unlogged.get_changed_object_ids(schema),
+            (changed, deleted),
+        )
+
+        # The log can't tell what a bulk update changed, but it can
+        # be used for the changes made after it.
+        bulk = new_schema._replace(
+            shortname_to_id=None, globalname_to_id=None)
+        self.assertIsNone(bulk._get_changed_ids_since(new_schema))
+        after_bulk = self.run_ddl(bulk, 'CREATE TYPE default::E;')
+        E = after_bulk.get('default::E', type=s_objtypes.ObjectType)
+        with unittest.mock.patch.object(
+            s_schema, '_diff_maps', side_effect=AssertionError,
+        ):
+            changed, deleted = after_bulk.get_changed_object_ids(bulk)
+        self.assertIn(E.id, changed)
+        self.assertEqual(deleted, frozenset())
+
+    def test_schema_expr_qlast_shared(self):
+        expr = s_expr.Expression(text="'foo' ++ .name")
+        qltree = expr.qlast
+
+        unpickled = pickle.loads(pickle.dumps(expr))
+        self.assertIsNone(unpickled._qlast)
+        # Expressions with the same text are not parsed again.
+        self.assertIs(unpickled.qlast, qltree)
+
+    def test_schema_delta_candidate_pruning(self):
+        old_sdl, new_sdl = schema_delta_bench.generate_sdl(
+            types=40, changed=0.5, seed=1)
+        old_schema = self.load_schema(old_sdl)
+        new_schema = self.load_schema(new_sdl)
+
+        with schema_delta_bench.candidate_pruning(False):
+            expected = schema_delta_bench.get_proposals(
+                old_schema, new_schema)
+        with schema_delta_bench.candidate_pruning(True):
+            proposals = schema_delta_bench.get_proposals(
+                old_schema, new_schema)
+
+        self.assertEqual(proposals, expected)
+
     def test_schema_object_verbosename(self):
         schema = self.load_schema("""
             abstract inheritable annotation attr;
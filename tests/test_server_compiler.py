@@ -25,15 +25,24 @@ import subprocess
 import sys
 import tempfile
 import time
+import unittest.mock
+
+import immutables
 
 from edb import edgeql
+from edb import errors
 from edb.testbase import lang as tb
 from edb.testbase import server as tbs
 from edb.server import args as edbargs
 from edb.server import compiler as edbcompiler
+from edb.server import defines as edbdef
 from edb.server.compiler_pool import amsg
 from edb.server.compiler_pool import pool
+from edb.server.compiler_pool import queue
+from edb.server.compiler_pool import state
+from edb.server.compiler_pool import worker as worker_mod
 from edb.server.dbview import dbview
+from edb.server.protocol import binary
 
 
 class TestServerCompiler(tb.BaseSchemaLoadTest):
@@ -66,6 +75,35 @@ class TestServerCompiler(tb.BaseSchemaLoadTest):
             ''',
         )
 
+    def test_server_compiler_volatile_units(self):
+        compiler = tb.new_compiler()
+
+        def compile(eql, *, single_statement):
+            context = edbcompiler.new_compiler_context(
+                user_schema=self.schema,
+                modaliases={None: 'default'},
+                single_statement=single_statement,
+            )
+            units = compiler._compile(
+                ctx=context, source=edgeql.Source.from_string(eql))
+            self.assertEqual(len(units), 1)
+            return units[0]
+
+        # Volatile units must never have their results cached.
+        unit = compile('SELECT Foo.bar', single_statement=True)
+        self.assertFalse(unit.is_volatile)
+        unit = compile('SELECT random()', single_statement=True)
+        self.assertTrue(unit.is_volatile)
+        unit = compile('SELECT {Foo.bar, <str>random()}',
+                       single_statement=True)
+        self.assertTrue(unit.is_volatile)
+
+        # A script is volatile if any of its queries is.
+        unit = compile('SELECT 1; SELECT Foo.bar', single_statement=False)
+        self.assertFalse(unit.is_volatile)
+        unit = compile('SELECT random(); SELECT 1', single_statement=False)
+        self.assertTrue(unit.is_volatile)
+
 
 class ServerProtocol(amsg.ServerProtocol):
     def __init__(self):
@@ -116,11 +154,50 @@ class TestAmsg(tbs.TestCase):
 
     async def check_pid(self, pid, server):
         conn = server.get_by_pid(pid)
-        resp = await conn.request(pickle.dumps(('not_exist', ())))
-        status, *data = pickle.loads(resp)
+        resp = await conn.request(amsg.dumps(('not_exist', ())))
+        status, *data = amsg.loads(resp)
         self.assertEqual(status, 1)
         self.assertIsInstance(data[0], RuntimeError)
 
+    def test_server_compiler_amsg_stream(self):
+        msgs = [b'', b'a' * 7, b'b' * 9, os.urandom(100_000), b'c']
+        data = b''.join(
+            amsg._uint64_packer(len(msg)) + msg for msg in msgs)
+
+        for chunk_size in (1, 3, 8, 4096, len(data)):
+            stream = amsg.MessageStream()
+            received = []
+            for i in range(0, len(data), chunk_size):
+                received.extend(
+                    bytes(msg)
+                    for msg in stream.feed_data(data[i:i + chunk_size]))
+            self.assertEqual(received, msgs)
+
+        # Long messages can be received right into their buffers.
+        stream = amsg.MessageStream()
+        self.assertIsNone(stream.get_buffer())
+        self.assertEqual(list(stream.feed_data(data[:4096])), msgs[:3])
+        pos = 4096
+        buf = stream.get_buffer()
+        self.assertEqual(len(buf), len(data) - pos - 8 - len(msgs[-1]))
+        buf[:] = data[pos:pos + len(buf)]
+        self.assertEqual(bytes(stream.buffer_updated(len(buf))), msgs[3])
+        self.assertIsNone(stream.get_buffer())
+
+    def test_server_compiler_amsg_dumps(self):
+        blob = os.urandom(amsg._OOB_BUFFER_MIN_SIZE)
+        self.assertIs(type(amsg.out_of_band(b'small')), bytes)
+        obj = ('sync', (amsg.out_of_band(blob), b'small', blob))
+        bufs = amsg.dumps(obj)
+        # Only the marked large byte string is not copied into the pickle.
+        self.assertEqual(len(bufs), 3)
+        self.assertEqual(bufs[2].nbytes, len(blob))
+        self.assertLess(bufs[1].nbytes, 2 * len(blob))
+
+        loaded = amsg.loads(b''.join(bufs))
+        self.assertEqual(loaded, ('sync', (blob, b'small', blob)))
+        self.assertIs(type(loaded[1][0]), bytes)
+
     async def test_server_compiler_pool_restart(self):
         pids = []
         async with self.compiler_pool(2) as (server, proto, proc, sn):
@@ -417,3 +494,494 @@ class TestCompilerPool(tbs.TestCase):
                 ) for _ in range(4)))
             finally:
                 await pool_.stop()
+
+
+class TestSharedPickles(tbs.TestCase):
+
+    async def test_server_compiler_pool_shared_pickles(self):
+        with tempfile.TemporaryDirectory() as td:
+            shared = pool.SharedPickles(td, maxsize=1)
+
+            obj1 = {'a': 1}
+            obj2 = [1, 2, 3]
+            ref1 = await shared.acquire(('db', 1), obj1)
+            self.assertEqual(state.unpickle(ref1), obj1)
+
+            # Pinned entries are never evicted.
+            ref2 = await shared.acquire(('db', 2), obj2)
+            self.assertEqual(len(os.listdir(td)), 2)
+            self.assertEqual(state.unpickle(ref2), obj2)
+
+            # Once released, entries above maxsize are evicted.
+            shared.release(ref1)
+            self.assertEqual(os.listdir(td), [os.path.basename(ref2.path)])
+
+            # The same object is written only once, even by concurrent
+            # calls.
+            refs = await asyncio.gather(
+                shared.acquire(('db', 2), obj2),
+                shared.acquire(('db', 2), obj2),
+            )
+            self.assertEqual(refs, [ref2, ref2])
+            for ref in refs + [ref2]:
+                shared.release(ref)
+            self.assertEqual(os.listdir(td), [os.path.basename(ref2.path)])
+
+            # A key naming another object replaces the entry; the old
+            # file is removed once the calls using it release it.
+            ref2_pinned = await shared.acquire(('db', 2), obj2)
+            obj2_new = [4, 5, 6]
+            ref2_new = await shared.acquire(('db', 2), obj2_new)
+            self.assertNotEqual(ref2_new.path, ref2.path)
+            self.assertEqual(state.unpickle(ref2_new), obj2_new)
+            self.assertEqual(len(os.listdir(td)), 2)
+            shared.release(ref2_pinned)
+            self.assertEqual(
+                os.listdir(td), [os.path.basename(ref2_new.path)])
+            shared.release(ref2_new)
+
+            # A write interrupted by the caller still completes, and
+            # its file is removed once it is evicted.
+            obj3 = {'b': 2}
+            acquire = asyncio.ensure_future(shared.acquire(('db', 3), obj3))
+            await asyncio.sleep(0)
+            acquire.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await acquire
+            ref3 = await shared.acquire(('db', 3), obj3)
+            self.assertEqual(state.unpickle(ref3), obj3)
+            shared.release(ref3)
+
+            shared.clear()
+            await asyncio.sleep(0)
+            self.assertEqual(os.listdir(td), [])
+
+
+class TestWorkerQueue(tbs.TestCase):
+
+    async def test_server_compiler_queue_condition_wait(self):
+        loop = asyncio.get_running_loop()
+        q = queue.WorkerQueue(loop)
+        q.release('a')
+        q.release('b')
+
+        # A matching idle worker is taken right away...
+        self.assertEqual(
+            await q.acquire(condition=lambda w: w == 'b', condition_wait=1),
+            'b')
+        # ... and so is any idle one if none matches.
+        self.assertEqual(
+            await asyncio.wait_for(
+                q.acquire(condition=lambda w: w == 'c', condition_wait=10),
+                1),
+            'a')
+
+        # With every worker busy, wait for a matching one, letting the
+        # others go to the waiters behind.
+        task = loop.create_task(
+            q.acquire(condition=lambda w: w == 'b', condition_wait=10))
+        await asyncio.sleep(0)
+        task2 = loop.create_task(q.acquire())
+        await asyncio.sleep(0)
+        q.release('a')
+        self.assertEqual(await task2, 'a')
+        self.assertFalse(task.done())
+        q.release('b')
+        self.assertEqual(await task, 'b')
+
+        # Don't wait for longer than asked to, and take the workers
+        # passed over...
+        task = loop.create_task(
+            q.acquire(condition=lambda w: w == 'c', condition_wait=0.01))
+        await asyncio.sleep(0)
+        q.release('a')
+        await asyncio.sleep(0)
+        self.assertFalse(task.done())
+        self.assertEqual(await task, 'a')
+
+        # ... or the next released one, ahead of the later waiters.
+        task = loop.create_task(
+            q.acquire(condition=lambda w: w == 'c', condition_wait=0.01))
+        await asyncio.sleep(0.02)
+        task2 = loop.create_task(q.acquire())
+        await asyncio.sleep(0)
+        q.release('b')
+        self.assertEqual(await task, 'b')
+        self.assertFalse(task2.done())
+        q.release('a')
+        self.assertEqual(await task2, 'a')
+
+        self.assertEqual(q.qsize(), 0)
+        self.assertEqual(q.count_waiters(), 0)
+
+        # A cancelled waiter leaves the queue.
+        task = loop.create_task(q.acquire())
+        await asyncio.sleep(0)
+        self.assertEqual(q.count_waiters(), 1)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertEqual(q.count_waiters(), 0)
+
+
+class _WorkerTransport:
+    """Collects the requests sent to a fake compiler worker."""
+
+    def __init__(self):
+        self.requests = []
+
+    def writelines(self, bufs):
+        req_id = amsg._uint64_unpacker(bufs[1])[0]
+        self.requests.append((req_id, amsg.loads(b''.join(bufs[2:]))))
+
+    def abort(self):
+        pass
+
+
+class TestCompileBatch(tbs.TestCase):
+
+    def make_worker(self):
+        loop = asyncio.get_running_loop()
+        transport = _WorkerTransport()
+        protocol = amsg.HubProtocol(
+            loop=loop, on_pid=None, on_connection_lost=None)
+        protocol.connection_made(transport)
+        worker = pool.Worker(
+            None, immutables.Map(), None, None, None, None, None, None,
+            None, 1)
+        worker._con = amsg.HubConnection(transport, protocol, loop, 0)
+        return worker, transport, protocol
+
+    def make_pool(self, td):
+        pool_ = pool.FixedPool(
+            loop=asyncio.get_running_loop(),
+            runstate_dir=td,
+            dbindex=None,
+            backend_runtime_params=None,
+            std_schema=None,
+            refl_schema=None,
+            schema_class_layout=None,
+            pool_size=1,
+            shared_schemas=False,
+        )
+        pool_._compute_compile_preargs = unittest.mock.AsyncMock(
+            return_value=(('pre',), None))
+        pool_._release_worker = unittest.mock.Mock()
+        return pool_
+
+    def make_batch(self, size):
+        loop = asyncio.get_running_loop()
+        return [
+            (
+                loop.create_future(),
+                ('db', None, None, None, None, None),
+                (f'q{i}',),
+                time.monotonic(),
+            )
+            for i in range(size)
+        ]
+
+    def reply(self, protocol, req_id, data):
+        protocol.process_message(b''.join([
+            amsg._uint64_packer(req_id),
+            *worker_mod._pickle_result(data),
+        ]))
+
+    def run_batch(self, protocol, req_id, calls, results):
+        # Run the batch the way the worker process does, with *results*
+        # as the results of the individual calls.
+        with unittest.mock.patch.object(
+            worker_mod, '_call', side_effect=results,
+        ):
+            for data in worker_mod._call_batch(calls):
+                self.reply(protocol, req_id, data)
+
+    async def test_server_compiler_batch_multi_reply(self):
+        worker, transport, protocol = self.make_worker()
+        con = worker._con
+
+        waiters = con.request_multi(amsg.dumps(('m', ())), 3)
+        req_id, msg = transport.requests[-1]
+        self.assertEqual(msg, ('m', ()))
+        with self.assertRaisesRegex(RuntimeError, 'in progress'):
+            con.request_multi(b'', 1)
+
+        # The replies to other requests are ignored, and the ones to
+        # this request resolve the waiters in order.
+        protocol.process_message(amsg._uint64_packer(req_id - 1) + b'x')
+        self.assertFalse(waiters[0].done())
+        protocol.process_message(amsg._uint64_packer(req_id) + b'a')
+        protocol.process_message(amsg._uint64_packer(req_id) + b'b')
+        self.assertEqual(
+            [bytes(waiter.result()) for waiter in waiters[:2]],
+            [b'a', b'b'])
+        self.assertFalse(waiters[2].done())
+
+        # Once the pending waiters are cancelled, the connection can
+        # be used again and the late replies are ignored.
+        waiters[2].cancel()
+        waiter, = con.request_multi(amsg.dumps(('m', ())), 1)
+        protocol.process_message(amsg._uint64_packer(req_id) + b'c')
+        self.assertFalse(waiter.done())
+        req_id, _ = transport.requests[-1]
+        protocol.process_message(amsg._uint64_packer(req_id) + b'd')
+        self.assertEqual(bytes(waiter.result()), b'd')
+
+    async def test_server_compiler_batch_worker(self):
+        calls = [('compile', (i,)) for i in range(4)]
+        sync_error = (1, state.FailedStateSync(), 'tb')
+        with unittest.mock.patch.object(
+            worker_mod, '_call', side_effect=[(0, 'a', {}), sync_error],
+        ) as call:
+            results = list(worker_mod._call_batch(calls))
+
+        # The calls after a failed state sync are not run.
+        self.assertEqual(
+            call.call_args_list,
+            [unittest.mock.call(*c) for c in calls[:2]])
+        self.assertEqual(
+            results, [(0, 'a', {}), sync_error, sync_error, sync_error])
+
+    async def test_server_compiler_batch_compile(self):
+        worker, transport, protocol = self.make_worker()
+        with tempfile.TemporaryDirectory() as td:
+            pool_ = self.make_pool(td)
+
+            worker._dbs = immutables.Map(db=None)
+            batch = self.make_batch(3)
+            task = asyncio.create_task(pool_._compile_batch(worker, batch))
+            await asyncio.sleep(0)
+
+            # The whole batch is sent in one request.
+            self.assertEqual(len(transport.requests), 1)
+            req_id, (methname, calls) = transport.requests[-1]
+            self.assertEqual(methname, '__batch__')
+            self.assertEqual(
+                calls, [('compile', ('pre', f'q{i}')) for i in range(3)])
+
+            self.run_batch(protocol, req_id, calls, [
+                (0, ('u0', 's0'), {}),
+                (0, ('u1', 's1'), {}),
+                (0, ('u2', 's2'), {}),
+            ])
+            await task
+            self.assertEqual(
+                [fut.result() for fut, *_ in batch],
+                [('u0', 's0'), ('u1', 's1'), ('u2', 's2')])
+            self.assertEqual(worker._last_pickled_state, 's2')
+            self.assertEqual(worker._dbs, immutables.Map(db=None))
+            pool_._release_worker.assert_called_once_with(worker)
+
+            # A failed state sync fails the rest of the batch, and
+            # makes the next call sync the worker from scratch.
+            batch = self.make_batch(3)
+            task = asyncio.create_task(pool_._compile_batch(worker, batch))
+            await asyncio.sleep(0)
+            req_id, (_, calls) = transport.requests[-1]
+            self.run_batch(protocol, req_id, calls, [
+                (0, ('u0', 's0'), {}),
+                (1, state.FailedStateSync(), 'tb'),
+            ])
+            await task
+            self.assertEqual(batch[0][0].result(), ('u0', 's0'))
+            for fut, *_ in batch[1:]:
+                with self.assertRaises(state.FailedStateSync):
+                    fut.result()
+            self.assertEqual(worker._dbs, immutables.Map())
+            self.assertEqual(pool_._release_worker.call_count, 2)
+
+    async def test_server_compiler_batch_cancel(self):
+        worker, transport, protocol = self.make_worker()
+        with tempfile.TemporaryDirectory() as td:
+            pool_ = self.make_pool(td)
+
+            worker._dbs = immutables.Map(db=None)
+            batch = self.make_batch(2)
+            task = asyncio.create_task(pool_._compile_batch(worker, batch))
+            await asyncio.sleep(0)
+            req_id, _ = transport.requests[-1]
+            self.reply(protocol, req_id, (0, ('u0', 's0'), {}))
+            await asyncio.sleep(0)
+
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            self.assertEqual(batch[0][0].result(), ('u0', 's0'))
+            self.assertTrue(batch[1][0].cancelled())
+            self.assertEqual(worker._dbs, immutables.Map())
+            pool_._release_worker.assert_called_once_with(worker)
+
+            # The reply waiters are cancelled, so the worker can take
+            # the next batch, and the late reply is ignored.
+            waiter, = worker.call_batch([('compile', ())])
+            self.reply(protocol, req_id, (0, ('u1', 's1'), {}))
+            self.assertFalse(waiter.done())
+            waiter.cancel()
+
+    async def test_server_compiler_forget_db(self):
+        idle, idle_transport, idle_protocol = self.make_worker()
+        busy, busy_transport, busy_protocol = self.make_worker()
+        busy._pid = 2
+        with tempfile.TemporaryDirectory() as td:
+            pool_ = self.make_pool(td)
+            del pool_._release_worker
+            pool_._workers_queue = queue.WorkerQueue(
+                asyncio.get_running_loop())
+            pool_._workers = {1: idle, 2: busy}
+            for worker in (idle, busy):
+                worker._dbs = immutables.Map(db=None, other=None)
+            pool_._workers_queue.release(idle)
+
+            async def forget(transport, protocol):
+                await asyncio.sleep(0)
+                req_id, msg = transport.requests[-1]
+                self.assertEqual(msg, ('__forget_dbs__', (('db',),)))
+                self.reply(protocol, req_id, (0, None, {}))
+                for _ in range(3):
+                    await asyncio.sleep(0)
+
+            # An idle worker drops the database right away and is
+            # only given out again once it is done...
+            pool_.forget_db('db')
+            self.assertEqual(pool_._workers_queue.qsize(), 0)
+            await forget(idle_transport, idle_protocol)
+            self.assertEqual(idle._dbs, immutables.Map(other=None))
+            self.assertEqual(pool_._workers_queue.qsize(), 1)
+
+            # ...a busy one when it is released.
+            self.assertEqual(busy_transport.requests, [])
+            pool_._release_worker(busy)
+            self.assertEqual(pool_._workers_queue.qsize(), 1)
+            await forget(busy_transport, busy_protocol)
+            self.assertEqual(busy._dbs, immutables.Map(other=None))
+            self.assertEqual(pool_._workers_queue.qsize(), 2)
+
+        dbs = immutables.Map(db=None, other=None)
+        with unittest.mock.patch.object(worker_mod, 'DBS', dbs):
+            worker_mod.__forget_dbs__(('db', 'missing'))
+            self.assertEqual(worker_mod.DBS, immutables.Map(other=None))
+
+
+class _CompilingServer:
+    """A server whose compiler pool compiles when the test tells it to."""
+
+    def __init__(self):
+        self.compiles = []
+
+    def on_binary_client_created(self):
+        return 1
+
+    def get_loop(self):
+        return asyncio.get_running_loop()
+
+    def get_compiler_pool(self):
+        return self
+
+    async def compile(self, dbname, *args):
+        fut = asyncio.get_running_loop().create_future()
+        self.compiles.append(fut)
+        return await fut
+
+
+class TestCompileCoalescing(tbs.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls._std_schema = tb._load_std_schema()
+
+    def setUp(self):
+        super().setUp()
+        self.server = _CompilingServer()
+        self.dbindex = dbview.DatabaseIndex(
+            None,
+            std_schema=self._std_schema,
+            global_schema=None,
+            sys_config={},
+        )
+        self.dbindex.register_db(
+            'db',
+            user_schema=self._std_schema,
+            db_config={},
+            reflection_cache={},
+            backend_ids={},
+        )
+
+    def compile(self, query):
+        # Compile on behalf of a new client connection.
+        edgecon = binary.EdgeConnection(self.server)
+        view = self.dbindex.new_view('db', user='edgedb', query_cache=True)
+        query_req = binary.QueryRequestInfo(
+            edgeql.Source.from_string(query), edbdef.CURRENT_PROTOCOL)
+        return asyncio.create_task(edgecon._compile_coalesced(view, query_req))
+
+    async def settle(self):
+        for _ in range(10):
+            await asyncio.sleep(0)
+
+    async def test_server_compiler_coalesce_01(self):
+        tasks = [self.compile('SELECT 1') for _ in range(3)]
+        other = self.compile('SELECT 2')
+        await self.settle()
+
+        # The identical queries are compiled once.
+        self.assertEqual(len(self.server.compiles), 2)
+        self.server.compiles[0].set_result((['units1'], None))
+        self.server.compiles[1].set_result((['units2'], None))
+        self.assertEqual(
+            await asyncio.gather(*tasks), [(['units1'], None)] * 3)
+        self.assertEqual(await other, (['units2'], None))
+
+        # The finished compilation is not shared anymore.
+        task = self.compile('SELECT 1')
+        await self.settle()
+        self.assertEqual(len(self.server.compiles), 3)
+        self.server.compiles[2].set_result((['units3'], None))
+        self.assertEqual(await task, (['units3'], None))
+
+    async def test_server_compiler_coalesce_02(self):
+        leader, *followers = [self.compile('SELECT 1') for _ in range(3)]
+        await self.settle()
+        self.assertEqual(len(self.server.compiles), 1)
+
+        # The followers of a failed compilation get the error of
+        # their own compilation.
+        self.server.compiles[0].set_exception(errors.QueryError('leader'))
+        with self.assertRaisesRegex(errors.QueryError, 'leader'):
+            await leader
+        await self.settle()
+        self.assertEqual(len(self.server.compiles), 3)
+        for compile in self.server.compiles[1:]:
+            compile.set_exception(errors.QueryError('follower'))
+        for task in followers:
+            with self.assertRaisesRegex(errors.QueryError, 'follower'):
+                await task
+
+        task = self.compile('SELECT 1')
+        await self.settle()
+        self.assertEqual(len(self.server.compiles), 4)
+        self.server.compiles[3].set_result((['units'], None))
+        self.assertEqual(await task, (['units'], None))
+
+    async def test_server_compiler_coalesce_03(self):
+        leader, *followers = [self.compile('SELECT 1') for _ in range(3)]
+        await self.settle()
+        self.assertEqual(len(self.server.compiles), 1)
+
+        # Cancelling the leader doesn't cancel the followers, they
+        # compile the query themselves.
+        leader.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await leader
+        self.assertTrue(self.server.compiles[0].cancelled())
+        await self.settle()
+        self.assertEqual(len(self.server.compiles), 3)
+        for compile in self.server.compiles[1:]:
+            compile.set_result((['units'], None))
+        self.assertEqual(
+            await asyncio.gather(*followers), [(['units'], None)] * 2)
+
+        task = self.compile('SELECT 1')
+        await self.settle()
+        self.assertEqual(len(self.server.compiles), 4)
+        self.server.compiles[3].set_result((['units'], None))
+        self.assertEqual(await task, (['units'], None))
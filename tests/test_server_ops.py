@@ -274,6 +274,96 @@ class TestServerOps(tb.TestCase):
                 finally:
                     await con.aclose()
 
+    async def test_server_ops_lazy_db_introspection(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            async with tb.start_edgedb_server(
+                data_dir=temp_dir,
+                default_auth_method=args.ServerAuthMethod.Trust,
+            ) as sd:
+                con = await sd.connect()
+                try:
+                    await con.execute('CREATE DATABASE lazy')
+                finally:
+                    await con.aclose()
+
+                con = await sd.connect(database='lazy')
+                try:
+                    await con.execute("""
+                        CREATE TYPE Foo {
+                            CREATE PROPERTY name -> str;
+                        };
+                        INSERT Foo { name := 'foo' };
+                    """)
+                finally:
+                    await con.aclose()
+
+            async with tb.start_edgedb_server(
+                data_dir=temp_dir,
+                default_auth_method=args.ServerAuthMethod.Trust,
+                env={'EDGEDB_SERVER_LAZY_DB_INTROSPECTION': '1'},
+            ) as sd:
+                # Concurrent first connections share one introspection.
+                cons = await asyncio.gather(*(
+                    sd.connect(database='lazy') for _ in range(3)
+                ))
+                try:
+                    for con in cons:
+                        self.assertEqual(
+                            await con.query('SELECT Foo.name'), ['foo'])
+                finally:
+                    for con in cons:
+                        await con.aclose()
+
+                with self.assertRaises(errors.UnknownDatabaseError):
+                    await sd.connect(database='lazy_missing')
+
+    async def test_server_ops_http_result_cache_volatile(self):
+        async with tb.start_edgedb_server(
+            http_endpoint_security=args.ServerEndpointSecurityMode.Optional,
+            env={'EDGEDB_SERVER_HTTP_RESULT_CACHE_SIZE': str(2 ** 20)},
+        ) as sd:
+            con = await sd.connect()
+            try:
+                await con.execute('CREATE EXTENSION edgeql_http')
+            finally:
+                await con.aclose()
+
+            def query(text):
+                con = http.client.HTTPConnection(sd.host, sd.port)
+                con.connect()
+                try:
+                    con.request(
+                        'POST',
+                        f'http://{sd.host}:{sd.port}/db/edgedb/edgeql',
+                        body=json.dumps({'query': text}).encode(),
+                        headers={'Content-Type': 'application/json'},
+                    )
+                    resp = con.getresponse()
+                    self.assertEqual(resp.status, 200)
+                    return json.loads(resp.read())['data']
+                finally:
+                    con.close()
+
+            def cache_stats():
+                metrics = sd.fetch_metrics()
+                return (
+                    '\nedgedb_server_http_result_cache_hits_total 1.0\n'
+                    in metrics,
+                    '\nedgedb_server_http_result_cache_misses_total 1.0\n'
+                    in metrics,
+                )
+
+            # A read-only query is answered from the cache...
+            self.assertEqual(query('SELECT 1'), [1])
+            self.assertEqual(query('SELECT 1'), [1])
+            self.assertEqual(cache_stats(), (True, True))
+
+            # ...but a volatile one is run every time and does not
+            # even consult the cache.
+            values = {query('SELECT random()')[0] for _ in range(3)}
+            self.assertEqual(len(values), 3)
+            self.assertEqual(cache_stats(), (True, True))
+
     async def test_server_only_bootstraps_once(self):
         with tempfile.TemporaryDirectory() as temp_dir:
             async with tb.start_edgedb_server(
@@ -30,6 +30,11 @@ Alternatively, run with
 
 to get interactive HTML report of all tests aggregated in one HTML
 file in `./tmp/connpool.html`.
+
+For a benchmark that replays recorded or synthetic workloads and
+reports latencies in a machine-readable format, see
+
+  $ edb connpool-bench --help
 """
 
 
@@ -1407,6 +1412,42 @@ class TestServerConnectionPool(unittest.TestCase):
 
         asyncio.run(main())
 
+    def test_connpool_prefer(self):
+        async def test():
+            pool = connpool.Pool(
+                connect=self.make_fake_connect(),
+                disconnect=self.make_fake_disconnect(),
+                max_capacity=5,
+            )
+            conns = [await pool.acquire('A') for _ in range(3)]
+            for conn in conns:
+                pool.release('A', conn)
+
+            # The preferred connection is taken out of the middle
+            # of the stack...
+            conn = await pool.acquire('A', prefer=lambda c: c is conns[0])
+            self.assertIs(conn, conns[0])
+            pool.release('A', conn)
+
+            # ...which otherwise stays ordered,
+            conn = await pool.acquire('A')
+            self.assertIs(conn, conns[0])
+            conn2 = await pool.acquire('A')
+            self.assertIs(conn2, conns[2])
+
+            # and the most recently used connection is returned if
+            # no connection is preferred.
+            conn3 = await pool.acquire('A', prefer=lambda c: False)
+            self.assertIs(conn3, conns[1])
+
+            for c in (conn, conn2, conn3):
+                pool.release('A', c)
+
+        async def main():
+            await asyncio.wait_for(test(), timeout=5)
+
+        asyncio.run(main())
+
     class MockLogger(logging.Logger):
         logs: asyncio.Queue
 
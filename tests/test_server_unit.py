@@ -17,9 +17,22 @@
 #
 
 
+import asyncio
+import pathlib
+import socket
+import tempfile
 import unittest
+import unittest.mock
 
+from edb.schema import schema as s_schema
+from edb.server import connpool
+from edb.server import pgcon
 from edb.server import server
+from edb.server.compiler import dbstate
+from edb.server.dbview import dbview
+from edb.server.protocol import binary
+from edb.server.cache import persistent as cache_persistent
+from edb.server.cache import results as cache_results
 
 
 class TestServerUnittests(unittest.TestCase):
@@ -89,3 +102,255 @@ class TestServerUnittests(unittest.TestCase):
                 (set(new_hosts), set(rej_hosts)),
                 (set(expected[0]), set(expected[1]))
             )
+
+    def test_server_unittest_persistent_query_cache(self):
+        with tempfile.TemporaryDirectory() as td:
+            qcache = cache_persistent.PersistentQueryCache(
+                pathlib.Path(td), maxsize=2)
+
+            self.assertEqual(qcache.load('db', b'fp1'), {})
+
+            qcache.save('db', b'fp1', [('a', 1), ('b', 2), ('c', 3)])
+            qcache.save('other/db', b'fp1', [('a', 10)])
+
+            # Only the most recently used entries are kept.
+            self.assertEqual(qcache.load('db', b'fp1'), {'b': 2, 'c': 3})
+            self.assertEqual(qcache.load('other/db', b'fp1'), {'a': 10})
+
+            # Entries compiled against a different schema are ignored.
+            self.assertEqual(qcache.load('db', b'fp2'), {})
+
+            qcache.drop('db')
+            qcache.drop('db')
+            self.assertEqual(qcache.load('db', b'fp1'), {})
+            self.assertEqual(qcache.load('other/db', b'fp1'), {'a': 10})
+
+    def test_server_unittest_lazy_db_introspection(self):
+        async def test(td):
+            srv = server.Server.__new__(server.Server)
+            srv._Server__loop = asyncio.get_running_loop()
+            srv._db_introspections = {}
+            srv._evicted_db_cache_saves = {}
+            srv._compiler_pool = unittest.mock.Mock()
+            srv._persistent_query_cache = (
+                cache_persistent.PersistentQueryCache(pathlib.Path(td)))
+            srv._persistent_query_cache.ensure_dir()
+            srv._dbindex = dbview.DatabaseIndex(
+                srv,
+                std_schema=s_schema.FlatSchema(),
+                global_schema=s_schema.FlatSchema(),
+                sys_config={},
+            )
+            srv._dbindex.register_db_stub('db')
+
+            introspections = []
+            gate = asyncio.Event()
+
+            async def introspect_db(dbname):
+                introspections.append(dbname)
+                await gate.wait()
+                srv._dbindex.register_db(
+                    dbname,
+                    user_schema=s_schema.FlatSchema(),
+                    db_config={},
+                    reflection_cache={},
+                    backend_ids={},
+                )
+
+            srv.introspect_db = introspect_db
+
+            # Concurrent first uses share one introspection, and
+            # a cancelled one doesn't cancel it for the others.
+            tasks = [
+                asyncio.create_task(srv.ensure_db_introspected('db'))
+                for _ in range(3)
+            ]
+            await asyncio.sleep(0.01)
+            self.assertEqual(introspections, ['db'])
+            tasks[0].cancel()
+            await asyncio.sleep(0.01)
+            gate.set()
+            await asyncio.gather(*tasks[1:])
+            self.assertTrue(tasks[0].cancelled())
+            self.assertEqual(introspections, ['db'])
+            self.assertFalse(srv._dbindex.has_db_stub('db'))
+            self.assertEqual(srv._db_introspections, {})
+
+            # Introspected and unknown databases are left alone.
+            await srv.ensure_db_introspected('db')
+            await srv.ensure_db_introspected('missing')
+            self.assertEqual(introspections, ['db'])
+
+            # An idle database is turned back into a stub...
+            unit = dbstate.QueryUnit(sql=(b'SELECT 1',), status=b'SELECT')
+            srv._dbindex.get_db('db').set_persisted_queries([('q', unit)])
+            self.assertEqual(srv._dbindex.evict_idle_dbs(60), [])
+            self.assertEqual(srv._dbindex.evict_idle_dbs(0), ['db'])
+            self.assertTrue(srv._dbindex.has_db_stub('db'))
+            srv._compiler_pool.forget_db.assert_called_once_with('db')
+
+            # ...and its compiled queries are back once it is used again.
+            await srv.ensure_db_introspected('db')
+            self.assertEqual(introspections, ['db', 'db'])
+            self.assertEqual(srv._evicted_db_cache_saves, {})
+            self.assertEqual(
+                srv._dbindex.get_db('db').get_persisted_queries(),
+                [('q', unit)])
+
+        with tempfile.TemporaryDirectory() as td:
+            asyncio.run(asyncio.wait_for(test(td), timeout=10))
+
+    def test_server_unittest_acquire_pgcon_prefer(self):
+        class Connection:
+            def __init__(self):
+                self.prepared = {}
+                self.healthy = True
+
+            def has_prepared(self, stmt_name, dbver):
+                return self.prepared.get(stmt_name) == dbver
+
+            def is_healthy(self):
+                return self.healthy
+
+        async def connect(dbname):
+            return Connection()
+
+        async def disconnect(conn):
+            pass
+
+        async def test():
+            srv = server.Server.__new__(server.Server)
+            srv._pg_unavailable_msg = None
+            srv._pg_pool = connpool.Pool(
+                connect=connect,
+                disconnect=disconnect,
+                max_capacity=5,
+            )
+
+            conns = [await srv.acquire_pgcon('db') for _ in range(3)]
+            conns[0].prepared[b's'] = 1
+            conns[1].prepared[b's'] = 2
+            for conn in conns:
+                srv.release_pgcon('db', conn)
+
+            # A connection that has the statement prepared for the
+            # right schema version is preferred.
+            conn = await srv.acquire_pgcon('db', stmt_name=b's', dbver=1)
+            self.assertIs(conn, conns[0])
+            srv.release_pgcon('db', conn)
+            conn = await srv.acquire_pgcon('db', stmt_name=b's', dbver=2)
+            self.assertIs(conn, conns[1])
+            srv.release_pgcon('db', conn)
+
+            # Otherwise, any connection will do.
+            conn = await srv.acquire_pgcon('db', stmt_name=b's', dbver=3)
+            self.assertIn(conn, conns)
+            srv.release_pgcon('db', conn)
+
+            # An unhealthy preferred connection is discarded in favor
+            # of a healthy one.
+            conns[0].healthy = False
+            conn = await srv.acquire_pgcon('db', stmt_name=b's', dbver=1)
+            self.assertIsNot(conn, conns[0])
+            self.assertTrue(conn.is_healthy())
+            srv.release_pgcon('db', conn)
+
+        asyncio.run(asyncio.wait_for(test(), timeout=5))
+
+    def test_server_unittest_backend_backpressure(self):
+        class Server:
+            _accepting_connections = True
+            _accept_new_tasks = True
+
+            def on_binary_client_created(self):
+                return 1
+
+            def on_binary_client_connected(self, edgecon):
+                pass
+
+            def on_binary_client_disconnected(self, edgecon):
+                pass
+
+            def get_loop(self):
+                return asyncio.get_running_loop()
+
+            def create_task(self, coro, *, interruptable):
+                # Only the transport of the connection is used.
+                coro.close()
+
+        class BackendTransport:
+            reading = True
+
+            def pause_reading(self):
+                self.reading = False
+
+            def resume_reading(self):
+                self.reading = True
+
+        async def test():
+            loop = asyncio.get_running_loop()
+            backend = BackendTransport()
+            backend_con = pgcon.PGConnection('db', loop, None)
+            backend_con.connection_made(backend)
+
+            sock, client_sock = socket.socketpair()
+            edgecon = binary.EdgeConnection(Server())
+            transport, _ = await loop.connect_accepted_socket(
+                lambda: edgecon, sock)
+            transport.set_write_buffer_limits(high=1024)
+            self.assertIsNone(edgecon.get_write_waiter())
+
+            # The client doesn't read the data sent to it, so the
+            # backend connection stops reading the rest of the result...
+            transport.write(b'x' * 1024 * 1024)
+            waiter = edgecon.get_write_waiter()
+            self.assertIsNotNone(waiter)
+            task = loop.create_task(backend_con._wait_for_client(waiter))
+            await asyncio.sleep(0.1)
+            self.assertFalse(task.done())
+            self.assertFalse(backend.reading)
+
+            # ...until the client goes away.
+            client_sock.close()
+            await asyncio.wait_for(task, timeout=5)
+            self.assertTrue(backend.reading)
+            self.assertIsNone(edgecon.get_write_waiter())
+
+        asyncio.run(asyncio.wait_for(test(), timeout=10))
+
+    def test_server_unittest_http_result_cache(self):
+        rcache = cache_results.ResultCache(maxsize=8000, ttl=60)
+
+        self.assertIsNone(rcache.get('db', 'q1'))
+
+        gen = rcache.get_generation('db')
+        rcache.set('db', 'q1', b'1', generation=gen)
+        rcache.set('other', 'q1', b'2', generation=gen)
+        self.assertEqual(rcache.get('db', 'q1'), b'1')
+        self.assertEqual(rcache.get('other', 'q1'), b'2')
+
+        # A data change drops the results of that database only.
+        rcache.invalidate('db')
+        self.assertIsNone(rcache.get('db', 'q1'))
+        self.assertEqual(rcache.get('other', 'q1'), b'2')
+
+        # A result that raced with a data change is not cached.
+        rcache.set('db', 'q1', b'1', generation=gen)
+        self.assertIsNone(rcache.get('db', 'q1'))
+
+        # Results that are too big are not cached at all...
+        gen = rcache.get_generation('db')
+        rcache.set('db', 'big', b'x' * 1000, generation=gen)
+        self.assertIsNone(rcache.get('db', 'big'))
+
+        # ...and the least recently used ones are evicted.
+        for i in range(40):
+            rcache.set('db', f'q{i}', b'x' * 500, generation=gen)
+            self.assertLessEqual(rcache.get_size(), 8000)
+        self.assertIsNone(rcache.get('db', 'q0'))
+        self.assertEqual(rcache.get('db', 'q39'), b'x' * 500)
+
+        rcache = cache_results.ResultCache(maxsize=8000, ttl=-1)
+        rcache.set('db', 'q1', b'1', generation=0)
+        self.assertIsNone(rcache.get('db', 'q1'))
+        self.assertEqual(len(rcache), 0)